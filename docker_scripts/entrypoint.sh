@@ -34,12 +34,21 @@ else
   # Build static files directory, starting fresh each time - do we really need this?
   python manage.py collectstatic --no-input
 
-  # Start the Gunicorn web server
+  # Start with empty metrics, since /metrics adds up files from all worker processes.
+  rm -rf "${DJANGO_METRICS_DIR:-/tmp/link-shortener-metrics}"
+
+  # Start the Gunicorn web server; gunicorn.conf.py preloads and warms up the application before forking workers.
   # Gunicorn cmd line flags:
   # -w number of gunicorn worker processes
   # -b IPADDR:PORT binding
   # -t timeout in seconds.
   # --access-logfile where to send HTTP access logs (- is stdout)
   export GUNICORN_CMD_ARGS="-w 3 -b 0.0.0.0:8000 -t 10 --access-logfile -"
-  gunicorn project.wsgi:application
+  if [ "$DJANGO_SERVER_MODE" = "asgi" ]; then
+    # Each worker runs an event loop, so can have many redirects waiting on the database at once.
+    # -k worker class
+    gunicorn -k uvicorn_worker.UvicornWorker project.asgi:application
+  else
+    gunicorn project.wsgi:application
+  fi
 fi
@@ -0,0 +1,34 @@
+# Gunicorn loads this file automatically when started from this directory.
+# Command-line settings are in GUNICORN_CMD_ARGS, set in docker_scripts/entrypoint.sh.
+import gc
+import os
+
+# Load the application, including its warm-up (see shortlinks/startup.py), once
+# in the master process before forking workers: workers start with link data
+# loaded, sharing its memory copy-on-write, and gunicorn only starts listening
+# once loading has finished.  Code changes then need a restart, not a HUP.
+preload_app = os.getenv("DJANGO_PRELOAD_APP", "true") not in ["false", "False"]
+
+
+def pre_fork(server, worker):
+    """Exclude everything loaded so far from garbage collection, so collections
+    in the worker do not write to (and so copy) pages shared with the master.
+    """
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    """Write any queued usage statistics before the worker process exits."""
+    from shortlinks.usage_writer import usage_writer
+
+    usage_writer.shutdown()
+
+
+def child_exit(server, worker):
+    """Fold the exited worker's metrics into the totals for exited workers,
+    so its file and gauges do not outlive it.  Runs in the master process.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    from shortlinks.metrics import metrics
+
+    metrics.remove_process(worker.pid)
@@ -8,9 +8,32 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
+import time
 
+# When this module began loading, for startup timings.
+started = time.monotonic()
+
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_asgi_application()
+
+# Serve short link redirects without going through Django's middleware.
+if settings.FAST_REDIRECTS:
+    from shortlinks.fast_redirect import AsyncFastRedirectApplication
+
+    application = AsyncFastRedirectApplication(application)
+
+# Look up short links in a memory-mapped snapshot shared by all workers.
+if settings.LINK_SNAPSHOT_ENABLED:
+    from shortlinks.snapshot import snapshot_manager
+
+    snapshot_manager.start()
+
+# Check the database and load link data before serving any requests.
+if settings.STARTUP_WARM_UP:
+    from shortlinks.startup import prepare_application
+
+    prepare_application(started)
@@ -42,6 +42,160 @@ CSRF_TRUSTED_ORIGINS = list(os.getenv("DJANGO_CSRF_TRUSTED_ORIGINS").split(","))
 # e.g., http://127.0.0.1:8000 or https://go.library.ucla.edu
 LINK_PREFIX = os.getenv("DJANGO_LINK_PREFIX")
 
+# In-process cache of short path lookups used by redirects.
+# Maximum number of short paths cached per process, and seconds before an entry
+# expires (which bounds how long other processes can serve a changed link).
+LINK_CACHE_SIZE = int(os.getenv("DJANGO_LINK_CACHE_SIZE", 10000))
+LINK_CACHE_TTL = int(os.getenv("DJANGO_LINK_CACHE_TTL", 60))
+
+# Short paths found not to match any link are remembered, so repeated requests
+# (e.g. from scanners) need no query.
+LINK_MISS_CACHE_SIZE = int(os.getenv("DJANGO_LINK_MISS_CACHE_SIZE", 10000))
+LINK_MISS_CACHE_TTL = int(os.getenv("DJANGO_LINK_MISS_CACHE_TTL", 10))
+
+# Redirects look up links in a read-only snapshot of the Link table, memory-mapped
+# and so shared by all processes, unless DJANGO_LINK_SNAPSHOT_ENABLED is "false".
+# Each process checks every CHECK_INTERVAL seconds whether links have changed,
+# and if so the snapshot is rebuilt.  Paths not in the snapshot get a 404, so
+# this bounds how long a new link can be missing in other processes.  The
+# directory must be writable.
+LINK_SNAPSHOT_ENABLED = os.getenv("DJANGO_LINK_SNAPSHOT_ENABLED", "true") not in [
+    "false",
+    "False",
+]
+LINK_SNAPSHOT_PATH = os.getenv(
+    "DJANGO_LINK_SNAPSHOT_PATH", "/tmp/link-shortener/links.snapshot"
+)
+LINK_SNAPSHOT_CHECK_INTERVAL = float(
+    os.getenv("DJANGO_LINK_SNAPSHOT_CHECK_INTERVAL", 1)
+)
+
+# Usage statistics are queued in memory and written in batches by a background
+# thread, unless DJANGO_USAGE_STATS_BUFFERED is "false".
+# A batch is written when it reaches BATCH_SIZE records or is FLUSH_INTERVAL
+# seconds old; records arriving while QUEUE_SIZE records are waiting are dropped.
+USAGE_STATS_BUFFERED = os.getenv("DJANGO_USAGE_STATS_BUFFERED", "true") not in [
+    "false",
+    "False",
+]
+USAGE_STATS_BATCH_SIZE = int(os.getenv("DJANGO_USAGE_STATS_BATCH_SIZE", 500))
+USAGE_STATS_FLUSH_INTERVAL = float(os.getenv("DJANGO_USAGE_STATS_FLUSH_INTERVAL", 2))
+USAGE_STATS_QUEUE_SIZE = int(os.getenv("DJANGO_USAGE_STATS_QUEUE_SIZE", 10000))
+
+# Repeated uses of a link by the same client (IP address and user agent) within
+# USAGE_DEDUP_WINDOW seconds of the first are written as one usage statistic,
+# counting them all; so are uses of a link with a usage sample rate of N (by
+# anyone), up to N per row.  0 writes a row per use.  Only applies when
+# usage statistics are buffered.
+USAGE_DEDUP_WINDOW = float(os.getenv("DJANGO_USAGE_DEDUP_WINDOW", 30))
+
+# Referrer and user agent strings are stored once each, in dimension tables; each
+# process caches the ids of up to DIMENSION_CACHE_SIZE of each.  New user agents
+# are classified (bot or not, browser) unless USAGE_CLASSIFY_USER_AGENTS is "false".
+USAGE_DIMENSION_CACHE_SIZE = int(os.getenv("DJANGO_USAGE_DIMENSION_CACHE_SIZE", 10000))
+USAGE_CLASSIFY_USER_AGENTS = os.getenv(
+    "DJANGO_USAGE_CLASSIFY_USER_AGENTS", "true"
+) not in ["false", "False"]
+
+# Daily usage rollups, maintained by the rollup_usage management command.  Only
+# usage statistics more than USAGE_ROLLUP_LAG seconds old are summarized, so
+# batches still being written by other processes are not skipped; it must
+# exceed USAGE_DEDUP_WINDOW + USAGE_STATS_FLUSH_INTERVAL.
+USAGE_ROLLUP_BATCH_SIZE = int(os.getenv("DJANGO_USAGE_ROLLUP_BATCH_SIZE", 50000))
+USAGE_ROLLUP_LAG = float(
+    os.getenv(
+        "DJANGO_USAGE_ROLLUP_LAG",
+        USAGE_DEDUP_WINDOW + USAGE_STATS_FLUSH_INTERVAL + 60,
+    )
+)
+USAGE_ROLLUP_TOP_REFERRERS = 5
+
+# Usage statistics older than this many days are archived and deleted
+# by the purge_usage_stats management command.
+USAGE_RETENTION_DAYS = int(os.getenv("DJANGO_USAGE_RETENTION_DAYS", 730))
+USAGE_ARCHIVE_DIR = os.getenv("DJANGO_USAGE_ARCHIVE_DIR", "./archive")
+
+# Deleted links stop redirecting at once; their usage statistics are then removed
+# in the background (see shortlinks/link_deletion.py), BATCH_SIZE rows per
+# transaction, pausing BATCH_PAUSE seconds between batches so redirects can
+# write theirs.  The link itself is removed GRACE seconds after deletion, once
+# any usage statistics queued for it have been written: a use can be served from
+# a cached link up to LINK_CACHE_TTL (or the snapshot CHECK_INTERVAL) seconds
+# after deletion, then held for USAGE_DEDUP_WINDOW and FLUSH_INTERVAL seconds,
+# so GRACE is never less than their sum plus a margin.
+LINK_DELETION_BATCH_SIZE = int(os.getenv("DJANGO_LINK_DELETION_BATCH_SIZE", 5000))
+LINK_DELETION_BATCH_PAUSE = float(os.getenv("DJANGO_LINK_DELETION_BATCH_PAUSE", 0.1))
+LINK_DELETION_GRACE = max(
+    float(os.getenv("DJANGO_LINK_DELETION_GRACE", 0)),
+    max(LINK_CACHE_TTL, LINK_SNAPSHOT_CHECK_INTERVAL)
+    + USAGE_DEDUP_WINDOW
+    + USAGE_STATS_FLUSH_INTERVAL
+    + 30,
+)
+
+# Checks of link target URLs by the check_targets management command:
+# concurrent connections in total, seconds to wait for a response,
+# and requests per second and connections per target host.
+TARGET_CHECK_WORKERS = int(os.getenv("DJANGO_TARGET_CHECK_WORKERS", 32))
+TARGET_CHECK_TIMEOUT = float(os.getenv("DJANGO_TARGET_CHECK_TIMEOUT", 10))
+TARGET_CHECK_HOST_RATE = float(os.getenv("DJANGO_TARGET_CHECK_HOST_RATE", 10))
+TARGET_CHECK_HOST_CONNECTIONS = int(
+    os.getenv("DJANGO_TARGET_CHECK_HOST_CONNECTIONS", 4)
+)
+
+# Warm up link lookup data when the application is loaded, before serving
+# requests; see shortlinks/startup.py and gunicorn.conf.py.
+STARTUP_WARM_UP = os.getenv("DJANGO_STARTUP_WARM_UP", "true") not in ["false", "False"]
+
+# "wsgi" (default) to run under gunicorn's sync workers, or "asgi" to run
+# project.asgi under uvicorn workers; see docker_scripts/entrypoint.sh.
+SERVER_MODE = os.getenv("DJANGO_SERVER_MODE", "wsgi")
+
+# Short link redirects are served by shortlinks.fast_redirect, bypassing Django's
+# middleware, unless DJANGO_FAST_REDIRECTS is "false".  Requests whose first path
+# segment is listed here (or is the static files prefix) always go to Django.
+# Keep in sync with project/urls.py and shortlinks/urls.py.
+FAST_REDIRECTS = os.getenv("DJANGO_FAST_REDIRECTS", "true") not in ["false", "False"]
+FAST_REDIRECT_RESERVED_PATHS = [
+    "admin",
+    "accounts",
+    "api",
+    "add_link",
+    "my_links",
+    "all_links",
+    "search_links",
+    "check_short_path",
+    "delete_link",
+    "link_deletions",
+    "show_usage",
+    "export_usage",
+    "logs",
+    "release_notes",
+    "metrics",
+]
+
+# Maximum number of items (links, short paths or link ids) per JSON API request.
+API_MAX_BATCH_SIZE = int(os.getenv("DJANGO_API_MAX_BATCH_SIZE", 1000))
+
+# Each process writes its metrics to a file in this directory at most every
+# METRICS_DUMP_INTERVAL seconds; /metrics adds up all the files.
+# Must be a directory shared by all gunicorn workers, and cleared on startup.
+METRICS_DIR = os.getenv("DJANGO_METRICS_DIR", "/tmp/link-shortener-metrics")
+METRICS_DUMP_INTERVAL = float(os.getenv("DJANGO_METRICS_DUMP_INTERVAL", 5))
+# /metrics needs no login, so it only answers clients in these networks
+# (comma-separated); others get a 403.  By default, loopback only: add the
+# Prometheus server's network where it scrapes from another host.
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    "DJANGO_METRICS_ALLOWED_NETWORKS", "127.0.0.0/8,::1/128"
+).split(",")
+
+# Default and maximum number of rows per page for link and usage lists.
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows read from the database at a time when streaming exports.
+EXPORT_CHUNK_SIZE = 2000
+
 # Application definition
 INSTALLED_APPS = [
     # Enable whitenoise in development per http://whitenoise.evans.io/en/stable/django.html
@@ -57,6 +211,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timing includes all other middleware.
+    "shortlinks.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -163,6 +319,18 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGOUT_REDIRECT_URL = "/"
 
 # Logging
+# Log file, read by the show_log view.  Rotated segments are kept beside it,
+# named with the time of rotation, and gzipped.
+LOG_FILE = os.getenv("DJANGO_LOG_FILE", "./logs/application.log")
+# The log is rotated when it reaches this many bytes (0: never) ...
+LOG_MAX_BYTES = int(os.getenv("DJANGO_LOG_MAX_BYTES", 10 * 1024 * 1024))
+# ... or every this many seconds, aligned to local midnight (0: never).
+LOG_ROTATE_INTERVAL = int(os.getenv("DJANGO_LOG_ROTATE_INTERVAL", 24 * 60 * 60))
+# Number of rotated segments kept (0: all).
+LOG_BACKUP_COUNT = int(os.getenv("DJANGO_LOG_BACKUP_COUNT", 14))
+# Format of log entries: "verbose" (text) or "json" (one JSON object per line).
+LOG_FORMAT = os.getenv("DJANGO_LOG_FORMAT", "verbose")
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -172,15 +340,25 @@ LOGGING = {
             # Shortcut for str.format()
             "style": "{",
         },
+        "json": {
+            "()": "shortlinks.log_handlers.JsonFormatter",
+        },
     },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
         },
+        # Formats records in the logging thread, and writes them to the log
+        # file in a background thread of each process, rotating it as needed.
+        # "()" rather than "class", as Python 3.12+ configures QueueHandler
+        # classes specially.
         "file": {
-            "class": "logging.FileHandler",
-            "filename": "./logs/application.log",
-            "formatter": "verbose",
+            "()": "shortlinks.log_handlers.QueuedFileHandler",
+            "filename": LOG_FILE,
+            "max_bytes": LOG_MAX_BYTES,
+            "rotate_interval": LOG_ROTATE_INTERVAL,
+            "backup_count": LOG_BACKUP_COUNT,
+            "formatter": LOG_FORMAT,
         },
     },
     "loggers": {
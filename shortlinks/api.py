@@ -0,0 +1,255 @@
+"""JSON API for integrations, authenticated by ApiToken.
+
+Each endpoint takes a POST with a JSON object body and works on a batch of up
+to API_MAX_BATCH_SIZE items, in a fixed number of queries however many there
+are.  Requests send "Authorization: Bearer <token>"; no cookies are used, so
+the views are exempt from CSRF checks.
+"""
+
+import hashlib
+import json
+import logging
+import secrets
+from collections.abc import Callable
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.contrib.auth.models import AbstractBaseUser  # for type hints
+from django.db.models import Max, Min, Sum
+from django.http import HttpRequest, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
+from shortlinks.link_cache import RESOLVED_LINK_FIELDS, ResolvedLink
+from shortlinks.link_import import create_links
+from shortlinks.models import ApiToken, DailyUsage, Link, RollupState
+from shortlinks.prefix_matcher import prefix_links
+from shortlinks.views_utils import format_short_path, get_short_link
+
+logger = logging.getLogger(__name__)
+
+# ApiToken.last_used is updated when older than this.
+LAST_USED_INTERVAL = timedelta(minutes=1)
+# Largest value of Link.id (a BigAutoField).
+MAX_LINK_ID = 2**63 - 1
+
+
+class ApiError(Exception):
+    """An error returned to the client as JSON, with an HTTP status and
+    any details (added to the response).
+    """
+
+    def __init__(self, message: str, status: int = 400, **details) -> None:
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_api_token(user: AbstractBaseUser, name: str = "") -> str:
+    """Create an ApiToken for user, returning the token itself."""
+    token = secrets.token_urlsafe(32)
+    ApiToken.objects.create(user=user, name=name, token_hash=hash_token(token))
+    return token
+
+
+def get_token_user(request: HttpRequest) -> AbstractBaseUser | None:
+    """Return the active user whose token the request's Authorization header
+    has, or None.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    api_token = (
+        ApiToken.objects.select_related("user")
+        .filter(token_hash=hash_token(token.strip()), user__is_active=True)
+        .first()
+    )
+    if api_token is None:
+        return None
+    now = timezone.now()
+    if api_token.last_used is None or api_token.last_used < now - LAST_USED_INTERVAL:
+        ApiToken.objects.filter(pk=api_token.pk).update(last_used=now)
+    return api_token.user
+
+
+def api_view(view: Callable[[HttpRequest, dict], dict]) -> Callable:
+    """Make an API view from a function taking the request and its JSON body,
+    and returning the response data: requires POST and a valid token, and
+    returns errors as {"error": message}.
+    """
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request: HttpRequest) -> JsonResponse:
+        try:
+            if request.method != "POST":
+                raise ApiError("Use POST", 405)
+            user = get_token_user(request)
+            if user is None:
+                raise ApiError("Missing or invalid API token", 401)
+            request.user = user
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                raise ApiError("Request body is not valid JSON")
+            if not isinstance(data, dict):
+                raise ApiError("Request body must be a JSON object")
+            return JsonResponse(view(request, data))
+        except ApiError as e:
+            response = JsonResponse({"error": str(e), **e.details}, status=e.status)
+            if e.status == 401:
+                response.headers["WWW-Authenticate"] = "Bearer"
+            return response
+
+    return wrapper
+
+
+def get_batch(data: dict, key: str) -> list:
+    """Return the non-empty list data[key], of at most API_MAX_BATCH_SIZE items."""
+    items = data.get(key)
+    if not isinstance(items, list) or not items:
+        raise ApiError(f'"{key}" must be a non-empty list')
+    if len(items) > settings.API_MAX_BATCH_SIZE:
+        raise ApiError(
+            f'"{key}" has more than {settings.API_MAX_BATCH_SIZE} items', 413
+        )
+    return items
+
+
+def link_data(short_path: str, resolved: ResolvedLink) -> dict:
+    return {
+        "id": resolved.link_id,
+        "short_path": short_path,
+        "short_link": get_short_link(short_path),
+        "target_url": resolved.target_url,
+        "redirect_type": resolved.redirect_type,
+        "cache_max_age": resolved.cache_max_age,
+    }
+
+
+@api_view
+def resolve_links(request: HttpRequest, data: dict) -> dict:
+    """Resolve {"short_paths": [...]} as redirects would, in one query:
+    returns {"results": [...]}, in the same order, each the matching link
+    (for a prefix link, with the expanded target URL) or null.  Empty short
+    paths give a 400 response with their "errors", as in add_links.
+    """
+    short_paths = [
+        format_short_path(str(path)) for path in get_batch(data, "short_paths")
+    ]
+    # "/" and "" format to an empty path, which no link can have.
+    empty = [index for index, short_path in enumerate(short_paths) if not short_path]
+    if empty:
+        raise ApiError(
+            f"{len(empty)} of {len(short_paths)} short paths are empty",
+            errors=[{"index": index, "reason": "Empty short path"} for index in empty],
+        )
+    found = {}
+    # Lowest id last, so it wins if short paths are duplicated.
+    rows = (
+        Link.objects.filter(short_path__in=short_paths)
+        .order_by("-id")
+        .values_list("short_path", *RESOLVED_LINK_FIELDS)
+    )
+    for short_path, *fields in rows:
+        found[short_path] = ResolvedLink(*fields)
+    # Prefix links are matched in memory.
+    matcher = prefix_links.get() if len(found) < len(set(short_paths)) else None
+    results = []
+    for short_path in short_paths:
+        resolved = found.get(short_path)
+        if resolved is None and matcher is not None:
+            resolved = matcher.resolve(short_path)
+        results.append(None if resolved is None else link_data(short_path, resolved))
+    return {"results": results}
+
+
+@api_view
+def add_links(request: HttpRequest, data: dict) -> dict:
+    """Create {"links": [{"short_path": ..., "target_url": ...}, ...]}, with
+    optional fields as in import_links, in one transaction: all of them, or
+    none if any is invalid or its short path is taken.  With
+    "validate_only": true, only check them.
+    Returns {"created": [...]} (or {"valid": n}), or a 400 response with
+    {"errors": [{"index": i, "reason": ...}, ...]}.
+    """
+    rows = [
+        (index, row if isinstance(row, dict) else {"_error": "Not a JSON object"})
+        for index, row in enumerate(get_batch(data, "links"))
+    ]
+    validate_only = bool(data.get("validate_only"))
+    links, rejected = create_links(rows, request.user, dry_run=validate_only)
+    if rejected:
+        raise ApiError(
+            f"{len(rejected)} of {len(rows)} links are invalid",
+            errors=[{"index": r.line_number, "reason": r.reason} for r in rejected],
+        )
+    if validate_only:
+        return {"valid": len(links)}
+    return {
+        "created": [
+            {
+                "id": link.id,
+                "short_path": link.short_path,
+                "short_link": get_short_link(link.short_path),
+            }
+            for link in links
+        ]
+    }
+
+
+@api_view
+def link_usage(request: HttpRequest, data: dict) -> dict:
+    """Return usage totals for {"link_ids": [...]}, optionally limited to
+    local days from "start" to "end" (YYYY-MM-DD, inclusive), from daily
+    rollups: {"usage": {"<id>": {"hits": n, "first_day": ..., "last_day": ...}
+    or null for unknown links}, "summarized": time of the last rollup}.
+    """
+    link_ids = get_batch(data, "link_ids")
+    # JSON true and false are ints in Python; ids outside the column's range
+    # could not be queried.
+    if not all(
+        isinstance(link_id, int)
+        and not isinstance(link_id, bool)
+        and 1 <= link_id <= MAX_LINK_ID
+        for link_id in link_ids
+    ):
+        raise ApiError('"link_ids" must be integers')
+    days = {}
+    for key in ("start", "end"):
+        if data.get(key) is not None:
+            try:
+                days[key] = parse_date(str(data[key]))
+            except ValueError:
+                days[key] = None
+            if days[key] is None:
+                raise ApiError(f'"{key}" must be a date (YYYY-MM-DD)')
+    known = set(Link.objects.filter(id__in=link_ids).values_list("id", flat=True))
+    daily_usage = DailyUsage.objects.filter(link_id__in=known)
+    if "start" in days:
+        daily_usage = daily_usage.filter(day__gte=days["start"])
+    if "end" in days:
+        daily_usage = daily_usage.filter(day__lte=days["end"])
+    totals = {
+        row["link_id"]: row
+        for row in daily_usage.values("link_id").annotate(
+            hits=Sum("hit_count"), first_day=Min("day"), last_day=Max("day")
+        )
+    }
+    usage = {}
+    for link_id in link_ids:
+        if link_id not in known:
+            usage[str(link_id)] = None
+            continue
+        row = totals.get(link_id, {})
+        usage[str(link_id)] = {
+            "hits": row.get("hits", 0),
+            "first_day": row.get("first_day"),
+            "last_day": row.get("last_day"),
+        }
+    state = RollupState.objects.first()
+    return {"usage": usage, "summarized": state.updated if state else None}
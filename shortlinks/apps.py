@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ShortlinksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shortlinks'
+
+    def ready(self):
+        # Connect signal handlers.
+        from shortlinks import signals  # noqa: F401
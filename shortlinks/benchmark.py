@@ -0,0 +1,367 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from shortlinks.dimensions import create_usage_stats
+from shortlinks.link_cache import ResolvedLink, link_cache, miss_cache
+from shortlinks.models import Link
+from shortlinks.prefix_matcher import PrefixMatcher, prefix_links
+from shortlinks.signals import link_changed
+from shortlinks.snapshot import snapshot_manager
+
+BENCHMARK_USERNAME = "benchmark"
+
+
+@contextmanager
+def throwaway_database() -> Iterator[None]:
+    """Switch the default connection to a new, empty test database,
+    destroyed on exit, so benchmarks never touch the real one.
+    """
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_data(link_count: int, stat_count: int, seed: int = 0) -> list[str]:
+    """Create link_count links (about 1 in 10 with a query string) and
+    stat_count usage stats spread over them, with a skewed distribution.
+    Returns the short paths of the new links.
+    """
+    rng = random.Random(seed)
+    user, _ = get_user_model().objects.get_or_create(username=BENCHMARK_USERNAME)
+    links = []
+    for i in range(link_count):
+        short_path = f"/bench{i}"
+        if i % 10 == 9:
+            short_path += f"?campaign=c{i}&utm_source=bench"
+        links.append(
+            Link(
+                short_path=short_path,
+                target_url=f"https://www.library.ucla.edu/bench/{i}",
+                created_by=user,
+            )
+        )
+    links = Link.objects.bulk_create(links, batch_size=1000)
+    # bulk_create() sends no signals.
+    link_changed(sender=Link)
+    now = timezone.now()
+    # Zipf-weighted choice of link, so a few links get most of the usage.
+    weights = [1 / (rank + 1) for rank in range(len(links))]
+    chosen = rng.choices(links, weights=weights, k=stat_count)
+    for i in range(0, stat_count, 5000):
+        create_usage_stats(
+            [
+                {
+                    "link_id": link.id,
+                    "client_ip": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                    "query_string": "",
+                    "referrer": "",
+                    "user_agent": "benchmark",
+                    "usage_date": now,
+                }
+                for link in chosen[i : i + 5000]
+            ]
+        )
+    return [link.short_path for link in links]
+
+
+def get_wsgi_environ(full_path: str) -> dict:
+    """Return a minimal WSGI environ for a GET of full_path (path + query string)."""
+    path, _, query_string = full_path.partition("?")
+    host = next(
+        (host for host in settings.ALLOWED_HOSTS if host and host != "*"), "localhost"
+    )
+    return {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": host,
+        "HTTP_USER_AGENT": "benchmark",
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": BytesIO(),
+        "wsgi.errors": BytesIO(),
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+
+def wsgi_get(application: Callable, full_path: str) -> int:
+    """Send one GET request through a WSGI application; return the status code."""
+    status = []
+
+    def start_response(status_line, headers, exc_info=None):
+        status.append(int(status_line.split(" ", 1)[0]))
+
+    result = application(get_wsgi_environ(full_path), start_response)
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return status[0]
+
+
+def get_asgi_scope(full_path: str) -> dict:
+    """Return a minimal ASGI HTTP scope for a GET of full_path."""
+    environ = get_wsgi_environ(full_path)
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": environ["PATH_INFO"],
+        "raw_path": environ["PATH_INFO"].encode(),
+        "root_path": "",
+        "query_string": environ["QUERY_STRING"].encode(),
+        "headers": [
+            (b"host", environ["HTTP_HOST"].encode()),
+            (b"user-agent", environ["HTTP_USER_AGENT"].encode()),
+        ],
+        "client": (environ["REMOTE_ADDR"], 12345),
+        "server": (environ["SERVER_NAME"], 80),
+    }
+
+
+async def asgi_get(application: Callable, full_path: str) -> int:
+    """Send one GET request through an ASGI application; return the status code."""
+    status = []
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await application(get_asgi_scope(full_path), receive, send)
+    return status[0]
+
+
+@contextmanager
+def count_queries() -> Iterator[list]:
+    """Count queries run on this thread's default connection.
+    Yields a one-item list holding the running count.
+    """
+    count = [0]
+
+    def counter(execute, sql, params, many, context):
+        count[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        yield count
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(
+        0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+def summarize(
+    latencies: list[float], statuses: Counter, queries: int | None, elapsed: float
+) -> dict:
+    """Summarize one scenario's measurements (latencies in seconds).
+    queries is None if they could not be counted.
+    """
+    latencies = sorted(latencies)
+    request_count = len(latencies)
+    return {
+        "requests": request_count,
+        "requests_per_second": round(request_count / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "queries_per_request": (
+            round(queries / request_count, 3)
+            if request_count and queries is not None
+            else None
+        ),
+        "status_counts": {str(status): count for status, count in statuses.items()},
+    }
+
+
+def clear_lookup_caches() -> None:
+    """Forget every link lookup cached in this process: links, misses and
+    prefix links.
+    """
+    link_cache.clear()
+    miss_cache.clear()
+    prefix_links.clear()
+
+
+@contextmanager
+def without_snapshot() -> Iterator[None]:
+    """Look up links as if the link snapshot were disabled."""
+    started = snapshot_manager.started
+    snapshot_manager.started = False
+    try:
+        yield
+    finally:
+        snapshot_manager.started = started
+
+
+def run_scenario(application: Callable, paths: list[str], cold: bool = False) -> dict:
+    """Request each of paths in turn through a WSGI application and summarize.
+    With cold, each request finds nothing in memory: the link snapshot is not
+    used, and lookup caches are cleared before each request.
+    """
+    link_cache.clear()
+    latencies = []
+    statuses: Counter = Counter()
+    with count_queries() as queries, without_snapshot() if cold else nullcontext():
+        started = time.perf_counter()
+        for path in paths:
+            if cold:
+                clear_lookup_caches()
+            request_start = time.perf_counter()
+            statuses[wsgi_get(application, path)] += 1
+            latencies.append(time.perf_counter() - request_start)
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, queries[0], elapsed)
+
+
+async def arun_scenario(
+    application: Callable, paths: list[str], concurrency: int, cold: bool = False
+) -> dict:
+    """Request each of paths through an ASGI application, with up to
+    concurrency requests in flight at once, and summarize; cold as for
+    run_scenario().  Queries run in other threads, so are not counted.
+    """
+    link_cache.clear()
+    latencies = []
+    statuses: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(path: str) -> None:
+        async with semaphore:
+            if cold:
+                clear_lookup_caches()
+            request_start = time.perf_counter()
+            statuses[await asgi_get(application, path)] += 1
+            latencies.append(time.perf_counter() - request_start)
+
+    with without_snapshot() if cold else nullcontext():
+        started = time.perf_counter()
+        await asyncio.gather(*(get(path) for path in paths))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, None, elapsed)
+
+
+def get_scenarios(short_paths: list[str], request_count: int, seed: int = 0) -> dict:
+    """Return request paths for each benchmark scenario."""
+    rng = random.Random(seed)
+    plain = [path for path in short_paths if "?" not in path]
+    with_query = [path for path in short_paths if "?" in path] or plain
+    return {
+        # The same few popular links, as in real traffic.
+        "hot_link": [plain[i % min(10, len(plain))] for i in range(request_count)],
+        # A different link each time, with nothing in memory (see run_scenario()).
+        "cold_link": [rng.choice(plain) for _ in range(request_count)],
+        "not_found": [f"/missing{i}" for i in range(request_count)],
+        "query_string": [with_query[i % len(with_query)] for i in range(request_count)],
+    }
+
+
+def get_prefix_patterns(pattern_count: int) -> list[tuple[str, ResolvedLink]]:
+    """Return pattern_count prefix links, two to four segments deep."""
+    return [
+        (
+            "/".join(["", f"section{i % 100}", f"guide{i}", "v2", "en"][: i % 3 + 3])
+            + Link.PREFIX_SUFFIX,
+            ResolvedLink(f"https://www.library.ucla.edu/guides/{i}", i),
+        )
+        for i in range(pattern_count)
+    ]
+
+
+def time_lookups(lookup: Callable, short_paths: list[str]) -> dict:
+    """Call lookup on each of short_paths; return latency percentiles
+    in microseconds and how many lookups found something.
+    """
+    latencies = []
+    found = 0
+    for short_path in short_paths:
+        start = time.perf_counter()
+        result = lookup(short_path)
+        latencies.append(time.perf_counter() - start)
+        found += result is not None
+    latencies.sort()
+    return {
+        "lookups": len(short_paths),
+        "found": found,
+        "p50_us": round(percentile(latencies, 50) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 99) * 1e6, 2),
+        "mean_us": round(sum(latencies) / len(latencies) * 1e6, 2),
+    }
+
+
+def benchmark_prefix_matcher(
+    pattern_counts: list[int], lookup_count: int, seed: int = 0
+) -> dict:
+    """Compare prefix link lookups, for each number of patterns, with the
+    exact-match database query redirect_link used before prefix links.
+    Requests are for paths under a prefix (with a query string) or unknown.
+    """
+    rng = random.Random(seed)
+    results = {}
+    for pattern_count in pattern_counts:
+        patterns = get_prefix_patterns(pattern_count)
+        start = time.perf_counter()
+        matcher = PrefixMatcher(patterns)
+        build_ms = round((time.perf_counter() - start) * 1000, 1)
+        short_paths = []
+        for _ in range(lookup_count):
+            short_path, _ = rng.choice(patterns)
+            if rng.random() < 0.8:
+                short_paths.append(
+                    short_path.removesuffix(Link.PREFIX_SUFFIX)
+                    + "/chapter/3?utm_source=benchmark"
+                )
+            else:
+                short_paths.append(f"/unknown{rng.randrange(pattern_count)}/page")
+        results[f"prefix_matcher_{pattern_count}"] = {
+            "patterns": matcher.count,
+            "build_ms": build_ms,
+            **time_lookups(matcher.resolve, short_paths),
+        }
+
+    # The exact-match query, against as many links as the most patterns.
+    short_paths = seed_data(max(pattern_counts), 0, seed)
+    requests = [rng.choice(short_paths) for _ in range(lookup_count)]
+
+    def exact_match(short_path: str) -> tuple | None:
+        return (
+            Link.objects.filter(short_path=short_path)
+            .values_list("target_url", "id")
+            .first()
+        )
+
+    results["exact_match_query"] = {
+        "links": len(short_paths),
+        "database": connection.vendor,
+        **time_lookups(exact_match, requests),
+    }
+    return results
@@ -0,0 +1,249 @@
+"""Synthetic datasets at production scale, for checking how queries and
+indexes behave with many links and usage stats (see the generate_dataset
+management command, and QueryPlanTest).
+"""
+
+import ipaddress
+import itertools
+import logging
+import random
+from collections.abc import Callable, Iterator
+from datetime import timedelta
+from typing import NamedTuple
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from shortlinks.dimensions import referrers, user_agents
+from shortlinks.models import Link, UsageStat
+from shortlinks.signals import link_changed
+
+logger = logging.getLogger(__name__)
+
+# Dataset users are named this, plus a number; their links' short paths start
+# with SHORT_PATH_PREFIX.
+DATASET_USERNAME_PREFIX = "dataset"
+SHORT_PATH_PREFIX = "/ds"
+# Header values used, most common first.
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like "
+    "Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, "
+    "like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 "
+    "Firefox/125.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like "
+    "Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.0.0",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/8.5.0",
+]
+REFERRERS = [
+    "https://www.google.com/",
+    "https://www.library.ucla.edu/",
+    "https://bruinlearn.ucla.edu/",
+    "https://www.bing.com/",
+    "https://t.co/",
+]
+# Share of uses with no Referer header.
+NO_REFERRER_SHARE = 0.4
+# Distinct client addresses, chosen with a Zipf skew, like links.
+CLIENT_IP_COUNT = 50000
+# Columns of the UsageStat rows generated, in order.
+USAGE_STAT_COLUMNS = [
+    "link_id",
+    "client_ip",
+    "query_string",
+    "referrer_ref_id",
+    "user_agent_ref_id",
+    "usage_date",
+    "hit_count",
+]
+
+
+class DatasetCounts(NamedTuple):
+    users: int
+    links: int
+    usage_stats: int
+
+
+def get_cum_weights(count: int, exponent: float = 1.0) -> list[float]:
+    """Return cumulative Zipf weights for count items, for random.choices():
+    item i is chosen in proportion to 1 / (i + 1) ** exponent, so a few items
+    are chosen most of the time.
+    """
+    return list(itertools.accumulate(1 / (i + 1) ** exponent for i in range(count)))
+
+
+def build_links(
+    count: int, user_ids: list[int], days: int, rng: random.Random
+) -> list[Link]:
+    """Return count unsaved Links created over the last days days, oldest
+    first, by users chosen with a skew (a few create most links): mostly plain
+    links, with some query strings, prefix links, permanent redirects and
+    cache lifetimes.
+    """
+    now = timezone.now()
+    ages = sorted((rng.random() * days * 86400 for _ in range(count)), reverse=True)
+    user_weights = get_cum_weights(len(user_ids))
+    links = []
+    for i, age in enumerate(ages):
+        short_path = f"{SHORT_PATH_PREFIX}{i}"
+        target_url = f"https://www.library.ucla.edu/dataset/{i}"
+        kind = rng.random()
+        if kind < 0.1:
+            short_path += f"?campaign=c{i}&utm_source=dataset"
+        elif kind < 0.12:
+            short_path += Link.PREFIX_SUFFIX
+            target_url = f"https://guides.library.ucla.edu/dataset/{i}/"
+        links.append(
+            Link(
+                short_path=short_path,
+                target_url=target_url,
+                create_date=now - timedelta(seconds=age),
+                created_by_id=rng.choices(user_ids, cum_weights=user_weights)[0],
+                redirect_type=301 if rng.random() < 0.1 else 302,
+                cache_max_age=3600 if rng.random() < 0.05 else None,
+            )
+        )
+    return links
+
+
+def generate_usage_rows(
+    count: int,
+    links: list[Link],
+    days: int,
+    rng: random.Random,
+    chunk_size: int = 10000,
+) -> Iterator[tuple]:
+    """Yield count UsageStat rows (see USAGE_STAT_COLUMNS) for saved links,
+    chosen with a Zipf skew (the first most), each at a time after the link
+    was created, more often recently.  Sampled links' rows count several uses.
+    """
+    now = timezone.now()
+    earliest = now - timedelta(days=days)
+    link_weights = get_cum_weights(len(links))
+    client_ips = [
+        str(ipaddress.IPv4Address(0x0A000000 + rng.randrange(1 << 24)))
+        for _ in range(CLIENT_IP_COUNT)
+    ]
+    ip_weights = get_cum_weights(len(client_ips), 0.8)
+    agent_ids = list(user_agents.get_ids(USER_AGENTS).values())
+    agent_weights = get_cum_weights(len(agent_ids), 1.5)
+    referrer_ids = [None] + list(referrers.get_ids(REFERRERS).values())
+    referrer_weights = list(
+        itertools.accumulate(
+            [NO_REFERRER_SHARE]
+            + [(1 - NO_REFERRER_SHARE) / len(REFERRERS)] * len(REFERRERS)
+        )
+    )
+    for start in range(0, count, chunk_size):
+        size = min(chunk_size, count - start)
+        chosen = rng.choices(links, cum_weights=link_weights, k=size)
+        ips = rng.choices(client_ips, cum_weights=ip_weights, k=size)
+        agents = rng.choices(agent_ids, cum_weights=agent_weights, k=size)
+        refs = rng.choices(referrer_ids, cum_weights=referrer_weights, k=size)
+        for link, ip, agent_id, referrer_id in zip(chosen, ips, agents, refs):
+            first = max(link.create_date, earliest)
+            # Squaring skews uses toward now.
+            age = (now - first) * (rng.random() ** 2)
+            yield (
+                link.id,
+                ip,
+                "",
+                referrer_id,
+                agent_id,
+                now - age,
+                link.usage_sample_rate,
+            )
+
+
+def bulk_insert_usage_stats(rows: Iterator[tuple], batch_size: int) -> int:
+    """Insert UsageStat rows (tuples of USAGE_STAT_COLUMNS values), committing
+    every batch_size rows, bypassing the ORM: COPY on PostgreSQL, executemany()
+    elsewhere.  Returns the number inserted.
+    """
+    table = connection.ops.quote_name(UsageStat._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(c) for c in USAGE_STAT_COLUMNS)
+    inserted = 0
+    while batch := list(itertools.islice(rows, batch_size)):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                with cursor.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+                    for row in batch:
+                        copy.write_row(row)
+            else:
+                # Values are adapted as the ORM would (e.g. datetimes for SQLite).
+                date_field = UsageStat._meta.get_field("usage_date")
+                cursor.executemany(
+                    f"INSERT INTO {table} ({columns}) VALUES "
+                    f"({', '.join(['%s'] * len(USAGE_STAT_COLUMNS))})",
+                    [
+                        row[:5]
+                        + (date_field.get_db_prep_value(row[5], connection),)
+                        + row[6:]
+                        for row in batch
+                    ],
+                )
+        inserted += len(batch)
+        logger.debug(f"Inserted {inserted} usage stats")
+    return inserted
+
+
+def analyze_tables() -> None:
+    """Update the query planner's statistics, as after a bulk load."""
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def generate_dataset(
+    link_count: int,
+    stat_count: int,
+    user_count: int = 50,
+    days: int = 365,
+    seed: int = 0,
+    batch_size: int = 10000,
+    progress: Callable[[str], None] | None = None,
+) -> DatasetCounts:
+    """Add a synthetic dataset to the database: user_count users, link_count
+    links (see build_links()) and stat_count usage stats (see
+    generate_usage_rows()) over the last days days, then analyze the tables.
+    The same seed gives the same dataset.  Raises ValueError if a dataset
+    already exists.
+    """
+    if (
+        get_user_model()
+        .objects.filter(username__startswith=DATASET_USERNAME_PREFIX)
+        .exists()
+    ):
+        raise ValueError("A dataset already exists in this database")
+    rng = random.Random(seed)
+    users = get_user_model().objects.bulk_create(
+        get_user_model()(username=f"{DATASET_USERNAME_PREFIX}{i}")
+        for i in range(user_count)
+    )
+    # Some databases don't return ids from bulk_create() of users.
+    user_ids = list(
+        get_user_model()
+        .objects.filter(username__startswith=DATASET_USERNAME_PREFIX)
+        .values_list("id", flat=True)
+    )
+    links = build_links(link_count, user_ids, days, rng)
+    # Most popular first; popularity is unrelated to age.
+    by_popularity = links[:]
+    rng.shuffle(by_popularity)
+    # The busiest links have their usage sampled.
+    for link in by_popularity[: link_count // 1000]:
+        link.usage_sample_rate = 10
+    Link.objects.bulk_create(links, batch_size=batch_size)
+    # bulk_create() sends no signals.
+    link_changed(sender=Link)
+    if progress:
+        progress(f"Created {len(users)} users and {len(links)} links")
+    stats = bulk_insert_usage_stats(
+        generate_usage_rows(stat_count, by_popularity, days, rng), batch_size
+    )
+    if progress:
+        progress(f"Created {stats} usage stats")
+    analyze_tables()
+    return DatasetCounts(len(users), len(links), stats)
@@ -0,0 +1,180 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Model, QuerySet, Value
+from django.db.models.functions import Coalesce
+from shortlinks.models import Referrer, UsageStat, UserAgent
+
+BOT_PATTERN = re.compile(
+    r"bot|crawl|spider|slurp|scan|curl|wget|python-|java/|go-http-client|"
+    r"httpclient|headless|preview|monitor|facebookexternalhit",
+    re.IGNORECASE,
+)
+# First match wins, so more specific browsers come first.
+BROWSER_PATTERNS = [
+    ("Edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("Opera", re.compile(r"OPR/|Opera")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/")),
+    ("Firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("Chrome", re.compile(r"Chrome/|CriOS/")),
+    ("Safari", re.compile(r"Safari/")),
+    ("Internet Explorer", re.compile(r"MSIE |Trident/")),
+]
+
+
+def hash_value(value: str) -> str:
+    """Return the key for a dimension value: SHA-256 of its UTF-8 bytes, as hex."""
+    return hashlib.sha256(value.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def classify_user_agent(user_agent: str) -> tuple[bool, str]:
+    """Return (is_bot, browser name or "") for a User-Agent value."""
+    is_bot = bool(BOT_PATTERN.search(user_agent))
+    browser = next(
+        (name for name, pattern in BROWSER_PATTERNS if pattern.search(user_agent)), ""
+    )
+    return is_bot, browser
+
+
+class DimensionCache:
+    """Bounded, thread-safe LRU cache of dimension value -> id, for one
+    dimension model (with value_hash and value fields).
+
+    Dimension rows are never changed or deleted, so cached ids never go stale.
+    Ids are only cached once the transaction that found or created them
+    commits, so a rolled-back row is never cached.
+    """
+
+    def __init__(self, model: type[Model], max_size: int) -> None:
+        self.model = model
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._ids: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_ids(self, values: Iterable[str]) -> dict[str, int]:
+        """Return the id of each of values, creating rows for new values.
+        Cached values need no query; the rest need one query, or three if
+        any are new.
+        """
+        ids = {}
+        missing = set()
+        with self._lock:
+            for value in values:
+                if value in self._ids:
+                    self._ids.move_to_end(value)
+                    ids[value] = self._ids[value]
+                    self.hits += 1
+                elif value not in missing:
+                    missing.add(value)
+                    self.misses += 1
+        if not missing:
+            return ids
+
+        values_by_hash = {hash_value(value): value for value in missing}
+        found = self._get_existing(values_by_hash)
+        new_hashes = values_by_hash.keys() - found.keys()
+        if new_hashes:
+            # Another process may add the same values meanwhile; keep theirs.
+            self.model.objects.bulk_create(
+                [self.make_row(values_by_hash[h], h) for h in new_hashes],
+                ignore_conflicts=True,
+            )
+            found.update(self._get_existing({h: values_by_hash[h] for h in new_hashes}))
+        for value_hash, row_id in found.items():
+            ids[values_by_hash[value_hash]] = row_id
+        transaction.on_commit(lambda: self._add(found, values_by_hash))
+        return ids
+
+    def make_row(self, value: str, value_hash: str) -> Model:
+        return self.model(value_hash=value_hash, value=value)
+
+    def _get_existing(self, values_by_hash: dict[str, str]) -> dict[str, int]:
+        return dict(
+            self.model.objects.filter(value_hash__in=values_by_hash).values_list(
+                "value_hash", "id"
+            )
+        )
+
+    def _add(self, found: dict[str, int], values_by_hash: dict[str, str]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for value_hash, row_id in found.items():
+                self._ids[values_by_hash[value_hash]] = row_id
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+    def stats(self) -> dict:
+        """Return current size and hit/miss counters."""
+        with self._lock:
+            return {
+                "size": len(self._ids),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class UserAgentCache(DimensionCache):
+    """DimensionCache which classifies new user agents."""
+
+    def make_row(self, value: str, value_hash: str) -> Model:
+        row = super().make_row(value, value_hash)
+        if settings.USAGE_CLASSIFY_USER_AGENTS:
+            row.is_bot, row.browser = classify_user_agent(value)
+        return row
+
+
+referrers = DimensionCache(Referrer, settings.USAGE_DIMENSION_CACHE_SIZE)
+user_agents = UserAgentCache(UserAgent, settings.USAGE_DIMENSION_CACHE_SIZE)
+
+
+def build_usage_stats(records: list[dict]) -> list[UsageStat]:
+    """Return unsaved UsageStats for usage records (UsageStat field values,
+    with "referrer" and "user_agent" strings), with the strings replaced by
+    ids of dimension rows.  Empty strings become nulls.
+    """
+    referrer_ids = referrers.get_ids(
+        {record["referrer"] for record in records if record["referrer"]}
+    )
+    user_agent_ids = user_agents.get_ids(
+        {record["user_agent"] for record in records if record["user_agent"]}
+    )
+    stats = []
+    for record in records:
+        fields = dict(record)
+        referrer = fields.pop("referrer")
+        user_agent = fields.pop("user_agent")
+        stats.append(
+            UsageStat(
+                referrer_ref_id=referrer_ids.get(referrer),
+                user_agent_ref_id=user_agent_ids.get(user_agent),
+                **fields,
+            )
+        )
+    return stats
+
+
+def create_usage_stats(records: list[dict]) -> list[UsageStat]:
+    """Save usage records, as build_usage_stats() describes."""
+    return UsageStat.objects.bulk_create(build_usage_stats(records))
+
+
+def with_dimension_values(usage_stats: QuerySet) -> QuerySet:
+    """Annotate UsageStats with "referrer" and "user_agent" strings
+    ("" if null), for use in values() or values_list().
+    """
+    return usage_stats.annotate(
+        referrer=Coalesce("referrer_ref__value", Value("")),
+        user_agent=Coalesce("user_agent_ref__value", Value("")),
+    )
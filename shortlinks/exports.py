@@ -0,0 +1,126 @@
+import csv
+import json
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from django.utils import timezone
+from shortlinks.dimensions import with_dimension_values
+from shortlinks.models import UsageStat
+
+EXPORT_FORMATS = ["csv", "jsonl"]
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+USAGE_EXPORT_FIELDS = [
+    "id",
+    "link_id",
+    "client_ip",
+    "query_string",
+    "referrer",
+    "user_agent",
+    "usage_date",
+    "hit_count",
+]
+
+
+class Echo:
+    """File-like object whose write() returns what was written,
+    so csv.writer can produce strings one row at a time.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _to_text(value) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return "" if value is None else str(value)
+
+
+def get_row_formatter(
+    field_names: list[str], export_format: str
+) -> tuple[list[str], Callable[[tuple], str]]:
+    """Return the header lines for an export, and a function formatting one row
+    (a tuple of values in field_names order) as a line of CSV or JSON Lines.
+    """
+    if export_format == "csv":
+        writer = csv.writer(Echo())
+
+        def format_csv(row: tuple) -> str:
+            return writer.writerow([_to_text(value) for value in row])
+
+        return [writer.writerow(field_names)], format_csv
+    if export_format == "jsonl":
+
+        def format_jsonl(row: tuple) -> str:
+            return json.dumps(dict(zip(field_names, row)), default=_to_text) + "\n"
+
+        return [], format_jsonl
+    raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def stream_rows(
+    rows: Iterable[tuple], field_names: list[str], export_format: str
+) -> Iterator[str]:
+    """Yield rows (tuples of values in field_names order) as lines of CSV,
+    with a header, or JSON Lines.  Nothing is accumulated, so this can be
+    fed from a queryset iterator() of any size.
+    """
+    header, format_row = get_row_formatter(field_names, export_format)
+    yield from header
+    for row in rows:
+        yield format_row(row)
+
+
+async def aiterate(iterator: Iterator, chunk_size: int) -> AsyncIterator:
+    """Read a synchronous iterator, such as a queryset iterator(), a chunk at a
+    time in a thread (always the same one, as database connections require).
+    """
+    next_chunk = sync_to_async(
+        lambda: list(islice(iterator, chunk_size)), thread_sensitive=True
+    )
+    while chunk := await next_chunk():
+        for item in chunk:
+            yield item
+
+
+async def astream_rows(
+    rows: AsyncIterable[tuple], field_names: list[str], export_format: str
+) -> AsyncIterator[str]:
+    """Async version of stream_rows()."""
+    header, format_row = get_row_formatter(field_names, export_format)
+    for line in header:
+        yield line
+    async for row in rows:
+        yield format_row(row)
+
+
+def get_usage_export_rows(
+    link_id: int | None = None,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> QuerySet:
+    """Return UsageStat rows, as tuples of USAGE_EXPORT_FIELDS, for one link
+    (or all) and (local) days from start_date to end_date inclusive,
+    oldest first.  Use iterator() to read them in chunks.
+    """
+    usage_stats = UsageStat.objects.all()
+    if link_id is not None:
+        usage_stats = usage_stats.filter(link_id=link_id)
+    if start_date is not None:
+        start = timezone.make_aware(datetime.combine(start_date, time.min))
+        usage_stats = usage_stats.filter(usage_date__gte=start)
+    if end_date is not None:
+        end = timezone.make_aware(
+            datetime.combine(end_date + timedelta(days=1), time.min)
+        )
+        usage_stats = usage_stats.filter(usage_date__lt=end)
+    return (
+        with_dimension_values(usage_stats)
+        .order_by("usage_date", "id")
+        .values_list(*USAGE_EXPORT_FIELDS)
+    )
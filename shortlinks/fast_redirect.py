@@ -0,0 +1,275 @@
+import logging
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from http import HTTPStatus
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.handlers.wsgi import get_path_info
+from django.core.signals import request_finished, request_started
+from django.http.request import split_domain_port, validate_host
+from django.utils.encoding import iri_to_uri
+from shortlinks.link_cache import ResolvedLink
+from shortlinks.metrics import metrics
+from shortlinks.startup import startup_timer
+from shortlinks.views_utils import (
+    acapture_usage,
+    aload_short_path,
+    capture_usage,
+    format_short_path,
+    get_cache_control,
+    get_short_link,
+    load_short_path,
+    lookup_in_memory,
+)
+
+logger = logging.getLogger(__name__)
+
+# Same body Django uses for a 404 when there is no 404.html template.
+NOT_FOUND_BODY = (
+    b'<!doctype html><html lang="en"><head><title>Not Found</title></head>'
+    b"<body><h1>Not Found</h1>"
+    b"<p>The requested resource was not found on this server.</p></body></html>"
+)
+
+
+def get_security_headers() -> list[tuple[str, str]]:
+    """Return the headers Django's security and clickjacking middleware would add
+    to a redirect, so fast redirects behave the same in browsers.
+    """
+    headers = []
+    if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+        headers.append(("X-Content-Type-Options", "nosniff"))
+    if settings.SECURE_REFERRER_POLICY:
+        policy = settings.SECURE_REFERRER_POLICY
+        if not isinstance(policy, str):
+            policy = ",".join(policy)
+        headers.append(("Referrer-Policy", policy))
+    if settings.SECURE_CROSS_ORIGIN_OPENER_POLICY:
+        headers.append(
+            ("Cross-Origin-Opener-Policy", settings.SECURE_CROSS_ORIGIN_OPENER_POLICY)
+        )
+    headers.append(("X-Frame-Options", settings.X_FRAME_OPTIONS))
+    return headers
+
+
+class BaseFastRedirect:
+    """Behaviour shared by the WSGI and ASGI fast redirect applications.
+
+    A request is passed to Django if it is not a GET or HEAD, has an invalid
+    Host, or its first path segment is one of FAST_REDIRECT_RESERVED_PATHS
+    (admin, accounts, static files, this application's pages).
+    Metrics middleware does not see fast redirects, so they are counted here.
+    An error before usage is captured hands the request to Django instead;
+    one after it is raised, as Django would record the use again.
+    """
+
+    def __init__(self, django_application: Callable) -> None:
+        self.django_application = django_application
+        self.reserved = set(settings.FAST_REDIRECT_RESERVED_PATHS)
+        self.reserved.add(settings.STATIC_URL.strip("/").split("/")[0])
+        self.security_headers = get_security_headers()
+
+    def is_reserved(self, path: str) -> bool:
+        """Return True if path belongs to a Django view other than redirect_link."""
+        first_segment = path.lstrip("/").split("/", 1)[0]
+        return first_segment == "" or first_segment in self.reserved
+
+    def is_fast_path(self, method: str, path: str, host: str) -> bool:
+        """Return True if this request should be handled without Django."""
+        if method not in ["GET", "HEAD"] or self.is_reserved(path):
+            return False
+        domain, _ = split_domain_port(host)
+        allowed_hosts = settings.ALLOWED_HOSTS
+        if settings.DEBUG and not allowed_hosts:
+            allowed_hosts = [".localhost", "127.0.0.1", "[::1]"]
+        return bool(domain) and validate_host(domain, allowed_hosts)
+
+    def get_short_path(self, path: str, query_string: str) -> str:
+        """Return the short path for a request, as redirect_link builds it."""
+        if query_string != "":
+            path = f"{path}?{query_string}"
+        return format_short_path(path)
+
+    def get_response(
+        self, short_path: str, resolved: ResolvedLink | None
+    ) -> tuple[str | None, list[tuple[str, str]], bytes]:
+        """Return status, headers and body for the result of a short path lookup,
+        as redirect_link would; status is None if Django should respond instead.
+        """
+        if resolved is None:
+            if settings.DEBUG:
+                # Let Django show its detailed 404 page.
+                return None, [], b""
+            metrics.inc("redirects_total", {"outcome": "not_found"})
+            headers = [
+                ("Content-Type", "text/html; charset=utf-8"),
+                ("Content-Length", str(len(NOT_FOUND_BODY))),
+            ]
+            return "404 Not Found", headers + self.security_headers, NOT_FOUND_BODY
+
+        metrics.inc("redirects_total", {"outcome": "found"})
+        headers = [
+            ("Content-Type", "text/html; charset=utf-8"),
+            ("Location", iri_to_uri(resolved.target_url)),
+            ("Content-Length", "0"),
+            # Referer (sic) header with the full URL of the short link.
+            ("Referer", iri_to_uri(get_short_link(short_path))),
+        ]
+        cache_control = get_cache_control(resolved)
+        if cache_control:
+            headers.append(("Cache-Control", cache_control))
+        status = HTTPStatus(resolved.redirect_type)
+        return f"{status.value} {status.phrase}", headers + self.security_headers, b""
+
+    def record_metrics(self, status: str, elapsed: float) -> None:
+        startup_timer.record_first_redirect(elapsed)
+        metrics.observe(
+            "http_request_duration_seconds", elapsed, {"view": "redirect_link"}
+        )
+        metrics.inc(
+            "http_requests_total",
+            {"view": "redirect_link", "status": int(status.split(" ", 1)[0])},
+        )
+        metrics.maybe_dump()
+
+
+class FastRedirectApplication(BaseFastRedirect):
+    """WSGI application which serves short link redirects itself, without
+    Django's URL resolver or middleware, and passes everything else
+    to django_application.
+    """
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        path = get_path_info(environ)
+        host = environ.get("HTTP_HOST") or environ.get("SERVER_NAME", "")
+        method = environ.get("REQUEST_METHOD", "")
+        if not self.is_fast_path(method, path, host):
+            return self.django_application(environ, start_response)
+
+        start = time.perf_counter()
+        short_path = self.get_short_path(path, environ.get("QUERY_STRING", ""))
+        captured = False
+        try:
+            known, resolved = lookup_in_memory(short_path)
+            if known and (resolved is None or settings.USAGE_STATS_BUFFERED):
+                # No database work at all.
+                if resolved is not None:
+                    captured = True
+                    capture_usage(resolved.link_id, environ)
+            else:
+                with self.request_signals(environ):
+                    if resolved is None:
+                        resolved = load_short_path(short_path)
+                    if resolved is not None:
+                        captured = True
+                        capture_usage(resolved.link_id, environ)
+            status, headers, body = self.get_response(short_path, resolved)
+        except Exception:
+            if captured:
+                raise
+            logger.exception(f"Fast redirect failed for {path}, using Django")
+            status = None
+        if status is None:
+            return self.django_application(environ, start_response)
+
+        self.record_metrics(status, time.perf_counter() - start)
+        start_response(status, headers)
+        return [] if method == "HEAD" else [body]
+
+    @contextmanager
+    def request_signals(self, environ: dict) -> Iterator[None]:
+        """Send request_started and request_finished around database work,
+        so Django manages database connections as for any other request.
+        """
+        request_started.send(sender=self.__class__, environ=environ)
+        try:
+            yield
+        finally:
+            request_finished.send(sender=self.__class__)
+
+
+class AsyncFastRedirectApplication(BaseFastRedirect):
+    """ASGI version of FastRedirectApplication.  Known links, and paths known
+    not to exist, are served entirely on the event loop; other lookups await
+    the database, so the event loop keeps serving other requests meanwhile.
+    """
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            return await self.django_application(scope, receive, send)
+        # Header names are lower case in ASGI; values are latin-1, as in Django.
+        headers = {
+            name.decode("latin1"): value.decode("latin1")
+            for name, value in scope.get("headers", [])
+        }
+        path = scope["path"]
+        host = headers.get("host") or (scope.get("server") or [""])[0]
+        method = scope["method"]
+        if not self.is_fast_path(method, path, host):
+            return await self.django_application(scope, receive, send)
+
+        start = time.perf_counter()
+        query_string = scope.get("query_string", b"").decode(errors="replace")
+        short_path = self.get_short_path(path, query_string)
+        meta = {
+            "REMOTE_ADDR": (scope.get("client") or [""])[0],
+            "QUERY_STRING": query_string,
+            "HTTP_REFERER": headers.get("referer", ""),
+            "HTTP_USER_AGENT": headers.get("user-agent", ""),
+        }
+        captured = False
+        try:
+            known, resolved = lookup_in_memory(short_path)
+            if known and (resolved is None or settings.USAGE_STATS_BUFFERED):
+                # Known link with queued usage, or known not to exist:
+                # no database work at all.
+                if resolved is not None:
+                    captured = True
+                    await acapture_usage(resolved.link_id, meta)
+            else:
+                async with self.request_signals(scope):
+                    if resolved is None:
+                        resolved = await aload_short_path(short_path)
+                    if resolved is not None:
+                        captured = True
+                        await acapture_usage(resolved.link_id, meta)
+            status, response_headers, body = self.get_response(short_path, resolved)
+        except Exception:
+            if captured:
+                raise
+            logger.exception(f"Fast redirect failed for {path}, using Django")
+            status = None
+        if status is None:
+            return await self.django_application(scope, receive, send)
+
+        self.record_metrics(status, time.perf_counter() - start)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.encode("latin1"), value.encode("latin1"))
+                    for name, value in response_headers
+                ],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"" if method == "HEAD" else body,
+            }
+        )
+
+    @asynccontextmanager
+    async def request_signals(self, scope: dict) -> AsyncIterator[None]:
+        """Send request_started and request_finished around database work.
+        As in Django's ASGI handler, database work for this request runs in
+        its own thread, and connections are managed by request signals.
+        """
+        async with ThreadSensitiveContext():
+            await request_started.asend(sender=self.__class__, scope=scope)
+            try:
+                yield
+            finally:
+                await request_finished.asend(sender=self.__class__)
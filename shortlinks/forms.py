@@ -1,15 +1,53 @@
 from django import forms
 from shortlinks.models import Link
+from shortlinks.prefix_matcher import get_wildcard_error
 
 
 class LinkForm(forms.ModelForm):
+    # Optional, so clients posting only a short path and target URL still work.
+    redirect_type = forms.TypedChoiceField(
+        choices=Link.REDIRECT_TYPES,
+        coerce=int,
+        required=False,
+        empty_value=Link._meta.get_field("redirect_type").default,
+        help_text="Browsers may remember permanent redirects indefinitely;"
+        " only use them for links which will never change.",
+    )
+    usage_sample_rate = forms.IntegerField(
+        min_value=1,
+        max_value=Link.MAX_USAGE_SAMPLE_RATE,
+        required=False,
+        label="Usage sample rate",
+        help_text="For very busy links: record usage details of 1 in this many"
+        " uses (totals still count every use).",
+    )
+
     class Meta:
         model = Link
-        fields = ["short_path", "target_url"]
-        labels = {"target_url": "Target URL"}
+        fields = [
+            "short_path",
+            "target_url",
+            "redirect_type",
+            "cache_max_age",
+            "usage_sample_rate",
+        ]
+        labels = {"target_url": "Target URL", "cache_max_age": "Cache for (seconds)"}
+        help_texts = {
+            "short_path": "End with /* (e.g., /guides/*) to also match longer paths,"
+            " forwarding the rest of the path and any query string.",
+            "cache_max_age": "Let browsers and proxies reuse the redirect for this"
+            " long (0 to forbid).  Cached uses are not counted in usage statistics.",
+        }
         widgets = {
             "short_path": forms.TextInput(attrs={"placeholder": "e.g., /lib"}),
             "target_url": forms.URLInput(
                 attrs={"placeholder": "e.g., https://www.library.ucla.edu"}
             ),
         }
+
+    def clean_short_path(self) -> str:
+        short_path = self.cleaned_data["short_path"]
+        error = get_wildcard_error(short_path)
+        if error:
+            raise forms.ValidationError(error)
+        return short_path
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from django.conf import settings
+
+
+class ResolvedLink(NamedTuple):
+    """The subset of a Link needed to serve a redirect."""
+
+    target_url: str
+    link_id: int
+    redirect_type: int = 302
+    cache_max_age: int | None = None
+
+
+# Link fields to query, in order, for ResolvedLink(*row).
+RESOLVED_LINK_FIELDS = ["target_url", "id", "redirect_type", "cache_max_age"]
+
+
+class LinkCache:
+    """Bounded, thread-safe LRU cache of short path -> ResolvedLink,
+    with a time-to-live on each entry.
+
+    Each process has its own cache.  Changes made in this process invalidate
+    the cache immediately (via signals); changes made in other processes
+    are picked up when entries expire.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, ResolvedLink]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, short_path: str) -> Optional[ResolvedLink]:
+        """Return the cached ResolvedLink for short_path, or None."""
+        with self._lock:
+            entry = self._entries.get(short_path)
+            if entry is not None:
+                expires, resolved = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(short_path)
+                    self.hits += 1
+                    return resolved
+                del self._entries[short_path]
+            self.misses += 1
+            return None
+
+    def set(self, short_path: str, resolved: ResolvedLink) -> None:
+        """Cache resolved for short_path, evicting the least recently used
+        entry if the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[short_path] = (time.monotonic() + self.ttl, resolved)
+            self._entries.move_to_end(short_path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries; hit/miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return current size and hit/miss counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+link_cache = LinkCache(settings.LINK_CACHE_SIZE, settings.LINK_CACHE_TTL)
+# Short paths recently found not to match any link (each cached as True),
+# so repeated requests for them need no database query.
+miss_cache = LinkCache(settings.LINK_MISS_CACHE_SIZE, settings.LINK_MISS_CACHE_TTL)
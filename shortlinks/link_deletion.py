@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from shortlinks.models import Link, LinkDeletion, UsageStat
+
+logger = logging.getLogger(__name__)
+
+# Seconds a process holds a deletion it is working on, renewed each batch.
+# If the process dies, another takes over after this.
+CLAIM_SECONDS = 300
+# Seconds the background thread waits before finishing deletions still in
+# their grace period.
+RETRY_INTERVAL = 10
+
+
+def tombstone_link(link: Link, user) -> LinkDeletion:
+    """Mark link deleted, so it stops redirecting and its short path can be
+    reused at once, and record it for removal by purge_deleted_links().
+    """
+    with transaction.atomic():
+        link.deleted_at = timezone.now()
+        # Clears cached link data in every process (see shortlinks.signals).
+        link.save(update_fields=["deleted_at"])
+        return LinkDeletion.objects.create(
+            link=link,
+            short_path=link.short_path,
+            target_url=link.target_url,
+            requested_by=user,
+            requested=link.deleted_at,
+        )
+
+
+def _claim(deletion: LinkDeletion) -> bool:
+    """Return True if this process may work on deletion: no other process
+    holds it (or its claim has expired).
+    """
+    now = timezone.now()
+    return bool(
+        LinkDeletion.objects.filter(pk=deletion.pk, finished__isnull=True)
+        .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+        .update(claimed_until=now + timedelta(seconds=CLAIM_SECONDS))
+    )
+
+
+def _release(deletion: LinkDeletion) -> None:
+    LinkDeletion.objects.filter(pk=deletion.pk).update(claimed_until=None)
+
+
+def remove_link_data(
+    deletion: LinkDeletion, batch_size: int, pause: float, grace: float
+) -> bool:
+    """Delete the usage stats of a deleted link, batch_size rows per
+    transaction, pausing between batches and recording progress in deletion.
+    Then, once grace seconds have passed since it was deleted, delete the link,
+    with anything still referring to it (daily usage, target check, and stats
+    written since the last batch).
+    deletion must be claimed.  Returns True if finished.
+    """
+    stats = UsageStat.objects.filter(link_id=deletion.link_id)
+    if deletion.stats_total is None:
+        deletion.stats_total = stats.count()
+        LinkDeletion.objects.filter(pk=deletion.pk).update(
+            stats_total=deletion.stats_total
+        )
+    # Walk the (link, usage_date, id) index, so each batch starts after the
+    # last, rather than rescanning index entries for deleted rows; the
+    # usage_date bound makes that a range search (the OR alone bounds only link).
+    ordered = stats.order_by("usage_date", "id").values_list("usage_date", "id")
+    remaining = ordered
+    while rows := list(remaining[:batch_size]):
+        ids = [row[1] for row in rows]
+        with transaction.atomic():
+            UsageStat.objects.filter(id__in=ids).delete()
+            LinkDeletion.objects.filter(pk=deletion.pk).update(
+                stats_deleted=F("stats_deleted") + len(ids),
+                claimed_until=timezone.now() + timedelta(seconds=CLAIM_SECONDS),
+            )
+        deletion.stats_deleted += len(ids)
+        logger.debug(
+            f"Deleted {deletion.stats_deleted} of {deletion.stats_total} "
+            f"usage stats of {deletion.short_path}"
+        )
+        last_date, last_id = rows[-1]
+        remaining = ordered.filter(
+            Q(usage_date__gt=last_date) | Q(usage_date=last_date, id__gt=last_id),
+            usage_date__gte=last_date,
+        )
+        if len(rows) == batch_size:
+            time.sleep(pause)
+    # Usage stats queued for the link before it was deleted may not be
+    # written yet, and would fail once it is gone.
+    if timezone.now() < deletion.requested + timedelta(seconds=grace):
+        _release(deletion)
+        return False
+    with transaction.atomic():
+        Link.all_objects.filter(pk=deletion.link_id).delete()
+        deletion.finished = timezone.now()
+        LinkDeletion.objects.filter(pk=deletion.pk).update(
+            finished=deletion.finished, claimed_until=None
+        )
+    logger.info(
+        f"Removed deleted link {deletion.short_path} and "
+        f"{deletion.stats_deleted} usage stats"
+    )
+    return True
+
+
+def purge_deleted_links(
+    batch_size: int | None = None,
+    pause: float | None = None,
+    grace: float | None = None,
+) -> tuple[int, int]:
+    """Remove the data of each deleted link not already being removed by
+    another process (see remove_link_data()), oldest first.  Arguments default
+    to the LINK_DELETION_* settings.
+    Returns the numbers of deletions finished, and waiting for their grace
+    period to pass.
+    """
+    if batch_size is None:
+        batch_size = settings.LINK_DELETION_BATCH_SIZE
+    if pause is None:
+        pause = settings.LINK_DELETION_BATCH_PAUSE
+    if grace is None:
+        grace = settings.LINK_DELETION_GRACE
+    finished = waiting = 0
+    unfinished = LinkDeletion.objects.filter(finished__isnull=True)
+    for deletion in unfinished.order_by("requested"):
+        if not _claim(deletion):
+            continue
+        try:
+            if remove_link_data(deletion, batch_size, pause, grace):
+                finished += 1
+            else:
+                waiting += 1
+        except Exception:
+            # Let this or another process retry.
+            _release(deletion)
+            raise
+    return finished, waiting
+
+
+class LinkDeleter:
+    """Runs purge_deleted_links() in a background thread of this process,
+    so deleting a link does not wait for its usage data to be removed.
+    The thread only runs after a deletion in this process, so the
+    purge_deleted_links management command, run regularly, finishes anything
+    left by a process which exited (or whose thread failed) first.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    def wake(self) -> None:
+        """Start the thread, or have it run again if it is running."""
+        with self._lock:
+            self._wake.set()
+            # A forked child inherits the parent's thread object, not its thread.
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="link-deleter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            waiting = 0
+            try:
+                _, waiting = purge_deleted_links()
+            except Exception:
+                logger.exception("Failed to remove deleted links")
+            finally:
+                # This thread's connection is not closed by request signals.
+                connection.close()
+            with self._lock:
+                if not (waiting or self._wake.is_set()):
+                    self._thread = None
+                    return
+            self._wake.wait(RETRY_INTERVAL)
+
+
+link_deleter = LinkDeleter()
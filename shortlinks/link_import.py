@@ -0,0 +1,218 @@
+import csv
+import json
+import logging
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple, TextIO
+from django.contrib.auth.models import AbstractBaseUser  # for type hints
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from shortlinks.models import Link
+from shortlinks.prefix_matcher import get_wildcard_error
+from shortlinks.signals import link_changed
+from shortlinks.views_utils import format_short_path
+
+logger = logging.getLogger(__name__)
+
+
+class RejectedRow(NamedTuple):
+    line_number: int
+    row: dict
+    reason: str
+
+
+class ImportResult(NamedTuple):
+    created: int
+    rejected: list[RejectedRow]
+
+
+def read_rows(f: TextIO, import_format: str) -> Iterator[tuple[int, dict]]:
+    """Yield (line number, row dict) from a CSV file with a header row,
+    or a JSON Lines file.
+    """
+    if import_format == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    elif import_format == "jsonl":
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = {"_error": str(e)}
+            if not isinstance(row, dict):
+                row = {"_error": "Not a JSON object"}
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported import format: {import_format}")
+
+
+def _validate(row: dict, user: AbstractBaseUser) -> Link | str:
+    """Return an unsaved Link built from row, or the reason it is invalid."""
+    if "_error" in row:
+        return f"Unreadable row: {row['_error']}"
+    # "/" formats to an empty short path, as a missing one does.
+    short_path = format_short_path(str(row.get("short_path") or "").strip())
+    target_url = str(row.get("target_url") or "").strip()
+    if not short_path or any(c.isspace() for c in short_path):
+        return "Short path is missing or contains whitespace"
+    wildcard_error = get_wildcard_error(short_path)
+    if wildcard_error:
+        return wildcard_error
+    try:
+        URLValidator()(target_url)
+    except ValidationError:
+        return f"Invalid target URL: {target_url}"
+    redirect_type = Link._meta.get_field("redirect_type").default
+    if row.get("redirect_type"):
+        try:
+            redirect_type = int(row["redirect_type"])
+        except (TypeError, ValueError):
+            redirect_type = None
+        if redirect_type not in dict(Link.REDIRECT_TYPES):
+            return f"Invalid redirect type: {row['redirect_type']}"
+    cache_max_age = None
+    if row.get("cache_max_age") not in (None, ""):
+        try:
+            cache_max_age = int(row["cache_max_age"])
+        except (TypeError, ValueError):
+            cache_max_age = -1
+        if not 0 <= cache_max_age <= Link.MAX_CACHE_MAX_AGE:
+            return f"Invalid cache max age: {row['cache_max_age']}"
+    usage_sample_rate = 1
+    if row.get("usage_sample_rate") not in (None, ""):
+        try:
+            usage_sample_rate = int(row["usage_sample_rate"])
+        except (TypeError, ValueError):
+            usage_sample_rate = 0
+        if not 1 <= usage_sample_rate <= Link.MAX_USAGE_SAMPLE_RATE:
+            return f"Invalid usage sample rate: {row['usage_sample_rate']}"
+    create_date = timezone.now()
+    if row.get("create_date"):
+        try:
+            create_date = parse_datetime(str(row["create_date"]))
+        except ValueError:
+            create_date = None
+        if create_date is None:
+            return f"Invalid create date: {row['create_date']}"
+        if timezone.is_naive(create_date):
+            create_date = timezone.make_aware(create_date)
+    return Link(
+        short_path=short_path,
+        target_url=target_url,
+        redirect_type=redirect_type,
+        cache_max_age=cache_max_age,
+        usage_sample_rate=usage_sample_rate,
+        create_date=create_date,
+        created_by=user,
+    )
+
+
+def _check_chunk(
+    chunk: list[tuple[int, dict]], user: AbstractBaseUser, seen: set[str]
+) -> tuple[list[Link], list[RejectedRow]]:
+    """Return unsaved Links for the valid rows of chunk with new short paths
+    (not in seen, which they are added to, or the database), and the rest
+    rejected.
+    """
+    links = []
+    rejected = []
+    for line_number, row in chunk:
+        link = _validate(row, user)
+        if isinstance(link, str):
+            rejected.append(RejectedRow(line_number, row, link))
+        elif link.short_path in seen:
+            rejected.append(
+                RejectedRow(line_number, row, f"Duplicate in input: {link.short_path}")
+            )
+        else:
+            seen.add(link.short_path)
+            links.append((line_number, row, link))
+
+    # One query per chunk to find paths which already exist.
+    existing = set(
+        Link.objects.filter(
+            short_path__in=[link.short_path for _, _, link in links]
+        ).values_list("short_path", flat=True)
+    )
+    new_links = []
+    for line_number, row, link in links:
+        if link.short_path in existing:
+            rejected.append(
+                RejectedRow(line_number, row, f"Already exists: {link.short_path}")
+            )
+        else:
+            new_links.append(link)
+    return new_links, rejected
+
+
+def _import_chunk(
+    chunk: list[tuple[int, dict]], user: AbstractBaseUser, seen: set[str], dry_run: bool
+) -> ImportResult:
+    new_links, rejected = _check_chunk(chunk, user, seen)
+    if new_links and not dry_run:
+        Link.objects.bulk_create(new_links)
+    return ImportResult(len(new_links), rejected)
+
+
+def import_links(
+    rows: Iterable[tuple[int, dict]],
+    user: AbstractBaseUser,
+    chunk_size: int = 1000,
+    dry_run: bool = False,
+) -> ImportResult:
+    """Validate (line number, row dict) pairs and create Links from the
+    valid ones, chunk_size at a time.  Each row needs short_path and target_url,
+    and may have create_date, redirect_type, cache_max_age and usage_sample_rate;
+    all are created by user.
+    Rows which are invalid, repeat an earlier row's short path, or match an
+    existing Link are rejected.  With dry_run, nothing is saved.
+    """
+    created = 0
+    rejected = []
+    seen: set[str] = set()
+    chunk = []
+
+    def flush() -> None:
+        nonlocal created
+        with transaction.atomic():
+            result = _import_chunk(chunk, user, seen, dry_run)
+        created += result.created
+        rejected.extend(result.rejected)
+        chunk.clear()
+
+    for line_number, row in rows:
+        chunk.append((line_number, row))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    # bulk_create() does not send post_save, so invalidate cached link data here.
+    if created and not dry_run:
+        link_changed(sender=Link)
+    logger.info(f"Imported {created} links, rejected {len(rejected)}")
+    return ImportResult(created, sorted(rejected, key=lambda r: r.line_number))
+
+
+def create_links(
+    rows: list[tuple[int, dict]], user: AbstractBaseUser, dry_run: bool = False
+) -> tuple[list[Link], list[RejectedRow]]:
+    """Validate (line number, row dict) pairs as import_links() does, then
+    create Links from all of them in one transaction, or none if any row is
+    rejected.  Returns the Links (saved unless dry_run or any are rejected),
+    and the rejected rows.
+    """
+    with transaction.atomic():
+        links, rejected = _check_chunk(rows, user, set())
+        if rejected or dry_run:
+            return links, sorted(rejected, key=lambda r: r.line_number)
+        links = Link.objects.bulk_create(links)
+    # bulk_create() does not send post_save, so invalidate cached link data here.
+    link_changed(sender=Link)
+    logger.info(f"Created {len(links)} links")
+    return links, []
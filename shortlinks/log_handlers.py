@@ -0,0 +1,236 @@
+"""Logging handlers and formatters, configured by LOGGING in project/settings.py.
+
+Imports only the standard library, since logging is configured before Django
+apps are loaded.
+"""
+
+import fcntl
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from datetime import datetime
+
+# Suffix of rotated log segments: path + "." + rotation time, sorting in time order.
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S-%f"
+COMPRESSED_SUFFIX = ".gz"
+
+
+def get_log_segments(path: str) -> list[str]:
+    """Return the rotated segments of the log file at path, newest first."""
+    segments = glob.glob(f"{glob.escape(path)}.[0-9]*")
+    return sorted(segments, reverse=True)
+
+
+class SharedRotatingFileHandler(logging.Handler):
+    """Appends to a log file shared by several processes, rotating it when it
+    reaches max_bytes, or at each rotate_interval seconds (aligned to local
+    midnight), whichever comes first; 0 disables either.
+
+    Each record is written with a single write() to a file opened for
+    appending, so lines from different processes never interleave.  Writes
+    hold a shared lock on a lock file, and rotation an exclusive one, so the
+    first process to find the file due renames it when no other is writing,
+    and every process reopens the path before its next write.  Rotated
+    segments are gzipped, and only the newest backup_count are kept.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = 0,
+        rotate_interval: int = 0,
+        backup_count: int = 0,
+    ) -> None:
+        super().__init__()
+        self.path = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self._fd: int | None = None
+        self._inode: int | None = None
+        self._rotate_at = float("inf")
+        self._lock_fd: int | None = None
+        self._lock_pid: int | None = None
+
+    def _flock(self, operation: int) -> None:
+        # flock() locks are shared by forked processes using the same open
+        # file, so each process opens its own.
+        if self._lock_pid != os.getpid():
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._lock_fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_fd, operation)
+
+    def _open(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        if self.rotate_interval > 0:
+            self._rotate_at = self._get_next_rotation(time.time())
+
+    def _get_next_rotation(self, now: float) -> float:
+        offset = time.localtime(now).tm_gmtoff
+        intervals = (now + offset) // self.rotate_interval + 1
+        return intervals * self.rotate_interval - offset
+
+    def _is_replaced(self) -> bool:
+        """Return True if the path is no longer the file this process has open."""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def _is_due(self) -> bool:
+        if time.time() >= self._rotate_at:
+            return True
+        return self.max_bytes > 0 and os.fstat(self._fd).st_size >= self.max_bytes
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data = (self.format(record) + "\n").encode("utf-8", "backslashreplace")
+            self._flock(fcntl.LOCK_SH)
+            try:
+                if self._fd is None or self._is_replaced():
+                    self._open()
+                if self._is_due():
+                    self._flock(fcntl.LOCK_EX)
+                    self.rotate()
+                os.write(self._fd, data)
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def rotate(self) -> None:
+        """Rotate the log file, unless another process already has.
+        Called with the exclusive lock held.
+        """
+        if not self._is_replaced() and os.fstat(self._fd).st_size > 0:
+            suffix = datetime.now().strftime(SEGMENT_TIME_FORMAT)
+            os.rename(self.path, f"{self.path}.{suffix}")
+            self._compress_and_prune()
+        self._open()
+
+    def _compress_and_prune(self) -> None:
+        for segment in get_log_segments(self.path):
+            if not segment.endswith(COMPRESSED_SUFFIX):
+                with open(segment, "rb") as f_in:
+                    with gzip.open(segment + COMPRESSED_SUFFIX, "wb") as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+                os.remove(segment)
+        if self.backup_count > 0:
+            for segment in get_log_segments(self.path)[self.backup_count :]:
+                os.remove(segment)
+
+    def close(self) -> None:
+        with self.lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if self._lock_fd is not None and self._lock_pid == os.getpid():
+                os.close(self._lock_fd)
+                self._lock_fd = None
+                self._lock_pid = None
+        super().close()
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room, rather than failing, if the queue is full.
+        self.queue.put(self._sentinel)
+
+
+class QueuedFileHandler(logging.handlers.QueueHandler):
+    """Formats records in the logging thread, then queues them for a
+    SharedRotatingFileHandler (given the same arguments) to write in a
+    background thread, so logging never waits on the disk.
+
+    Each process has its own queue and thread, started on first use.  If the
+    queue is full (the disk cannot keep up), records are dropped and counted,
+    and a warning is logged once there is room again.
+    """
+
+    def __init__(self, queue_size: int = 10000, **file_options) -> None:
+        super().__init__(queue.Queue(queue_size))
+        self.file_handler = SharedRotatingFileHandler(**file_options)
+        self.dropped = 0
+        self._pid: int | None = None
+        self._listener: _Listener | None = None
+
+    def _start(self) -> None:
+        if self._listener is not None:
+            # Forked: the parent's queue may be locked, and its thread is gone.
+            self.queue = queue.Queue(self.queue.maxsize)
+        self._listener = _Listener(self.queue, self.file_handler)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called with self.lock held (by Handler.handle()).
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            warning = logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Dropped {self.dropped} log records: "
+                    "logging queue was full",
+                }
+            )
+            try:
+                self.queue.put_nowait(self.prepare(warning))
+                self.dropped = 0
+            except queue.Full:
+                pass
+
+    def flush(self) -> None:
+        """Wait until queued records have been written, stopping the thread
+        (the next record starts it again).  Called at exit by logging.shutdown().
+        """
+        with self.lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self._listener = None
+                self._pid = None
+
+    def close(self) -> None:
+        self.flush()
+        self.file_handler.close()
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one line of JSON: time, level, logger, module,
+    process, message, and any exception traceback.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
@@ -0,0 +1,157 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections.abc import Iterator
+from typing import BinaryIO
+from shortlinks.log_handlers import COMPRESSED_SUFFIX, get_log_segments
+
+# Level names which start each log entry, per the "verbose" format in settings.
+LEVEL_NAMES = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+def is_entry_start(line: str) -> bool:
+    """Return True if line is the first line of a log entry: it starts with a
+    level name ("verbose" format), or is a JSON object ("json" format).
+    """
+    return line.startswith("{") or line.split(" ", 1)[0] in LEVEL_NAMES
+
+
+def reverse_lines(path: str, block_size: int = 8192) -> Iterator[str]:
+    """Yield lines of a file from last to first, reading blocks backward
+    from the end so memory use does not depend on file size.
+    """
+    with open(path, "rb") as f:
+        yield from reverse_file_lines(f, block_size)
+
+
+def reverse_file_lines(f: BinaryIO, block_size: int = 8192) -> Iterator[str]:
+    """Yield lines of a seekable binary file from last to first, as
+    reverse_lines() does.
+    """
+    position = f.seek(0, os.SEEK_END)
+    remainder = b""
+    at_end = True
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        block = f.read(read_size) + remainder
+        lines = block.split(b"\n")
+        # Final newline ends the last line, rather than starting an empty one.
+        if at_end and lines[-1] == b"":
+            lines.pop()
+        at_end = False
+        # First piece may be the end of a line in the previous block.
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            yield line.decode(errors="replace") + "\n"
+    if remainder:
+        yield remainder.decode(errors="replace") + "\n"
+
+
+def reverse_log_lines(path: str) -> Iterator[str]:
+    """Yield lines of a log file from last to first, continuing into its
+    rotated segments, newest first.  Segments are only read if needed.
+    """
+    yield from reverse_lines(path)
+    for segment in get_log_segments(path):
+        if segment.endswith(COMPRESSED_SUFFIX):
+            # Compressed files can't be read backward, and segments can be any
+            # size (with time-only rotation), so decompress a block at a time
+            # into a temporary file and read that backward.
+            with gzip.open(segment, "rb") as f, tempfile.TemporaryFile() as temp:
+                shutil.copyfileobj(f, temp)
+                yield from reverse_file_lines(temp)
+        else:
+            yield from reverse_lines(segment)
+
+
+def entry_matches(header: str, level: str | None, module: str | None) -> bool:
+    """Return True if a log entry's first line passes the level and module filters.
+    level is a minimum level name; module matches the start of the logger name,
+    or the module name exactly.
+    """
+    if header.startswith("{"):
+        try:
+            entry = json.loads(header)
+            fields = [entry["level"], "", "", entry["logger"], entry["module"]]
+        except (ValueError, KeyError, TypeError):
+            fields = []
+    else:
+        # Fields: levelname, date, time, logger name, module, message
+        fields = header.split(" ", 5)
+    if len(fields) < 5:
+        return level is None and module is None
+    if level and logging.getLevelName(fields[0]) < logging.getLevelName(level):
+        return False
+    if module and not (fields[3].startswith(module) or fields[4] == module):
+        return False
+    return True
+
+
+def tail_log(
+    path: str,
+    line_count: int,
+    level: str | None = None,
+    module: str | None = None,
+) -> list[str]:
+    """Return the last line_count lines of a log file (and, if it has fewer,
+    its rotated segments), in order, optionally limited to entries matching
+    level and module.  Continuation lines (e.g., tracebacks) are kept with
+    their entry.
+    """
+    lines: list[str] = []
+    continuation: list[str] = []
+    for line in reverse_log_lines(path):
+        if len(lines) >= line_count:
+            break
+        continuation.append(line)
+        # Walking backward, an entry ends (is complete) at its first line.
+        if is_entry_start(line) or not (level or module):
+            if entry_matches(line, level, module):
+                lines.extend(continuation)
+            continuation = []
+    lines = lines[:line_count]
+    lines.reverse()
+    return lines
+
+
+def read_log_since(
+    path: str,
+    offset: int,
+    level: str | None = None,
+    module: str | None = None,
+    max_bytes: int = 1024 * 1024,
+) -> tuple[list[str], int]:
+    """Return complete lines added to a log file after byte offset, and the
+    offset to use next time.  Reads at most max_bytes: a line longer than that
+    is returned in pieces of max_bytes.  If the file is now shorter than offset
+    (it was truncated or replaced), reads from the start.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        if offset > size:
+            offset = 0
+        f.seek(offset)
+        data = f.read(max_bytes)
+    if len(data) == max_bytes and b"\n" not in data:
+        # Waiting for the end of the line would never advance the offset.
+        complete = data
+        lines = [data.decode(errors="replace") + "\n"]
+    else:
+        # Leave any partial last line for next time.
+        complete = data[: data.rfind(b"\n") + 1]
+        lines = complete.decode(errors="replace").splitlines(keepends=True)
+    if level or module:
+        matching = []
+        keep = False
+        for line in lines:
+            if is_entry_start(line):
+                keep = entry_matches(line, level, module)
+            if keep:
+                matching.append(line)
+        lines = matching
+    return lines, offset + len(complete)
@@ -0,0 +1,33 @@
+import json
+from django.core.management.base import BaseCommand
+from shortlinks.benchmark import benchmark_prefix_matcher, throwaway_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure prefix link lookups for increasing numbers of patterns, against "
+        "the exact-match database query, using a temporary test database; "
+        "writes JSON results"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patterns",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000, 50000],
+            help="Numbers of prefix links to measure",
+        )
+        parser.add_argument(
+            "--lookups", type=int, default=10000, help="Lookups per measurement"
+        )
+        parser.add_argument("--output", help="File to write JSON results to")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            results = benchmark_prefix_matcher(options["patterns"], options["lookups"])
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from shortlinks.benchmark import (
+    arun_scenario,
+    get_scenarios,
+    run_scenario,
+    seed_data,
+    throwaway_database,
+)
+from shortlinks.snapshot import snapshot_manager
+from shortlinks.startup import startup_timer
+from shortlinks.usage_writer import usage_writer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure redirect throughput, latency and queries per request through the "
+        "WSGI or ASGI application, using a temporary test database; writes JSON "
+        "results"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--links", type=int, default=1000)
+        parser.add_argument("--stats", type=int, default=10000)
+        parser.add_argument(
+            "--requests", type=int, default=2000, help="Requests per scenario"
+        )
+        parser.add_argument(
+            "--handler",
+            choices=["wsgi", "asgi", "django"],
+            default="wsgi",
+            help="wsgi or asgi: project.wsgi or project.asgi application as "
+            "deployed; django: Django's WSGI handler alone, without the fast "
+            "redirect path",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Requests in flight at once, for --handler asgi",
+        )
+        parser.add_argument("--output", help="File to write JSON results to")
+
+    def handle(self, *args, **options):
+        # Seed and measure in a throwaway database, never the real one.
+        with throwaway_database(), tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_manager.path = os.path.join(snapshot_dir, "links.snapshot")
+            try:
+                results = self.run_benchmark(options)
+            finally:
+                # Background threads' connections would keep the database
+                # from being dropped.
+                usage_writer.shutdown()
+                snapshot_manager.stop()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
+    def run_benchmark(self, options: dict) -> dict:
+        # Import here so the application is built after settings are final.
+        if options["handler"] == "django":
+            from django.core.wsgi import get_wsgi_application
+
+            application = get_wsgi_application()
+        elif options["handler"] == "asgi":
+            from project.asgi import application
+        else:
+            from project.wsgi import application
+
+        def run(paths: list[str], cold: bool = False) -> dict:
+            if options["handler"] == "asgi":
+                return asyncio.run(
+                    arun_scenario(application, paths, options["concurrency"], cold)
+                )
+            return run_scenario(application, paths, cold)
+
+        short_paths = seed_data(options["links"], options["stats"])
+        if snapshot_manager.started:
+            snapshot_manager.refresh()
+        scenarios = get_scenarios(short_paths, options["requests"])
+        # Warm up imports, URL resolver and database connection.
+        run(scenarios["hot_link"][:50])
+        first_redirect = startup_timer.first_redirect
+        return {
+            "config": {
+                "links": options["links"],
+                "stats": options["stats"],
+                "requests_per_scenario": options["requests"],
+                "handler": options["handler"],
+                "concurrency": (
+                    options["concurrency"] if options["handler"] == "asgi" else 1
+                ),
+                "link_snapshot": snapshot_manager.started,
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            # Loading the application (before seeding), and the first request.
+            "startup": {
+                "phases": startup_timer.phases,
+                "first_redirect_ms": (
+                    None if first_redirect is None else first_redirect * 1000
+                ),
+            },
+            "scenarios": {
+                name: run(paths, cold=(name == "cold_link"))
+                for name, paths in scenarios.items()
+            },
+        }
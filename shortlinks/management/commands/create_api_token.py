@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from shortlinks.api import create_api_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a token for the JSON API, acting as the given user; the token is "
+        "printed once and only its hash is stored"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("user", help="Username the token acts as")
+        parser.add_argument(
+            "--name", default="", help="What the token is for, e.g. the integration"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No such user: {options['user']}")
+        self.stdout.write(create_api_token(user, options["name"]))
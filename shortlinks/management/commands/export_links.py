@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from shortlinks.exports import EXPORT_FORMATS, stream_rows
+from shortlinks.models import Link
+
+EXPORT_FIELDS = [
+    "short_path",
+    "target_url",
+    "create_date",
+    "created_by",
+    "redirect_type",
+    "cache_max_age",
+    "usage_sample_rate",
+]
+
+
+class Command(BaseCommand):
+    help = "Write all links as CSV or JSON Lines, in a form import_links accepts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = (
+            Link.objects.order_by("id")
+            .values_list(
+                "short_path",
+                "target_url",
+                "create_date",
+                "created_by__username",
+                "redirect_type",
+                "cache_max_age",
+                "usage_sample_rate",
+            )
+            .iterator(chunk_size=options["chunk_size"])
+        )
+        lines = stream_rows(rows, EXPORT_FIELDS, options["format"])
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,42 @@
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shortlinks.exports import (
+    EXPORT_FORMATS,
+    USAGE_EXPORT_FIELDS,
+    get_usage_export_rows,
+    stream_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Write usage statistics, for one link or all, as CSV or JSON Lines, "
+        "optionally limited to a range of (local) dates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--link-id", type=int, help="Only this link's usage")
+        parser.add_argument(
+            "--start", type=date.fromisoformat, help="First day (YYYY-MM-DD)"
+        )
+        parser.add_argument(
+            "--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD)"
+        )
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+        parser.add_argument(
+            "--chunk-size", type=int, default=settings.EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        rows = get_usage_export_rows(
+            options["link_id"], options["start"], options["end"]
+        ).iterator(chunk_size=options["chunk_size"])
+        lines = stream_rows(rows, USAGE_EXPORT_FIELDS, options["format"])
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
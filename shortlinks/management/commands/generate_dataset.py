@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from shortlinks.datasets import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Add a synthetic dataset of users, links and usage statistics, with skewed "
+        "popularity, to the database, for trying out queries and indexes at scale; "
+        "never run this against production"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--links", type=int, default=100000)
+        parser.add_argument("--stats", type=int, default=1000000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument(
+            "--days", type=int, default=365, help="Days the links and usage span"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Same seed, same dataset"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Rows inserted per transaction",
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        try:
+            counts = generate_dataset(
+                options["links"],
+                options["stats"],
+                options["users"],
+                options["days"],
+                options["seed"],
+                options["batch_size"],
+                progress=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Generated {counts.users} users, {counts.links} links and "
+            f"{counts.usage_stats} usage stats in {time.monotonic() - start:.1f}s; "
+            "run rollup_usage to summarize them"
+        )
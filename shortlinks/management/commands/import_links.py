@@ -0,0 +1,68 @@
+import csv
+import sys
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from shortlinks.link_import import import_links, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create links from a CSV (with header) or JSON Lines file with short_path "
+        "and target_url fields, and optional create_date, redirect_type, "
+        "cache_max_age and usage_sample_rate fields.  Rows are validated and "
+        "bulk created in chunks, one transaction per chunk; invalid rows and "
+        "short paths already taken are rejected and reported"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="File to import, or - for stdin")
+        parser.add_argument(
+            "--user", required=True, help="Username to record as creator of the links"
+        )
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows validated and created per transaction",
+        )
+        parser.add_argument(
+            "--rejects", help="Write rejected rows, with reasons, to this CSV file"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Validate only; create nothing"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No such user: {options['user']}")
+
+        if options["file"] == "-":
+            f = sys.stdin
+        else:
+            f = open(options["file"], newline="", encoding="utf-8")
+        with f:
+            result = import_links(
+                read_rows(f, options["format"]),
+                user,
+                chunk_size=options["chunk_size"],
+                dry_run=options["dry_run"],
+            )
+
+        for rejected in result.rejected:
+            self.stderr.write(f"Line {rejected.line_number}: {rejected.reason}")
+        if options["rejects"]:
+            with open(options["rejects"], "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["line_number", "reason", "row"])
+                for rejected in result.rejected:
+                    writer.writerow(
+                        [rejected.line_number, rejected.reason, rejected.row]
+                    )
+
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(
+            f"{verb} {result.created} links; rejected {len(result.rejected)} rows"
+        )
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shortlinks.link_deletion import purge_deleted_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove the usage statistics of deleted links in batches, then the links "
+        "themselves; finishes anything the web processes did not"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.LINK_DELETION_BATCH_SIZE,
+            help="Maximum number of usage statistics deleted per transaction",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=settings.LINK_DELETION_BATCH_PAUSE,
+            help="Seconds to wait between batches",
+        )
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=settings.LINK_DELETION_GRACE,
+            help="Seconds after deletion before a link itself is removed",
+        )
+
+    def handle(self, *args, **options):
+        finished, waiting = purge_deleted_links(
+            options["batch_size"], options["pause"], options["grace"]
+        )
+        self.stdout.write(
+            f"Removed {finished} deleted links; {waiting} waiting for the grace period"
+        )
@@ -0,0 +1,36 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shortlinks.retention import purge_usage_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive usage statistics older than the retention period to monthly "
+        "gzipped JSON Lines files, then delete them in chunks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.USAGE_RETENTION_DAYS,
+            help="Keep usage statistics from this many recent days",
+        )
+        parser.add_argument("--archive-dir", default=settings.USAGE_ARCHIVE_DIR)
+        parser.add_argument(
+            "--no-archive", action="store_true", help="Delete without archiving"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Maximum number of rows deleted per transaction",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        archive_dir = None if options["no_archive"] else options["archive_dir"]
+        deleted = purge_usage_stats(cutoff, archive_dir, options["chunk_size"])
+        self.stdout.write(f"Deleted {deleted} usage statistics older than {cutoff}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from shortlinks.rollups import roll_up_usage
+
+
+class Command(BaseCommand):
+    help = "Summarize new usage statistics into daily per-link totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Maximum number of usage statistics read per batch (default "
+            "USAGE_ROLLUP_BATCH_SIZE)",
+        )
+
+    def handle(self, *args, **options):
+        processed = roll_up_usage(batch_size=options["batch_size"])
+        self.stdout.write(f"Rolled up {processed} usage statistics")
@@ -0,0 +1,341 @@
+import atexit
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of latency histogram buckets.
+LATENCY_BUCKETS = [
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+]
+
+METRIC_PREFIX = "linkshortener_"
+# Counters and histograms of processes that have exited, added up.
+EXITED_FILE_NAME = "exited.json"
+HELP = {
+    "http_requests_total": ("counter", "Requests handled, by view and status"),
+    "http_request_duration_seconds": (
+        "histogram",
+        "Time to handle a request, by view",
+    ),
+    "db_queries_total": ("counter", "Database queries run, by view"),
+    "db_query_duration_seconds_total": (
+        "counter",
+        "Time spent in database queries, by view",
+    ),
+    "redirects_total": ("counter", "Short link lookups, by outcome"),
+    "usage_stats_total": ("counter", "Usage statistics, by outcome"),
+    "usage_stats_queued": ("gauge", "Usage statistics waiting to be written"),
+    "usage_stats_held": (
+        "gauge",
+        "Usage statistics held for collapsing repeated uses",
+    ),
+    "link_cache_total": ("counter", "Link cache lookups, by outcome"),
+    "negative_lookups_total": (
+        "counter",
+        "Unknown short paths answered without the database, "
+        "by source (bloom_filter, snapshot or miss_cache)",
+    ),
+}
+
+
+def _label_key(labels: dict | None) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _file_pid(file_name: str) -> int | None:
+    """Return the process id in a process's metrics file name, if any."""
+    pid, _, _ = file_name.partition("-")
+    return int(pid) if pid.isdigit() else None
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _without_gauges(snapshot: dict) -> dict:
+    """Return snapshot without its gauges, which only mean anything while the
+    process is running.
+    """
+    return {
+        "counters": [
+            counter
+            for counter in snapshot["counters"]
+            if HELP.get(counter[0], ("",))[0] != "gauge"
+        ],
+        "histograms": snapshot["histograms"],
+    }
+
+
+def _add_up(snapshots: list[dict]) -> tuple[dict, dict]:
+    """Return the counters and histograms of snapshots, keyed by
+    (name, label tuple), added up.
+    """
+    counters: dict[tuple, float] = defaultdict(float)
+    histograms: dict[tuple, list] = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            counters[(name, _label_key(labels))] += value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, _label_key(labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+    return counters, histograms
+
+
+def is_allowed_client(address: str) -> bool:
+    """Return whether address is in METRICS_ALLOWED_NETWORKS."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        ip in ipaddress.ip_network(network.strip(), strict=False)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
+
+
+class Metrics:
+    """Counters and histograms for one process.
+
+    Each process periodically writes its values to its own file in
+    METRICS_DIR; collect() adds up all the files, so /metrics reports totals
+    for all gunicorn workers whichever worker serves it.  When a worker exits,
+    the gunicorn master folds its file into one for all exited processes (see
+    remove_process()), keeping its counters but not its gauges.
+    """
+
+    def __init__(self, metrics_dir: str, dump_interval: float) -> None:
+        self.metrics_dir = metrics_dir
+        self.dump_interval = dump_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        # Include start time, in case a later process reuses this pid.
+        self._file_name = f"{self._pid}-{time.time_ns()}.json"
+        self._last_dump = 0.0
+        self._counters: dict[tuple, float] = defaultdict(float)
+        self._histograms: dict[tuple, list] = {}
+
+    def _check_pid(self) -> None:
+        # A forked child inherits the parent's values; start again from zero.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name: str, labels: dict | None = None, value: float = 1) -> None:
+        """Add value to a counter."""
+        with self._lock:
+            self._check_pid()
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, value: float, labels: dict | None = None) -> None:
+        """Record value in a histogram with LATENCY_BUCKETS."""
+        with self._lock:
+            self._check_pid()
+            key = (name, _label_key(labels))
+            # Bucket counts, then sum and count of all values.
+            histogram = self._histograms.setdefault(
+                key, [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            )
+            index = bisect_left(LATENCY_BUCKETS, value)
+            if index < len(LATENCY_BUCKETS):
+                histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Return this process's values, including those kept by the
+        link cache and usage writer, in a JSON-serializable form.
+        """
+        from shortlinks.link_cache import link_cache
+        from shortlinks.usage_writer import usage_writer
+
+        with self._lock:
+            self._check_pid()
+            counters = [
+                [name, dict(labels), value]
+                for (name, labels), value in self._counters.items()
+            ]
+            histograms = [
+                [name, dict(labels), list(values)]
+                for (name, labels), values in self._histograms.items()
+            ]
+        writer_stats = usage_writer.stats()
+        for outcome in ["enqueued", "written", "dropped", "failed", "collapsed"]:
+            counters.append(
+                ["usage_stats_total", {"outcome": outcome}, writer_stats[outcome]]
+            )
+        counters.append(["usage_stats_queued", {}, writer_stats["queued"]])
+        counters.append(["usage_stats_held", {}, writer_stats["held"]])
+        cache_stats = link_cache.stats()
+        for outcome in ["hits", "misses"]:
+            counters.append(
+                ["link_cache_total", {"outcome": outcome}, cache_stats[outcome]]
+            )
+        return {"counters": counters, "histograms": histograms}
+
+    def maybe_dump(self) -> None:
+        """Write this process's values to its file, if dump_interval has passed."""
+        if time.monotonic() - self._last_dump >= self.dump_interval:
+            self.dump()
+
+    def dump(self) -> None:
+        """Write this process's values to its file, atomically."""
+        self._last_dump = time.monotonic()
+        try:
+            self._write(self._file_name, self.snapshot())
+        except OSError:
+            logger.exception(f"Unable to write metrics to {self.metrics_dir}")
+
+    def collect(self) -> str:
+        """Return the totals for all processes, in Prometheus text format.
+        Gauges are skipped for processes no longer running.
+        """
+        snapshots = [self.snapshot()]
+        try:
+            file_names = os.listdir(self.metrics_dir)
+        except FileNotFoundError:
+            file_names = []
+        for file_name in file_names:
+            if file_name == self._file_name or not file_name.endswith(".json"):
+                continue
+            snapshot = self._read(file_name)
+            if snapshot is None:
+                continue
+            pid = _file_pid(file_name)
+            if pid is not None and not _is_running(pid):
+                snapshot = _without_gauges(snapshot)
+            snapshots.append(snapshot)
+        return format_prometheus(*_add_up(snapshots))
+
+    def remove_process(self, pid: int) -> None:
+        """Fold the files of exited process pid into EXITED_FILE_NAME, without
+        gauges, so its counts stay in the totals without a file per process.
+        Called only by the gunicorn master, so never concurrently.
+        """
+        prefix = f"{pid}-"
+        try:
+            file_names = os.listdir(self.metrics_dir)
+        except FileNotFoundError:
+            return
+        for file_name in file_names:
+            if not (file_name.startswith(prefix) and file_name.endswith(".json")):
+                continue
+            snapshot = self._read(file_name)
+            if snapshot is not None:
+                exited = self._read(EXITED_FILE_NAME) or {
+                    "counters": [],
+                    "histograms": [],
+                }
+                counters, histograms = _add_up([exited, _without_gauges(snapshot)])
+                self._write(
+                    EXITED_FILE_NAME,
+                    {
+                        "counters": [
+                            [name, dict(labels), value]
+                            for (name, labels), value in counters.items()
+                        ],
+                        "histograms": [
+                            [name, dict(labels), values]
+                            for (name, labels), values in histograms.items()
+                        ],
+                    },
+                )
+            try:
+                os.remove(os.path.join(self.metrics_dir, file_name))
+            except OSError:
+                logger.exception(f"Unable to remove metrics file {file_name}")
+
+    def _read(self, file_name: str) -> dict | None:
+        try:
+            with open(os.path.join(self.metrics_dir, file_name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # File removed or being replaced; skip it this time.
+            return None
+
+    def _write(self, file_name: str, snapshot: dict) -> None:
+        """Write snapshot to file_name, atomically."""
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = os.path.join(self.metrics_dir, file_name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def format_prometheus(counters: dict, histograms: dict) -> str:
+    """Format counters and histograms, keyed by (name, label tuple),
+    in Prometheus text exposition format.
+    """
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        metric_type, help_text = HELP.get(name, ("untyped", name))
+        full_name = METRIC_PREFIX + name
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for (key_name, labels), values in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, values):
+                cumulative += count
+                le = (("le", str(bound)),)
+                lines.append(
+                    f"{full_name}_bucket{_format_labels(labels, le)} {cumulative}"
+                )
+            inf = (("le", "+Inf"),)
+            lines.append(
+                f"{full_name}_bucket{_format_labels(labels, inf)} {values[-1]}"
+            )
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(settings.METRICS_DIR, settings.METRICS_DUMP_INTERVAL)
+atexit.register(metrics.dump)
@@ -0,0 +1,65 @@
+import time
+from collections.abc import Callable
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from shortlinks.metrics import metrics
+
+
+class MetricsMiddleware:
+    """Record latency, status and database query count/time for each request,
+    labelled by the name of the view which handled it.
+    Under ASGI, queries run in other threads, so are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.is_async:
+            return self.__acall__(request)
+        query_count = 0
+        query_time = 0.0
+
+        def time_query(execute, sql, params, many, context):
+            nonlocal query_count, query_time
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                query_count += 1
+                query_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(time_query):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        view = self.record(request, response, elapsed)
+        metrics.inc("db_queries_total", {"view": view}, query_count)
+        metrics.inc("db_query_duration_seconds_total", {"view": view}, query_time)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(
+        self, request: HttpRequest, response: HttpResponse, elapsed: float
+    ) -> str:
+        """Record latency and status for a request; return its view label."""
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unknown"
+        metrics.observe("http_request_duration_seconds", elapsed, {"view": view})
+        metrics.inc(
+            "http_requests_total", {"view": view, "status": response.status_code}
+        )
+        metrics.maybe_dump()
+        return view
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortlinks', '0003_usagestat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_usage_stat_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('unique_ips', models.PositiveIntegerField(default=0)),
+                ('top_referrers', models.JSONField(default=list)),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shortlinks.link')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('link', 'day'), name='unique_link_day')],
+            },
+        ),
+    ]
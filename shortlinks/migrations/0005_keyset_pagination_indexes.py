@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortlinks', '0004_dailyusage_rollupstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['create_date', 'id'], name='shortlinks__create__aa4ccb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['created_by', 'create_date', 'id'], name='shortlinks__created_6ab8b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usagestat',
+            index=models.Index(fields=['link', 'usage_date', 'id'], name='shortlinks__link_id_a3a19f_idx'),
+        ),
+    ]
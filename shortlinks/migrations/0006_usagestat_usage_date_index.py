@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortlinks', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usagestat',
+            index=models.Index(fields=['usage_date'], name='shortlinks__usage_d_9ff708_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shortlinks", "0007_linkversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Referrer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value_hash", models.CharField(max_length=64, unique=True)),
+                ("value", models.CharField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserAgent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value_hash", models.CharField(max_length=64, unique=True)),
+                ("value", models.CharField()),
+                ("is_bot", models.BooleanField(null=True)),
+                ("browser", models.CharField(blank=True, default="")),
+            ],
+        ),
+        migrations.AddField(
+            model_name="usagestat",
+            name="referrer_ref",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="shortlinks.referrer",
+            ),
+        ),
+        migrations.AddField(
+            model_name="usagestat",
+            name="user_agent_ref",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="shortlinks.useragent",
+            ),
+        ),
+    ]
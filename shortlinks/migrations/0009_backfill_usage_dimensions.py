@@ -0,0 +1,145 @@
+import hashlib
+import re
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# UsageStat rows updated per transaction.
+CHUNK_SIZE = 5000
+# Copies of shortlinks.dimensions as of this migration, so later changes there
+# don't change what it does.
+BOT_PATTERN = re.compile(
+    r"bot|crawl|spider|slurp|scan|curl|wget|python-|java/|go-http-client|"
+    r"httpclient|headless|preview|monitor|facebookexternalhit",
+    re.IGNORECASE,
+)
+BROWSER_PATTERNS = [
+    ("Edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("Opera", re.compile(r"OPR/|Opera")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/")),
+    ("Firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("Chrome", re.compile(r"Chrome/|CriOS/")),
+    ("Safari", re.compile(r"Safari/")),
+    ("Internet Explorer", re.compile(r"MSIE |Trident/")),
+]
+
+
+def hash_value(value: str) -> str:
+    """Return the key for a dimension value: SHA-256 of its UTF-8 bytes, as hex."""
+    return hashlib.sha256(value.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def classify_user_agent(user_agent: str) -> tuple[bool, str]:
+    """Return (is_bot, browser name or "") for a User-Agent value."""
+    is_bot = bool(BOT_PATTERN.search(user_agent))
+    browser = next(
+        (name for name, pattern in BROWSER_PATTERNS if pattern.search(user_agent)), ""
+    )
+    return is_bot, browser
+
+
+def get_ids(model, values: set[str], classify: bool = False) -> dict[str, int]:
+    """Return the id of the dimension row for each of values, creating any missing."""
+    values_by_hash = {hash_value(value): value for value in values}
+    existing = set(
+        model.objects.filter(value_hash__in=values_by_hash).values_list(
+            "value_hash", flat=True
+        )
+    )
+    new_rows = []
+    for value_hash in values_by_hash.keys() - existing:
+        row = model(value_hash=value_hash, value=values_by_hash[value_hash])
+        if classify:
+            row.is_bot, row.browser = classify_user_agent(row.value)
+        new_rows.append(row)
+    model.objects.bulk_create(new_rows)
+    return {
+        values_by_hash[value_hash]: row_id
+        for value_hash, row_id in model.objects.filter(
+            value_hash__in=values_by_hash
+        ).values_list("value_hash", "id")
+    }
+
+
+def backfill(apps, schema_editor):
+    """Point each UsageStat at dimension rows for its referrer and user agent."""
+    UsageStat = apps.get_model("shortlinks", "UsageStat")
+    Referrer = apps.get_model("shortlinks", "Referrer")
+    UserAgent = apps.get_model("shortlinks", "UserAgent")
+    last_id = 0
+    while True:
+        # Each chunk commits separately, so locks are held briefly and an
+        # interrupted migration keeps its progress.
+        with transaction.atomic():
+            rows = list(
+                UsageStat.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "referrer", "user_agent")[:CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            referrer_ids = get_ids(Referrer, {row[1] for row in rows if row[1]})
+            user_agent_ids = get_ids(
+                UserAgent, {row[2] for row in rows if row[2]}, classify=True
+            )
+            UsageStat.objects.bulk_update(
+                [
+                    UsageStat(
+                        id=row_id,
+                        referrer_ref_id=referrer_ids.get(referrer),
+                        user_agent_ref_id=user_agent_ids.get(user_agent),
+                    )
+                    for row_id, referrer, user_agent in rows
+                ],
+                ["referrer_ref_id", "user_agent_ref_id"],
+                batch_size=1000,
+            )
+        last_id = rows[-1][0]
+
+
+def restore(apps, schema_editor):
+    """Copy referrer and user agent values back into each UsageStat."""
+    UsageStat = apps.get_model("shortlinks", "UsageStat")
+    Referrer = apps.get_model("shortlinks", "Referrer")
+    UserAgent = apps.get_model("shortlinks", "UserAgent")
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                UsageStat.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:CHUNK_SIZE]
+            )
+            if not ids:
+                break
+            UsageStat.objects.filter(id__in=ids).update(
+                referrer=Coalesce(
+                    Subquery(
+                        Referrer.objects.filter(id=OuterRef("referrer_ref_id")).values(
+                            "value"
+                        )
+                    ),
+                    Value(""),
+                ),
+                user_agent=Coalesce(
+                    Subquery(
+                        UserAgent.objects.filter(
+                            id=OuterRef("user_agent_ref_id")
+                        ).values("value")
+                    ),
+                    Value(""),
+                ),
+            )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("shortlinks", "0008_usage_dimensions"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, restore, elidable=True),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shortlinks", "0009_backfill_usage_dimensions"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="usagestat",
+            name="referrer",
+        ),
+        migrations.RemoveField(
+            model_name="usagestat",
+            name="user_agent",
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shortlinks", "0010_remove_usagestat_strings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TargetCheck",
+            fields=[
+                (
+                    "link",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="target_check",
+                        serialize=False,
+                        to="shortlinks.link",
+                    ),
+                ),
+                ("target_url", models.URLField()),
+                ("status_code", models.PositiveSmallIntegerField(null=True)),
+                ("error", models.CharField(blank=True, default="")),
+                ("latency_ms", models.PositiveIntegerField(null=True)),
+                ("checked", models.DateTimeField()),
+                ("etag", models.CharField(blank=True, default="")),
+                ("last_modified", models.CharField(blank=True, default="")),
+            ],
+        ),
+    ]
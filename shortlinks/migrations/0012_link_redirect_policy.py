@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shortlinks", "0011_targetcheck"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="link",
+            name="cache_max_age",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="redirect_type",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (302, "Temporary (302 Found)"),
+                    (307, "Temporary, keeping method (307 Temporary Redirect)"),
+                    (301, "Permanent (301 Moved Permanently)"),
+                    (308, "Permanent, keeping method (308 Permanent Redirect)"),
+                ],
+                default=302,
+            ),
+        ),
+    ]
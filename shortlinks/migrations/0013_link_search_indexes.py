@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Trigram indexes for shortlinks.search.filter_links(), matching the SQL Django
+# generates for icontains on PostgreSQL: UPPER("column"::text) LIKE UPPER(...).
+TRIGRAM_INDEXES = {
+    "shortlinks_link_short_path_trgm": "short_path",
+    "shortlinks_link_target_url_trgm": "target_url",
+}
+
+
+def create_indexes(apps, schema_editor):
+    # Other databases search an in-memory index instead.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON shortlinks_link "
+            f"USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shortlinks", "0012_link_redirect_policy"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shortlinks", "0014_link_deletion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="link",
+            name="usage_sample_rate",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="usagestat",
+            name="hit_count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
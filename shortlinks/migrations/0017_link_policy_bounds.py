@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shortlinks", "0016_apitoken"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="link",
+            name="cache_max_age",
+            field=models.PositiveIntegerField(
+                blank=True,
+                null=True,
+                validators=[django.core.validators.MaxValueValidator(31536000)],
+            ),
+        ),
+        migrations.AlterField(
+            model_name="link",
+            name="usage_sample_rate",
+            field=models.PositiveIntegerField(
+                default=1,
+                validators=[django.core.validators.MaxValueValidator(1000000)],
+            ),
+        ),
+    ]
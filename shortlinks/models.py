@@ -1,9 +1,37 @@
 from django.db import models
 from django.conf import settings
+from django.core.validators import MaxValueValidator
 from django.utils import timezone
 
 
+class LinkManager(models.Manager):
+    """Excludes deleted links, which are kept only until their usage data has
+    been removed (see shortlinks.link_deletion).
+    """
+
+    def get_queryset(self) -> models.QuerySet:
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Link(models.Model):
+    """A short path redirecting to a target URL.  A short path ending in
+    PREFIX_SUFFIX (e.g. /guides/*) is a prefix link: it also matches any longer
+    path, with the rest of the path and any query string forwarded.
+    """
+
+    # Ends the short path of a prefix link.
+    PREFIX_SUFFIX = "/*"
+    # Upper bounds for cache_max_age (a year) and usage_sample_rate.
+    MAX_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+    MAX_USAGE_SAMPLE_RATE = 1000000
+
+    REDIRECT_TYPES = [
+        (302, "Temporary (302 Found)"),
+        (307, "Temporary, keeping method (307 Temporary Redirect)"),
+        (301, "Permanent (301 Moved Permanently)"),
+        (308, "Permanent, keeping method (308 Permanent Redirect)"),
+    ]
+
     short_path = models.CharField(blank=False, null=False)
     target_url = models.URLField(blank=False, null=False)
     create_date = models.DateTimeField(blank=False, null=False, default=timezone.now)
@@ -15,17 +43,203 @@ class Link(models.Model):
         # No backwards relation to User model
         related_name="+",
     )
+    redirect_type = models.PositiveSmallIntegerField(
+        choices=REDIRECT_TYPES, default=302
+    )
+    # Seconds browsers and proxies may cache the redirect: null sends no
+    # Cache-Control header (browsers cache permanent redirects indefinitely,
+    # temporary ones not at all), 0 forbids caching.
+    cache_max_age = models.PositiveIntegerField(
+        blank=True, null=True, validators=[MaxValueValidator(MAX_CACHE_MAX_AGE)]
+    )
+    # Usage of the link is recorded as one UsageStat per this many uses (by
+    # anyone), counting them all, to limit rows written for very busy links.
+    usage_sample_rate = models.PositiveIntegerField(
+        default=1, validators=[MaxValueValidator(MAX_USAGE_SAMPLE_RATE)]
+    )
+    # Set when the link is deleted: it no longer redirects, and its short path
+    # can be reused, while its usage data is removed in the background.
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    # Links not deleted; all_objects includes deleted links.
+    objects = LinkManager()
+    all_objects = models.Manager()
 
     class Meta:
         indexes = [
             models.Index(fields=["short_path"]),
+            # For keyset pagination of all links and each user's links.
+            models.Index(fields=["create_date", "id"]),
+            models.Index(fields=["created_by", "create_date", "id"]),
         ]
 
+    @property
+    def is_prefix(self) -> bool:
+        return self.short_path.endswith(self.PREFIX_SUFFIX)
+
+
+class UserAgent(models.Model):
+    """A distinct User-Agent header value, stored once for all UsageStat rows
+    with that value, with its classification.
+    """
+
+    # SHA-256 of value, as hex: a fixed-size unique key for any length of value.
+    value_hash = models.CharField(max_length=64, unique=True)
+    value = models.CharField(blank=False, null=False)
+    # Null if not classified (USAGE_CLASSIFY_USER_AGENTS is off).
+    is_bot = models.BooleanField(null=True)
+    browser = models.CharField(blank=True, null=False, default="")
+
+
+class Referrer(models.Model):
+    """A distinct Referer header value, stored once for all UsageStat rows
+    with that value.
+    """
+
+    value_hash = models.CharField(max_length=64, unique=True)
+    value = models.CharField(blank=False, null=False)
+
 
 class UsageStat(models.Model):
     link = models.ForeignKey(Link, on_delete=models.CASCADE, blank=False, null=False)
     client_ip = models.GenericIPAddressField(null=False)
     query_string = models.CharField(blank=True, null=False)
-    referrer = models.CharField(blank=True, null=False)
-    user_agent = models.CharField(blank=True, null=False)
+    # Null if the header was missing or empty.  Not indexed: dimension rows
+    # are never deleted, and usage is never looked up by them.
+    referrer_ref = models.ForeignKey(
+        Referrer, on_delete=models.PROTECT, null=True, db_index=False, related_name="+"
+    )
+    user_agent_ref = models.ForeignKey(
+        UserAgent, on_delete=models.PROTECT, null=True, db_index=False, related_name="+"
+    )
     usage_date = models.DateTimeField(blank=False, null=False, default=timezone.now)
+    # Uses this row stands for: repeated uses, and sampled uses, are collapsed
+    # into the first (see shortlinks.usage_dedup).
+    hit_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # For keyset pagination of each link's usage.
+            models.Index(fields=["link", "usage_date", "id"]),
+            # For finding old usage to archive and purge.
+            models.Index(fields=["usage_date"]),
+        ]
+
+    # Values of the dimension rows; use select_related() or
+    # shortlinks.dimensions.with_dimension_values() to avoid a query per row.
+    @property
+    def referrer(self) -> str:
+        return self.referrer_ref.value if self.referrer_ref_id else ""
+
+    @property
+    def user_agent(self) -> str:
+        return self.user_agent_ref.value if self.user_agent_ref_id else ""
+
+
+class DailyUsage(models.Model):
+    """Usage totals for one link on one (local) day, summarized from UsageStat
+    by the rollup_usage management command.
+    """
+
+    link = models.ForeignKey(Link, on_delete=models.CASCADE, blank=False, null=False)
+    day = models.DateField(blank=False, null=False)
+    hit_count = models.PositiveIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+    # List of [referrer, count] pairs, most frequent first.
+    top_referrers = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["link", "day"], name="unique_link_day"),
+        ]
+
+
+class RollupState(models.Model):
+    """Single row recording how far UsageStat has been summarized into DailyUsage."""
+
+    last_usage_stat_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(blank=True, null=True)
+
+
+class LinkVersion(models.Model):
+    """Single row counting changes to Link, so each process can tell when its
+    in-memory copies of link data are out of date.
+    """
+
+    version = models.BigIntegerField(default=0)
+
+
+class TargetCheck(models.Model):
+    """Result of the latest check of a link's target URL, by the check_targets
+    management command.
+    """
+
+    link = models.OneToOneField(
+        Link, on_delete=models.CASCADE, primary_key=True, related_name="target_check"
+    )
+    # The target URL checked; validators below are only sent for the same URL.
+    target_url = models.URLField(blank=False, null=False)
+    # Null if no response was received (see error).
+    status_code = models.PositiveSmallIntegerField(null=True)
+    error = models.CharField(blank=True, null=False, default="")
+    latency_ms = models.PositiveIntegerField(null=True)
+    checked = models.DateTimeField(blank=False, null=False)
+    # Validators from the last full response, for conditional requests.
+    etag = models.CharField(blank=True, null=False, default="")
+    last_modified = models.CharField(blank=True, null=False, default="")
+
+    @property
+    def is_broken(self) -> bool:
+        # Redirects and 304 Not Modified count as working.
+        return self.status_code is None or self.status_code >= 400
+
+
+class LinkDeletion(models.Model):
+    """Progress of removing a deleted link's usage data, a batch at a time,
+    by shortlinks.link_deletion; the link itself is removed last.
+    """
+
+    # Null once the link has been removed.
+    link = models.OneToOneField(
+        Link, on_delete=models.SET_NULL, null=True, related_name="deletion"
+    )
+    # Copied from the link, to show once it has been removed.
+    short_path = models.CharField(blank=False, null=False)
+    target_url = models.URLField(blank=False, null=False)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name="+",
+    )
+    requested = models.DateTimeField(blank=False, null=False, default=timezone.now)
+    # Usage stats when removal started (null until then), and removed so far.
+    stats_total = models.PositiveBigIntegerField(null=True)
+    stats_deleted = models.PositiveBigIntegerField(default=0)
+    finished = models.DateTimeField(blank=True, null=True)
+    # A process removing the data holds it until this time, renewed each batch,
+    # so no other process works on it at the same time.
+    claimed_until = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def percent_done(self) -> int:
+        if self.finished:
+            return 100
+        if not self.stats_total:
+            return 0
+        return min(99, self.stats_deleted * 100 // self.stats_total)
+
+
+class ApiToken(models.Model):
+    """A token for the JSON API (see shortlinks.api), acting as user.
+    Only a hash of the token is stored; it is shown once, when created.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    name = models.CharField(blank=True, null=False, default="")
+    # SHA-256 of the token, as hex.
+    token_hash = models.CharField(max_length=64, unique=True)
+    created = models.DateTimeField(blank=False, null=False, default=timezone.now)
+    # Updated at most once a minute.
+    last_used = models.DateTimeField(blank=True, null=True)
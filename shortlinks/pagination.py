@@ -0,0 +1,80 @@
+import base64
+from datetime import datetime
+from typing import NamedTuple
+from django.conf import settings
+from django.db.models import Model, Q, QuerySet
+from django.http import HttpRequest
+
+
+class KeysetPage(NamedTuple):
+    """One page of results, newest first, and the cursor for the next page."""
+
+    items: list
+    next_cursor: str | None
+
+
+def get_page_size(request: HttpRequest) -> int:
+    """Return the page size requested via ?page_size=,
+    limited to 1..MAX_PAGE_SIZE, or the default page size.
+    """
+    try:
+        page_size = int(request.GET.get("page_size", settings.PAGE_SIZE))
+    except ValueError:
+        page_size = settings.PAGE_SIZE
+    return max(1, min(page_size, settings.MAX_PAGE_SIZE))
+
+
+def encode_cursor(date_value: datetime, pk: int) -> str:
+    """Encode the sort key of the last row on a page as an opaque string."""
+    raw = f"{date_value.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor from encode_cursor(); raises ValueError if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_string, pk = raw.split("|")
+        return datetime.fromisoformat(date_string), int(pk)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def seek_keyset(queryset: QuerySet, date_field: str, cursor: str | None) -> QuerySet:
+    """Return queryset ordered by date_field and id descending, starting after
+    the row identified by cursor (or from the start, if the cursor is missing
+    or invalid).
+    """
+    if cursor:
+        try:
+            date_value, pk = decode_cursor(cursor)
+        except ValueError:
+            pass
+        else:
+            # The OR alone bounds no index column, so the index would be read
+            # from the start; the date_field bound makes it a range search.
+            queryset = queryset.filter(
+                Q(**{f"{date_field}__lt": date_value})
+                | Q(**{date_field: date_value, "id__lt": pk}),
+                **{f"{date_field}__lte": date_value},
+            )
+    return queryset.order_by(f"-{date_field}", "-id")
+
+
+def paginate_keyset(
+    queryset: QuerySet, date_field: str, cursor: str | None, page_size: int
+) -> KeysetPage:
+    """Return one page of queryset, ordered by date_field and id descending,
+    starting after the row identified by cursor (see seek_keyset()).
+
+    Rows are found by seeking to the cursor, not by OFFSET, so each page costs
+    the same however deep it is, given an index on (date_field, id).
+    """
+    # Fetch one extra row to find out whether there is a next page.
+    items = list(seek_keyset(queryset, date_field, cursor)[: page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last: Model = items[-1]
+        next_cursor = encode_cursor(getattr(last, date_field), last.pk)
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections.abc import Iterable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from django.conf import settings
+from django.db.models import QuerySet
+from shortlinks.link_cache import RESOLVED_LINK_FIELDS, ResolvedLink
+from shortlinks.models import Link
+from shortlinks.snapshot import LinkSnapshot
+
+
+def split_segments(path: str) -> list[str]:
+    """Return the non-empty segments of a URL path."""
+    return [segment for segment in path.split("/") if segment]
+
+
+def get_wildcard_error(short_path: str) -> str | None:
+    """Return why short_path is not a valid short path for wildcards,
+    or None if it is valid.  "*" may only be used as the last segment
+    of a prefix link, which needs at least one other segment and no
+    query string.
+    """
+    if "*" not in short_path:
+        return None
+    if short_path.count("*") > 1 or not short_path.endswith(Link.PREFIX_SUFFIX):
+        return '"*" can only be used at the end of a short path, after "/"'
+    if "?" in short_path:
+        return "A short path ending in /* cannot have a query string"
+    if not split_segments(short_path.removesuffix(Link.PREFIX_SUFFIX)):
+        return "A short path ending in /* must start with at least one segment"
+    return None
+
+
+def expand_target(target_url: str, remainder: str, query_string: str) -> str:
+    """Return target_url with remainder (the rest of the requested path)
+    appended to its path, and any query parameters from query_string it does
+    not already have added: the link's own parameters take precedence.
+    """
+    parts = urlsplit(target_url)
+    path = parts.path
+    if remainder:
+        path = f"{path.rstrip('/')}/{remainder}"
+    query = parts.query
+    own_names = {name for name, _ in parse_qsl(query, keep_blank_values=True)}
+    extra = [
+        (name, value)
+        for name, value in parse_qsl(query_string, keep_blank_values=True)
+        if name not in own_names
+    ]
+    if extra:
+        query = f"{query}&{urlencode(extra)}" if query else urlencode(extra)
+    return urlunsplit(parts._replace(path=path, query=query))
+
+
+class PrefixMatcher:
+    """Trie of prefix links, keyed by path segment, so the cost of a lookup
+    depends on the number of segments in the requested path, not on the
+    number of prefix links.
+    """
+
+    # Key under which a trie node stores the ResolvedLink ending there;
+    # segment keys are always non-empty strings.
+    LINK = None
+
+    def __init__(self, links: Iterable[tuple[str, ResolvedLink]]) -> None:
+        """links: (short path, ResolvedLink) of each prefix link."""
+        self._root: dict = {}
+        self.count = 0
+        for short_path, resolved in links:
+            node = self._root
+            prefix = short_path.removesuffix(Link.PREFIX_SUFFIX)
+            for segment in split_segments(prefix):
+                node = node.setdefault(segment, {})
+            # Keep the first link if prefixes are duplicated.
+            if node.setdefault(self.LINK, resolved) is resolved:
+                self.count += 1
+
+    def match(self, path: str) -> tuple[ResolvedLink, str] | None:
+        """Return the longest prefix link matching path, and the rest of path
+        after the prefix; or None if no prefix link matches.
+        """
+        segments = split_segments(path)
+        node = self._root
+        best = None
+        for position, segment in enumerate(segments):
+            if self.LINK in node:
+                best = (node[self.LINK], position)
+            node = node.get(segment)
+            if node is None:
+                break
+        else:
+            if self.LINK in node:
+                best = (node[self.LINK], len(segments))
+        if best is None:
+            return None
+        resolved, position = best
+        return resolved, "/".join(segments[position:])
+
+    def resolve(self, short_path: str) -> ResolvedLink | None:
+        """Return the link for a short path (path and query string) matched by
+        a prefix link, with its target URL expanded; or None if none matches.
+        """
+        path, _, query_string = short_path.partition("?")
+        matched = self.match(path)
+        if matched is None:
+            return None
+        resolved, remainder = matched
+        return resolved._replace(
+            target_url=expand_target(resolved.target_url, remainder, query_string)
+        )
+
+
+class PrefixLinks:
+    """The current PrefixMatcher for this process.
+
+    One is built from the link snapshot, and rebuilt whenever a new snapshot
+    is mapped; another from the database, for lookups the snapshot can't
+    answer.  Changes made in this process clear the database one immediately,
+    others when it expires after ttl seconds.  Each is kept whichever the
+    other is used, so alternating between them never rebuilds either.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot_matcher: PrefixMatcher | None = None
+        self._source: LinkSnapshot | None = None
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget the matcher built from the database."""
+        self._matcher: PrefixMatcher | None = None
+        self._expires = 0.0
+
+    def for_snapshot(self, snapshot: LinkSnapshot) -> PrefixMatcher:
+        """Return the matcher for the prefix links in snapshot."""
+        with self._lock:
+            if self._source is not snapshot:
+                self._snapshot_matcher = PrefixMatcher(snapshot.prefix_links())
+                self._source = snapshot
+            return self._snapshot_matcher
+
+    def _get_unexpired(self) -> PrefixMatcher | None:
+        with self._lock:
+            if self._expires > time.monotonic():
+                return self._matcher
+            return None
+
+    def _set(self, rows: list[tuple]) -> PrefixMatcher:
+        matcher = PrefixMatcher((row[0], ResolvedLink(*row[1:])) for row in rows)
+        with self._lock:
+            self._matcher = matcher
+            self._expires = time.monotonic() + self.ttl
+        return matcher
+
+    def _get_rows(self) -> QuerySet:
+        return (
+            Link.objects.filter(short_path__endswith=Link.PREFIX_SUFFIX)
+            .order_by("id")
+            .values_list("short_path", *RESOLVED_LINK_FIELDS)
+        )
+
+    def get(self) -> PrefixMatcher:
+        """Return the matcher for the prefix links in the database,
+        querying them if not already loaded.
+        """
+        matcher = self._get_unexpired()
+        if matcher is None:
+            matcher = self._set(list(self._get_rows()))
+        return matcher
+
+    async def aget(self) -> PrefixMatcher:
+        """Async version of get()."""
+        matcher = self._get_unexpired()
+        if matcher is None:
+            matcher = self._set([row async for row in self._get_rows()])
+        return matcher
+
+
+prefix_links = PrefixLinks(settings.LINK_CACHE_TTL)
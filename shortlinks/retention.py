@@ -0,0 +1,71 @@
+import gzip
+import logging
+import os
+from datetime import datetime
+from itertools import groupby
+from django.db import transaction
+from django.utils import timezone
+from shortlinks.dimensions import with_dimension_values
+from shortlinks.exports import stream_rows
+from shortlinks.models import RollupState, UsageStat
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = [
+    "id",
+    "link_id",
+    "client_ip",
+    "query_string",
+    "referrer",
+    "user_agent",
+    "hit_count",
+    # Last, for grouping rows by month.
+    "usage_date",
+]
+
+
+def get_archive_path(archive_dir: str, usage_date: datetime) -> str:
+    """Return the archive file for a usage date: one gzipped JSON Lines file per
+    (local) month.
+    """
+    month = timezone.localtime(usage_date).strftime("%Y-%m")
+    return os.path.join(archive_dir, f"usage_stats-{month}.jsonl.gz")
+
+
+def purge_usage_stats(
+    cutoff: datetime, archive_dir: str | None, chunk_size: int = 5000
+) -> int:
+    """Delete UsageStat rows older than cutoff, chunk_size rows per transaction,
+    so no lock is held for long.  Unless archive_dir is None, each chunk is first
+    appended to monthly archive files there.
+    Only rows already summarized into DailyUsage are removed, so daily totals
+    are kept.  Returns the number of rows deleted.
+    """
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+    state = RollupState.objects.first()
+    rolled_up_id = state.last_usage_stat_id if state else 0
+    old_stats = UsageStat.objects.filter(usage_date__lt=cutoff, id__lte=rolled_up_id)
+    deleted = 0
+    while True:
+        rows = list(
+            with_dimension_values(old_stats)
+            .order_by("usage_date", "id")
+            .values_list(*ARCHIVE_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            break
+        if archive_dir:
+            # Rows are in date order, so each month's rows are contiguous.
+            for path, month_rows in groupby(
+                rows, key=lambda row: get_archive_path(archive_dir, row[-1])
+            ):
+                # Appending adds a new gzip member; gzip readers handle these.
+                with gzip.open(path, "at", encoding="utf-8") as f:
+                    f.writelines(stream_rows(month_rows, ARCHIVE_FIELDS, "jsonl"))
+        with transaction.atomic():
+            UsageStat.objects.filter(id__in=[row[0] for row in rows]).delete()
+        deleted += len(rows)
+        logger.debug(f"Purged {deleted} usage stats older than {cutoff}")
+    logger.info(f"Purged {deleted} usage stats older than {cutoff}")
+    return deleted
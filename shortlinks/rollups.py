@@ -0,0 +1,113 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from shortlinks.models import DailyUsage, RollupState, UsageStat
+
+logger = logging.getLogger(__name__)
+
+# Limit on link ids per IN clause.
+LINK_CHUNK_SIZE = 500
+
+
+def get_rollup_state() -> RollupState:
+    """Return the single RollupState row, creating it if needed."""
+    state, _ = RollupState.objects.get_or_create(pk=1)
+    return state
+
+
+def roll_up_usage(batch_size: int | None = None, lag: float | None = None) -> int:
+    """Summarize UsageStat rows added since the last run into DailyUsage.
+
+    New rows are read in batches of batch_size (default
+    USAGE_ROLLUP_BATCH_SIZE), by id.  Each batch only identifies which
+    (link, day) pairs changed; those pairs are then recomputed from that day's
+    raw rows, so history is never rescanned.
+
+    Processes in several workers commit their batches out of id order, so a
+    row with a lower id can appear after a higher one has been rolled up.  Rows
+    are written within USAGE_DEDUP_WINDOW + USAGE_STATS_FLUSH_INTERVAL seconds
+    of use, so the run stops at the most recent row used more than lag seconds
+    (default USAGE_ROLLUP_LAG) ago: every row with a lower id has committed.
+    Returns the number of UsageStat rows processed.
+    """
+    if batch_size is None:
+        batch_size = settings.USAGE_ROLLUP_BATCH_SIZE
+    if lag is None:
+        lag = settings.USAGE_ROLLUP_LAG
+    state = get_rollup_state()
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    max_id = (
+        UsageStat.objects.filter(usage_date__lte=cutoff)
+        .order_by("-usage_date")
+        .values_list("id", flat=True)
+        .first()
+    ) or 0
+    processed = 0
+    while state.last_usage_stat_id < max_id:
+        batch_end = min(state.last_usage_stat_id + batch_size, max_id)
+        new_stats = UsageStat.objects.filter(
+            id__gt=state.last_usage_stat_id, id__lte=batch_end
+        )
+        changed = (
+            new_stats.annotate(day=TruncDate("usage_date"))
+            .values_list("day", "link_id")
+            .distinct()
+        )
+        links_by_day = defaultdict(set)
+        for day, link_id in changed:
+            links_by_day[day].add(link_id)
+
+        with transaction.atomic():
+            for day, link_ids in links_by_day.items():
+                _summarize_day(day, sorted(link_ids))
+            processed += new_stats.count()
+            state.last_usage_stat_id = batch_end
+            state.updated = timezone.now()
+            state.save()
+        logger.debug(f"Rolled up usage through UsageStat id {batch_end}")
+    return processed
+
+
+def _summarize_day(day: date, link_ids: list[int]) -> None:
+    """Recompute DailyUsage rows for the given links on the given local day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    for i in range(0, len(link_ids), LINK_CHUNK_SIZE):
+        chunk = link_ids[i : i + LINK_CHUNK_SIZE]
+        day_stats = UsageStat.objects.filter(
+            link_id__in=chunk, usage_date__gte=start, usage_date__lt=end
+        )
+        totals = day_stats.values("link_id").annotate(
+            hits=Sum("hit_count"), ips=Count("client_ip", distinct=True)
+        )
+        referrers = defaultdict(list)
+        referrer_counts = (
+            day_stats.filter(referrer_ref__isnull=False)
+            .values_list("link_id", "referrer_ref__value")
+            .annotate(hits=Sum("hit_count"))
+            .order_by("link_id", "-hits")
+        )
+        for link_id, referrer, hits in referrer_counts:
+            if len(referrers[link_id]) < settings.USAGE_ROLLUP_TOP_REFERRERS:
+                referrers[link_id].append([referrer, hits])
+
+        DailyUsage.objects.bulk_create(
+            [
+                DailyUsage(
+                    link_id=row["link_id"],
+                    day=day,
+                    hit_count=row["hits"],
+                    unique_ips=row["ips"],
+                    top_referrers=referrers[row["link_id"]],
+                )
+                for row in totals
+            ],
+            update_conflicts=True,
+            unique_fields=["link", "day"],
+            update_fields=["hit_count", "unique_ips", "top_referrers"],
+        )
@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from shortlinks.link_cache import link_cache, miss_cache
+from shortlinks.models import Link
+from shortlinks.prefix_matcher import prefix_links
+from shortlinks.search import link_search
+from shortlinks.snapshot import bump_link_version, snapshot_manager
+from shortlinks.usage_dedup import sample_rates
+
+
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+def link_changed(sender, **kwargs) -> None:
+    """Invalidate cached redirect data when any Link is saved or deleted.
+    Links change rarely, so clearing everything is simpler than tracking
+    old and new short paths.
+    Other processes see the new LinkVersion and rebuild the link snapshot.
+    """
+    link_cache.clear()
+    miss_cache.clear()
+    prefix_links.clear()
+    link_search.clear()
+    sample_rates.clear()
+    bump_link_version()
+    transaction.on_commit(snapshot_manager.request_refresh)
@@ -0,0 +1,359 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Iterator
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from shortlinks.link_cache import RESOLVED_LINK_FIELDS, ResolvedLink
+from shortlinks.models import Link, LinkVersion
+
+logger = logging.getLogger(__name__)
+
+# File layout: header, then a Bloom filter of all short paths, then one index
+# entry per link sorted by short path (as UTF-8 bytes), then the numbers of the
+# entries for prefix links, then the short path and target URL strings.
+MAGIC = b"LSNP"
+FORMAT_VERSION = 4
+# magic, format version, link table version, entry count,
+# Bloom filter size in bits, number of Bloom filter hashes, prefix link count
+HEADER = struct.Struct("<4sIQIQII")
+# short path offset and length, target URL offset and length, link id,
+# redirect type, cache max age (NO_MAX_AGE if null)
+ENTRY = struct.Struct("<IIIIQHI")
+NO_MAX_AGE = 0xFFFFFFFF
+PREFIX_ENTRY = struct.Struct("<I")
+# About 1% false positives.
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+
+def get_bloom_positions(key: bytes, bit_count: int, hash_count: int) -> list[int]:
+    """Return the Bloom filter bits for key (double hashing of one digest,
+    so the same in every process, unlike hash()).
+    """
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bit_count for i in range(hash_count)]
+
+
+def get_link_version() -> int:
+    """Return the current LinkVersion counter."""
+    return (
+        LinkVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+    )
+
+
+def bump_link_version() -> None:
+    """Record that Link has changed."""
+    if not LinkVersion.objects.filter(pk=1).update(version=F("version") + 1):
+        LinkVersion.objects.get_or_create(pk=1, defaults={"version": 1})
+
+
+def build_snapshot(path: str, version: int) -> int:
+    """Write all links to a new snapshot file at path, replacing any existing
+    file atomically.  version should be read before the links, so any change
+    made while building leaves the snapshot marked out of date.
+    Returns the number of links written.
+    """
+    links = {}
+    rows = Link.objects.order_by("-id").values_list("short_path", *RESOLVED_LINK_FIELDS)
+    # Lowest id wins if short paths are duplicated, as in resolve_short_path().
+    for short_path, *fields in rows.iterator(chunk_size=5000):
+        links[short_path.encode()] = ResolvedLink(*fields)
+    keys = sorted(links)
+
+    # Whole bytes, at least 64 bits.
+    bloom_bits = max(64, (len(keys) * BLOOM_BITS_PER_KEY + 7) // 8 * 8)
+    bloom = bytearray(bloom_bits // 8)
+    for key in keys:
+        for position in get_bloom_positions(key, bloom_bits, BLOOM_HASHES):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    prefix_index = bytearray()
+    suffix = Link.PREFIX_SUFFIX.encode()
+    for number, key in enumerate(keys):
+        if key.endswith(suffix):
+            prefix_index += PREFIX_ENTRY.pack(number)
+
+    strings_start = (
+        HEADER.size + len(bloom) + ENTRY.size * len(keys) + len(prefix_index)
+    )
+    index = bytearray()
+    strings = bytearray()
+    for key in keys:
+        resolved = links[key]
+        target_url = resolved.target_url.encode()
+        key_offset = strings_start + len(strings)
+        strings += key
+        url_offset = strings_start + len(strings)
+        strings += target_url
+        index += ENTRY.pack(
+            key_offset,
+            len(key),
+            url_offset,
+            len(target_url),
+            resolved.link_id,
+            resolved.redirect_type,
+            (
+                NO_MAX_AGE
+                if resolved.cache_max_age is None
+                # Larger values, saved before the bound, would not fit the entry.
+                else min(resolved.cache_max_age, Link.MAX_CACHE_MAX_AGE)
+            ),
+        )
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                version,
+                len(keys),
+                bloom_bits,
+                BLOOM_HASHES,
+                len(prefix_index) // PREFIX_ENTRY.size,
+            )
+        )
+        f.write(bloom)
+        f.write(index)
+        f.write(prefix_index)
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return len(keys)
+
+
+def read_snapshot_version(path: str) -> int | None:
+    """Return the link version of the snapshot file at path,
+    or None if it is missing or not a usable snapshot.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, format_version, version, *_ = HEADER.unpack(header)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        return None
+    return version
+
+
+class LinkSnapshot:
+    """Read-only, memory-mapped snapshot of the Link table.
+    Pages are shared by every process mapping the same file.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            format_version,
+            self.version,
+            self.count,
+            self.bloom_bits,
+            self.bloom_hashes,
+            self.prefix_count,
+        ) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a link snapshot")
+        self.index_start = HEADER.size + self.bloom_bits // 8
+        self.prefix_index_start = self.index_start + self.count * ENTRY.size
+
+    def might_contain(self, short_path: str) -> bool:
+        """Return False if short_path is certainly not in the snapshot,
+        checking only the Bloom filter.
+        """
+        for position in get_bloom_positions(
+            short_path.encode(), self.bloom_bits, self.bloom_hashes
+        ):
+            if not self._map[HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def _get_entry(self, number: int) -> tuple:
+        return ENTRY.unpack_from(self._map, self.index_start + number * ENTRY.size)
+
+    def _get_resolved(self, entry: tuple) -> ResolvedLink:
+        _, _, url_offset, url_length, link_id, redirect_type, max_age = entry
+        return ResolvedLink(
+            self._map[url_offset : url_offset + url_length].decode(),
+            link_id,
+            redirect_type,
+            None if max_age == NO_MAX_AGE else max_age,
+        )
+
+    def lookup(self, short_path: str) -> ResolvedLink | None:
+        """Binary search for short_path; return its ResolvedLink, or None."""
+        key = short_path.encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._get_entry(middle)
+            key_offset, key_length = entry[:2]
+            candidate = self._map[key_offset : key_offset + key_length]
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return self._get_resolved(entry)
+        return None
+
+    def prefix_links(self) -> Iterator[tuple[str, ResolvedLink]]:
+        """Yield the short path and ResolvedLink of each prefix link."""
+        for (number,) in PREFIX_ENTRY.iter_unpack(
+            self._map[
+                self.prefix_index_start : self.prefix_index_start
+                + self.prefix_count * PREFIX_ENTRY.size
+            ]
+        ):
+            entry = self._get_entry(number)
+            key_offset, key_length = entry[:2]
+            short_path = self._map[key_offset : key_offset + key_length].decode()
+            yield short_path, self._get_resolved(entry)
+
+
+class SnapshotManager:
+    """Keep a process's LinkSnapshot current.
+
+    A background thread checks LinkVersion every check_interval seconds (or at
+    once, after a change in this process).  If the snapshot file is out of date,
+    one process rebuilds it, under a file lock; every process then maps the new
+    file.  The thread keeps its own database connection open between checks,
+    rather than connecting every check_interval.
+    Lookups never touch the database while is_current(): until the next check,
+    paths not in the snapshot do not exist.
+    """
+
+    def __init__(self, path: str, check_interval: float) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.started = False
+        self.snapshot: LinkSnapshot | None = None
+        # LinkVersion when last checked, or None before the first check.
+        self.link_version: int | None = None
+        # Refreshes requested, and how many of them the last refresh covered.
+        self._requested = 0
+        self._refreshed = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start using snapshots in this process (and any forked from it).
+        Maps the current snapshot file, if there is one; lookups fall back to
+        the database until a snapshot is available.
+        """
+        self.started = True
+        self._map_file()
+
+    def get_snapshot(self) -> LinkSnapshot | None:
+        """Return the current snapshot, or None if not started or not yet built."""
+        if not self.started:
+            return None
+        if self._pid != os.getpid() or self._thread is None:
+            self._start_thread()
+        return self.snapshot
+
+    def request_refresh(self) -> None:
+        """Check for changes now, rather than at the next interval.
+        Until then, the snapshot is not current.
+        """
+        self._requested += 1
+        self._wake.set()
+
+    def is_current(self, snapshot: LinkSnapshot) -> bool:
+        """Return True if snapshot has the links as of the last check, and no
+        change in this process has been made since.
+        """
+        return (
+            self._refreshed == self._requested and snapshot.version == self.link_version
+        )
+
+    def refresh(self) -> None:
+        """Rebuild the snapshot file if its version differs from LinkVersion,
+        and map the file if it has changed.
+        """
+        requested = self._requested
+        version = get_link_version()
+        file_version = read_snapshot_version(self.path)
+        if file_version != version:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Another process may have rebuilt it while we waited.
+                version = get_link_version()
+                file_version = read_snapshot_version(self.path)
+                if file_version != version:
+                    count = build_snapshot(self.path, version)
+                    logger.info(f"Built link snapshot version {version}: {count} links")
+        self._map_file()
+        self.link_version = version
+        self._refreshed = requested
+
+    def _map_file(self) -> None:
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self.snapshot is None or self.snapshot.inode != inode:
+            try:
+                self.snapshot = LinkSnapshot(self.path)
+            except (OSError, ValueError):
+                logger.exception(f"Unable to map link snapshot {self.path}")
+
+    def _start_thread(self) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's thread does not exist here.
+                self._reset()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="link-snapshot", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop using snapshots in this process, and stop the background
+        thread, closing its database connection.
+        """
+        self.started = False
+        if self._pid == os.getpid() and self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._reset()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Unable to refresh link snapshot")
+                # Reconnect next time, in case the connection was lost.
+                connection.close()
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+        connection.close()
+
+
+snapshot_manager = SnapshotManager(
+    settings.LINK_SNAPSHOT_PATH, settings.LINK_SNAPSHOT_CHECK_INTERVAL
+)
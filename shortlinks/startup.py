@@ -0,0 +1,134 @@
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.utils import timezone
+from shortlinks.link_cache import RESOLVED_LINK_FIELDS, ResolvedLink, link_cache
+from shortlinks.models import DailyUsage, Link
+from shortlinks.prefix_matcher import prefix_links
+from shortlinks.snapshot import snapshot_manager
+
+logger = logging.getLogger(__name__)
+
+# Without a link snapshot, the links most used in this many recent days
+# are loaded into the link cache.
+WARM_UP_USAGE_DAYS = 7
+
+
+class StartupTimer:
+    """Times the phases of starting the application, and the first redirect
+    served by each process, for the log.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.phases: dict[str, float] = {}
+        self.first_redirect: float | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.monotonic() - start
+
+    def log_phases(self) -> None:
+        phases = ", ".join(
+            f"{name} {seconds:.3f}s" for name, seconds in self.phases.items()
+        )
+        total = time.monotonic() - self.started
+        logger.info(f"Started in {total:.3f}s: {phases}")
+
+    def record_first_redirect(self, elapsed: float) -> None:
+        """Log the first redirect served by this process (or any forked from
+        it): how long it took, and how long after startup it came.
+        """
+        if self.first_redirect is not None:
+            return
+        self.first_redirect = elapsed
+        logger.info(
+            f"First redirect in process {os.getpid()} took {elapsed * 1000:.1f}ms, "
+            f"{time.monotonic() - self.started:.3f}s after startup"
+        )
+
+
+startup_timer = StartupTimer()
+
+
+def get_unapplied_migrations() -> list:
+    """Return the migrations not yet applied to the database, in order."""
+    executor = MigrationExecutor(connection)
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def warm_link_cache() -> int:
+    """Load the links most used in recent days into the link cache.
+    Returns the number of links loaded.
+    """
+    since = timezone.localdate() - timedelta(days=WARM_UP_USAGE_DAYS)
+    top_link_ids = list(
+        DailyUsage.objects.filter(day__gte=since)
+        .values("link_id")
+        .annotate(hits=Sum("hit_count"))
+        .order_by("-hits")
+        .values_list("link_id", flat=True)[: link_cache.max_size]
+    )
+    rows = (
+        Link.objects.filter(id__in=top_link_ids)
+        .exclude(short_path__endswith=Link.PREFIX_SUFFIX)
+        # Lowest id last, so it wins if short paths are duplicated.
+        .order_by("-id")
+        .values_list("short_path", *RESOLVED_LINK_FIELDS)
+    )
+    count = 0
+    for short_path, *fields in rows:
+        link_cache.set(short_path, ResolvedLink(*fields))
+        count += 1
+    return count
+
+
+def warm_up() -> None:
+    """Load link lookup data: the link snapshot, if enabled, or else the most
+    used links; and the prefix link matcher.
+    """
+    if snapshot_manager.started:
+        snapshot_manager.refresh()
+        snapshot = snapshot_manager.snapshot
+        if snapshot is not None:
+            prefix_links.for_snapshot(snapshot)
+            logger.info(f"Warmed up link snapshot: {snapshot.count} links")
+    else:
+        count = warm_link_cache()
+        prefix_links.get()
+        logger.info(f"Warmed up link cache: {count} links")
+
+
+def prepare_application(started: float) -> None:
+    """Check and warm up the application once it is loaded, before it serves
+    requests, logging the time taken by each phase since started (when the
+    application module began loading).
+
+    When gunicorn preloads the application, this runs once in the master
+    process, and workers are forked with the data already loaded.
+    """
+    startup_timer.started = started
+    startup_timer.phases["imports"] = time.monotonic() - started
+    with startup_timer.phase("migrations_check"):
+        unapplied = get_unapplied_migrations()
+    if unapplied:
+        logger.warning(f"{len(unapplied)} database migrations have not been applied")
+    with startup_timer.phase("warm_up"):
+        try:
+            warm_up()
+        except Exception:
+            # Lookups load data on demand anyway.
+            logger.exception("Warm-up failed")
+    # Workers must not share the master's database connections.
+    connections.close_all()
+    startup_timer.log_phases()
@@ -0,0 +1,329 @@
+import http.client
+import logging
+import queue
+import ssl
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple
+from urllib.parse import quote, urlsplit
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from shortlinks.models import Link, TargetCheck
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "link-shortener-target-check/1.0"
+# Statuses meaning the server does not support HEAD, so GET is tried instead.
+HEAD_NOT_SUPPORTED = {405, 501}
+# At most this much of a GET response body is read to keep its connection
+# open for the next request; a longer body closes the connection instead.
+MAX_DRAIN_BYTES = 256 * 1024
+# Results saved per bulk insert.
+SAVE_BATCH_SIZE = 500
+# Characters left as-is when quoting a target's path and query string.
+URL_SAFE_CHARS = "!#$%&'()*+,/:;=?@[]~"
+
+
+class CheckRequest(NamedTuple):
+    """A target URL to check, with validators from its last full response."""
+
+    url: str
+    etag: str = ""
+    last_modified: str = ""
+
+
+class CheckResult(NamedTuple):
+    url: str
+    # None if no response was received.
+    status_code: int | None
+    error: str
+    latency_ms: int | None
+    etag: str
+    last_modified: str
+
+
+class RateLimiter:
+    """Spaces out calls to wait(), from any number of threads, so they
+    return at most rate times per second.  rate <= 0 means no limit.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def get_host_key(url: str) -> tuple[str, str, int | None]:
+    """Return (scheme, host, port) of url: requests with the same key can
+    share a connection and count towards the same rate limit.
+    """
+    parts = urlsplit(url)
+    return parts.scheme.lower(), (parts.hostname or "").lower(), parts.port
+
+
+class HostChecker:
+    """Checks URLs on one host, one at a time, reusing a keep-alive connection."""
+
+    def __init__(self, host_key: tuple[str, str, int | None], timeout: float) -> None:
+        self.scheme, host, self.port = host_key
+        self.host = host.encode("idna").decode("ascii") if host else host
+        self.timeout = timeout
+        self._connection: http.client.HTTPConnection | None = None
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host,
+                self.port,
+                timeout=self.timeout,
+                context=ssl.create_default_context(),
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(
+        self, method: str, target: str, headers: dict
+    ) -> http.client.HTTPResponse:
+        """Send a request and return the response, with its body read (or
+        the connection closed if the body is too long to read).
+        """
+        reused = self._connection is not None and self._connection.sock is not None
+        if self._connection is None:
+            self._connection = self._connect()
+        try:
+            self._connection.request(method, target, headers=headers)
+            response = self._connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # The server may have closed an idle keep-alive connection.
+            self.close()
+            if not reused:
+                raise
+            return self._request(method, target, headers)
+        remaining = MAX_DRAIN_BYTES
+        while remaining > 0:
+            chunk = response.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        if not response.isclosed():
+            self.close()
+        return response
+
+    def check(self, request: CheckRequest) -> CheckResult:
+        """Request request.url (HEAD, or GET if HEAD is not supported),
+        conditionally if there are validators, and return the result.
+        """
+        parts = urlsplit(request.url)
+        target = quote(parts.path or "/", safe=URL_SAFE_CHARS)
+        if parts.query:
+            target += "?" + quote(parts.query, safe=URL_SAFE_CHARS)
+        headers = {"User-Agent": USER_AGENT}
+        if request.etag:
+            headers["If-None-Match"] = request.etag
+        if request.last_modified:
+            headers["If-Modified-Since"] = request.last_modified
+        start = time.monotonic()
+        try:
+            if self.scheme not in ("http", "https") or not self.host:
+                raise ValueError(f"Cannot check URL {request.url}")
+            response = self._request("HEAD", target, headers)
+            if response.status in HEAD_NOT_SUPPORTED:
+                response = self._request("GET", target, headers)
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            self.close()
+            return CheckResult(
+                request.url,
+                None,
+                str(e) or type(e).__name__,
+                None,
+                request.etag,
+                request.last_modified,
+            )
+        latency_ms = round((time.monotonic() - start) * 1000)
+        if response.status == http.client.NOT_MODIFIED:
+            etag, last_modified = request.etag, request.last_modified
+        elif response.status < 300:
+            etag = response.getheader("ETag", "")
+            last_modified = response.getheader("Last-Modified", "")
+        else:
+            etag = last_modified = ""
+        return CheckResult(
+            request.url, response.status, "", latency_ms, etag, last_modified
+        )
+
+
+def _check_lane(
+    host_key: tuple[str, str, int | None],
+    requests: list[CheckRequest],
+    limiter: RateLimiter,
+    timeout: float,
+    report: Callable[[CheckResult], None],
+    stop: threading.Event,
+) -> None:
+    """Check requests in order on one connection, reporting each result."""
+    checker = HostChecker(host_key, timeout)
+    try:
+        for request in requests:
+            if stop.is_set():
+                return
+            limiter.wait()
+            try:
+                result = checker.check(request)
+            except Exception as e:
+                # Report every request, so check_urls() never waits forever.
+                logger.exception(f"Error checking {request.url}")
+                checker.close()
+                result = CheckResult(request.url, None, str(e), None, "", "")
+            report(result)
+    finally:
+        checker.close()
+
+
+def check_urls(
+    requests: Iterable[CheckRequest],
+    workers: int = settings.TARGET_CHECK_WORKERS,
+    timeout: float = settings.TARGET_CHECK_TIMEOUT,
+    host_rate: float = settings.TARGET_CHECK_HOST_RATE,
+    host_connections: int = settings.TARGET_CHECK_HOST_CONNECTIONS,
+) -> Iterator[CheckResult]:
+    """Check URLs concurrently, yielding results as they arrive.
+
+    Requests are grouped by host.  Each host gets up to host_connections
+    keep-alive connections, each checking its share of the host's URLs in
+    turn, and at most host_rate requests per second in total; workers
+    connections are open at once across all hosts.
+    """
+    by_host = defaultdict(list)
+    for request in requests:
+        by_host[get_host_key(request.url)].append(request)
+    results = queue.Queue()
+    stop = threading.Event()
+    total = 0
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = []
+        for host_key, host_requests in by_host.items():
+            limiter = RateLimiter(host_rate)
+            lane_count = max(1, min(host_connections, len(host_requests)))
+            for lane in range(lane_count):
+                futures.append(
+                    executor.submit(
+                        _check_lane,
+                        host_key,
+                        host_requests[lane::lane_count],
+                        limiter,
+                        timeout,
+                        results.put,
+                        stop,
+                    )
+                )
+            total += len(host_requests)
+        for _ in range(total):
+            yield results.get()
+    finally:
+        # If the caller stops early, unchecked requests are abandoned.
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def get_check_requests(
+    checked_before: datetime | None = None,
+) -> tuple[list[CheckRequest], dict[str, list[int]]]:
+    """Return a request for each distinct target URL of links not checked
+    since checked_before (or all links, if None), and the ids of the links
+    with each target URL.
+    """
+    links = Link.objects.all()
+    if checked_before is not None:
+        links = links.filter(
+            Q(target_check__isnull=True) | Q(target_check__checked__lt=checked_before)
+        )
+    link_ids = defaultdict(list)
+    validators = {}
+    for link_id, url, checked_url, etag, last_modified in links.values_list(
+        "id",
+        "target_url",
+        "target_check__target_url",
+        "target_check__etag",
+        "target_check__last_modified",
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        link_ids[url].append(link_id)
+        # Validators only apply to the URL they came from.
+        if checked_url == url and (etag or last_modified):
+            validators[url] = (etag, last_modified)
+    requests = [CheckRequest(url, *validators.get(url, ("", ""))) for url in link_ids]
+    return requests, link_ids
+
+
+def save_results(results: list[CheckResult], link_ids: dict[str, list[int]]) -> None:
+    """Save the TargetCheck of each link with a checked target URL."""
+    checked = timezone.now()
+    TargetCheck.objects.bulk_create(
+        [
+            TargetCheck(
+                link_id=link_id,
+                target_url=result.url,
+                status_code=result.status_code,
+                error=result.error[:1000],
+                latency_ms=result.latency_ms,
+                checked=checked,
+                etag=result.etag,
+                last_modified=result.last_modified,
+            )
+            for result in results
+            for link_id in link_ids[result.url]
+        ],
+        update_conflicts=True,
+        unique_fields=["link"],
+        update_fields=[
+            "target_url",
+            "status_code",
+            "error",
+            "latency_ms",
+            "checked",
+            "etag",
+            "last_modified",
+        ],
+    )
+
+
+def check_targets(checked_before: datetime | None = None, **options) -> dict:
+    """Check the target URLs of links not checked since checked_before
+    (or all links, if None) and save the results, a batch at a time as they
+    arrive.  options are passed to check_urls().
+    Returns counts of URLs and links checked, and of broken URLs.
+    """
+    requests, link_ids = get_check_requests(checked_before)
+    counts = {"urls": len(requests), "links": 0, "broken": 0}
+    batch = []
+    for result in check_urls(requests, **options):
+        batch.append(result)
+        counts["links"] += len(link_ids[result.url])
+        if result.status_code is None or result.status_code >= 400:
+            counts["broken"] += 1
+            logger.info(
+                f"Broken target {result.url}: {result.status_code or result.error}"
+            )
+        if len(batch) >= SAVE_BATCH_SIZE:
+            save_results(batch, link_ids)
+            batch = []
+    if batch:
+        save_results(batch, link_ids)
+    return counts
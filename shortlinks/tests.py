@@ -1,8 +1,113 @@
+import gzip
+import io
+import json
+import logging
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
-from shortlinks.models import Link, UsageStat
-from shortlinks.views_utils import format_short_path, get_links, get_short_link
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished, request_started
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import Count, QuerySet
+from django.http import Http404
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+from shortlinks.api import create_api_token
+from shortlinks.benchmark import (
+    asgi_get,
+    benchmark_prefix_matcher,
+    get_asgi_scope,
+    get_scenarios,
+    get_wsgi_environ,
+    percentile,
+    run_scenario,
+    seed_data,
+)
+from shortlinks.datasets import generate_dataset
+from shortlinks.dimensions import (
+    classify_user_agent,
+    create_usage_stats,
+    referrers,
+    user_agents,
+)
+from shortlinks.exports import (
+    USAGE_EXPORT_FIELDS,
+    aiterate,
+    astream_rows,
+    get_usage_export_rows,
+)
+from shortlinks.fast_redirect import (
+    AsyncFastRedirectApplication,
+    FastRedirectApplication,
+)
+from shortlinks.link_cache import (
+    RESOLVED_LINK_FIELDS,
+    LinkCache,
+    ResolvedLink,
+    link_cache,
+    miss_cache,
+)
+from shortlinks.link_deletion import purge_deleted_links, tombstone_link
+from shortlinks.link_import import import_links, read_rows
+from shortlinks.log_handlers import (
+    JsonFormatter,
+    QueuedFileHandler,
+    SharedRotatingFileHandler,
+    get_log_segments,
+)
+from shortlinks.log_utils import read_log_since, reverse_lines, tail_log
+from shortlinks.metrics import EXITED_FILE_NAME, Metrics, metrics
+from shortlinks.models import (
+    ApiToken,
+    DailyUsage,
+    Link,
+    LinkDeletion,
+    Referrer,
+    TargetCheck,
+    UsageStat,
+    UserAgent,
+)
+from shortlinks.forms import LinkForm
+from shortlinks.pagination import paginate_keyset, seek_keyset
+from shortlinks.prefix_matcher import PrefixMatcher, expand_target, prefix_links
+from shortlinks.retention import purge_usage_stats
+from shortlinks.snapshot import (
+    LinkSnapshot,
+    SnapshotManager,
+    build_snapshot,
+    bump_link_version,
+    get_link_version,
+)
+from shortlinks.rollups import roll_up_usage
+from shortlinks.search import filter_links, link_search, search_links
+from shortlinks.startup import StartupTimer, prepare_application, warm_up
+from shortlinks.target_checks import (
+    CheckRequest,
+    HostChecker,
+    RateLimiter,
+    check_targets,
+)
+from shortlinks.usage_dedup import UsageDeduplicator
+from shortlinks.usage_writer import UsageStatWriter, usage_writer
+from shortlinks.views import aredirect_link
+from shortlinks.views_utils import (
+    format_short_path,
+    get_cache_control,
+    get_links,
+    get_short_link,
+    load_short_path,
+    resolve_short_path,
+)
 
 
 class LinkTest(TestCase):
@@ -38,6 +143,9 @@ class LinkTest(TestCase):
         self.assertEqual(expected_short_link, link.short_link)
 
 
+# Write usage stats inline, since the background writer thread
+# cannot see data inside the test transaction.
+@override_settings(USAGE_STATS_BUFFERED=False)
 class RedirectTest(TestCase):
     fixtures = ["sample_data.json"]
 
@@ -58,6 +166,7 @@ class RedirectTest(TestCase):
         self.assertEqual(response.headers["Referer"], short_link)
 
 
+@override_settings(USAGE_STATS_BUFFERED=False)
 class UsageStatTest(TestCase):
     fixtures = ["sample_data.json"]
 
@@ -86,3 +195,1737 @@ class UsageStatTest(TestCase):
         stat = UsageStat.objects.last()
         # Query string itself does not start with "?".
         self.assertEqual(stat.query_string, "campaign=linklister&tracking=evil")
+
+
+class LinkCacheTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        link_cache.clear()
+
+    def test_hot_link_needs_no_query(self):
+        # First lookup populates the cache, second is served from it.
+        resolve_short_path("/lib")
+        with self.assertNumQueries(0):
+            resolved = resolve_short_path("/lib")
+        self.assertEqual(resolved.target_url, "https://www.library.ucla.edu/")
+
+    def test_cache_is_invalidated_on_save(self):
+        resolve_short_path("/lib")
+        link = Link.objects.get(short_path="/lib")
+        link.target_url = "https://example.com/"
+        link.save()
+        self.assertEqual(resolve_short_path("/lib").target_url, link.target_url)
+
+    def test_cache_is_invalidated_on_delete(self):
+        resolve_short_path("/lib")
+        Link.objects.get(short_path="/lib").delete()
+        self.assertIsNone(resolve_short_path("/lib"))
+
+    def test_misses_are_cached(self):
+        miss_cache.clear()
+        self.assertIsNone(resolve_short_path("/wp-login.php"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_short_path("/wp-login.php"))
+        Link.objects.create(
+            short_path="/wp-login.php",
+            target_url="https://example.com/",
+            created_by_id=2,
+        )
+        self.assertIsNotNone(resolve_short_path("/wp-login.php"))
+
+    def test_cache_is_bounded(self):
+        cache = LinkCache(max_size=2, ttl=60)
+        for link_id in range(3):
+            cache.set(f"/{link_id}", ResolvedLink("https://example.com/", link_id))
+        # Least recently used entry was evicted.
+        self.assertIsNone(cache.get("/0"))
+        self.assertIsNotNone(cache.get("/2"))
+        self.assertEqual(cache.stats()["size"], 2)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_entries_expire(self):
+        cache = LinkCache(max_size=2, ttl=0)
+        cache.set("/lib", ResolvedLink("https://example.com/", 1))
+        self.assertIsNone(cache.get("/lib"))
+
+
+class UsageStatWriterTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def tearDown(self):
+        user_agents.clear()
+
+    def get_record(self, link_id: int = 1) -> dict:
+        return {
+            "link_id": link_id,
+            "client_ip": "127.0.0.1",
+            "query_string": "",
+            "referrer": "",
+            "user_agent": "test",
+            "usage_date": timezone.now(),
+        }
+
+    def test_records_are_written_in_batches(self):
+        writer = UsageStatWriter(
+            batch_size=2, flush_interval=60, queue_size=10, background=False
+        )
+        for _ in range(3):
+            writer.submit(self.get_record())
+        # Nothing is written until flushed; 3 records take 2 batches.
+        self.assertEqual(UsageStat.objects.count(), 0)
+        # Known user agent, so its id is cached.
+        with self.captureOnCommitCallbacks(execute=True):
+            user_agents.get_ids(["test"])
+        with self.assertNumQueries(2):
+            writer.flush()
+        self.assertEqual(UsageStat.objects.count(), 3)
+        self.assertEqual(writer.stats()["written"], 3)
+
+    def test_uses_of_removed_links_do_not_lose_the_batch(self):
+        writer = UsageStatWriter(
+            batch_size=10, flush_interval=60, queue_size=10, background=False
+        )
+        writer.submit(self.get_record(1))
+        writer.submit(self.get_record(999))
+        # Foreign keys are only checked at commit, which tests never reach,
+        # so fail the first write as the database would.
+        with mock.patch(
+            "shortlinks.usage_writer.create_usage_stats",
+            side_effect=[IntegrityError("link"), None],
+        ) as create:
+            writer.flush()
+        self.assertEqual(
+            [record["link_id"] for record in create.call_args.args[0]], [1]
+        )
+        self.assertEqual(writer.stats()["written"], 1)
+        self.assertEqual(writer.stats()["failed"], 1)
+
+    def test_full_queue_drops_records(self):
+        writer = UsageStatWriter(
+            batch_size=10, flush_interval=60, queue_size=1, background=False
+        )
+        self.assertTrue(writer.submit(self.get_record()))
+        self.assertFalse(writer.submit(self.get_record()))
+        self.assertEqual(writer.stats()["dropped"], 1)
+
+    @override_settings(USAGE_STATS_BUFFERED=True)
+    def test_redirect_queues_usage_when_buffered(self):
+        link_cache.clear()
+        with mock.patch.object(usage_writer, "submit") as submit:
+            # Redirect itself only needs the link lookup.
+            with self.assertNumQueries(1):
+                self.client.get("/lib")
+        self.assertEqual(submit.call_args.args[0]["link_id"], 2)
+
+
+class UsageDedupTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def get_record(self, link_id: int = 1, client_ip: str = "10.0.0.1") -> dict:
+        return {
+            "link_id": link_id,
+            "client_ip": client_ip,
+            "query_string": "",
+            "referrer": "",
+            "user_agent": "test",
+            "usage_date": timezone.now(),
+        }
+
+    def test_repeated_uses_by_a_client_are_collapsed(self):
+        dedup = UsageDeduplicator(window=30, max_pending=100)
+        records = [self.get_record() for _ in range(5)]
+        records.append(self.get_record(client_ip="10.0.0.2"))
+        self.assertEqual(dedup.add(records, {}), [])
+        self.assertEqual(dedup.pop_expired(), [])
+        expired = dedup.pop_expired(time.monotonic() + 31)
+        self.assertEqual([r["hit_count"] for r in expired], [5, 1])
+        self.assertIs(expired[0], records[0])
+        self.assertEqual(dedup.collapsed, 4)
+
+    def test_sampled_link_writes_one_record_per_rate_uses(self):
+        dedup = UsageDeduplicator(window=30, max_pending=100)
+        records = [self.get_record(2, f"10.0.0.{i}") for i in range(25)]
+        ready = dedup.add(records, {2: 10})
+        self.assertEqual([r["hit_count"] for r in ready], [10, 10])
+        self.assertEqual([r["hit_count"] for r in dedup.pop_all()], [5])
+
+    def test_oldest_records_are_released_when_full(self):
+        dedup = UsageDeduplicator(window=30, max_pending=2)
+        records = [self.get_record(client_ip=f"10.0.0.{i}") for i in range(3)]
+        self.assertEqual(dedup.add(records, {}), records[:1])
+        self.assertEqual(len(dedup), 2)
+
+    def test_writer_keeps_totals_exact(self):
+        link = Link.objects.get(pk=2)
+        link.usage_sample_rate = 4
+        link.save()
+        writer = UsageStatWriter(
+            batch_size=100,
+            flush_interval=60,
+            queue_size=100,
+            background=False,
+            dedup_window=30,
+        )
+        for _ in range(50):
+            writer.submit(self.get_record(1))
+        for i in range(10):
+            writer.submit(self.get_record(2, f"10.0.0.{i}"))
+        writer.flush()
+        self.assertEqual(UsageStat.objects.filter(link_id=1).count(), 1)
+        self.assertEqual(UsageStat.objects.filter(link_id=2).count(), 3)
+        roll_up_usage(lag=0)
+        totals = dict(DailyUsage.objects.values_list("link_id", "hit_count"))
+        self.assertEqual(totals, {1: 50, 2: 10})
+        self.assertEqual(writer.stats()["collapsed"], 56)
+
+
+class DimensionTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def tearDown(self):
+        # Ids cached here belong to rows this test's rollback removes.
+        referrers.clear()
+        user_agents.clear()
+
+    def get_record(self, referrer: str, user_agent: str) -> dict:
+        return {
+            "link_id": 1,
+            "client_ip": "127.0.0.1",
+            "query_string": "",
+            "referrer": referrer,
+            "user_agent": user_agent,
+            "usage_date": timezone.now(),
+        }
+
+    def test_values_are_stored_once(self):
+        firefox = (
+            "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            create_usage_stats([self.get_record("https://example.com/", firefox)] * 3)
+        self.assertEqual(Referrer.objects.count(), 1)
+        agent = UserAgent.objects.get()
+        self.assertEqual((agent.is_bot, agent.browser), (False, "Firefox"))
+        # Cached ids: only the UsageStat insert.
+        with self.assertNumQueries(1):
+            create_usage_stats([self.get_record("https://example.com/", firefox)])
+        stat = UsageStat.objects.select_related("referrer_ref", "user_agent_ref").last()
+        self.assertEqual(stat.referrer, "https://example.com/")
+        self.assertEqual(stat.user_agent, firefox)
+
+    def test_empty_values_are_null(self):
+        (stat,) = create_usage_stats([self.get_record("", "")])
+        self.assertIsNone(stat.referrer_ref_id)
+        self.assertEqual(stat.user_agent, "")
+
+    def test_classify_user_agent(self):
+        self.assertEqual(
+            classify_user_agent(
+                "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+            ),
+            (True, ""),
+        )
+        self.assertEqual(
+            classify_user_agent(
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0"
+            ),
+            (False, "Edge"),
+        )
+
+
+class RollupTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def add_usage(self, link_id: int, client_ip: str, referrer: str = "") -> None:
+        create_usage_stats(
+            [
+                {
+                    "link_id": link_id,
+                    "client_ip": client_ip,
+                    "query_string": "",
+                    "referrer": referrer,
+                    "user_agent": "",
+                    "usage_date": timezone.now(),
+                }
+            ]
+        )
+
+    def test_usage_is_rolled_up(self):
+        self.add_usage(1, "10.0.0.1", "https://example.com/")
+        self.add_usage(1, "10.0.0.1", "https://example.com/")
+        self.add_usage(1, "10.0.0.2")
+        self.add_usage(2, "10.0.0.1")
+        self.assertEqual(roll_up_usage(lag=0), 4)
+        daily = DailyUsage.objects.get(link_id=1)
+        self.assertEqual(daily.hit_count, 3)
+        self.assertEqual(daily.unique_ips, 2)
+        self.assertEqual(daily.top_referrers, [["https://example.com/", 2]])
+
+    def test_rollup_is_incremental(self):
+        self.add_usage(1, "10.0.0.1")
+        roll_up_usage(lag=0)
+        self.add_usage(1, "10.0.0.2")
+        # Only the new row is processed, but the day's totals include both.
+        self.assertEqual(roll_up_usage(batch_size=1, lag=0), 1)
+        self.assertEqual(DailyUsage.objects.get(link_id=1).hit_count, 2)
+        self.assertEqual(roll_up_usage(lag=0), 0)
+
+    def test_rows_committed_late_are_not_skipped(self):
+        now = timezone.now()
+        UsageStat.objects.create(
+            id=10, link_id=1, client_ip="10.0.0.1", usage_date=now - timedelta(hours=1)
+        )
+        UsageStat.objects.create(id=20, link_id=1, client_ip="10.0.0.2")
+        # Recent rows are left, as other processes may still be writing
+        # batches with lower ids.
+        self.assertEqual(roll_up_usage(), 1)
+        UsageStat.objects.create(id=15, link_id=1, client_ip="10.0.0.3", usage_date=now)
+        later = now + timedelta(seconds=settings.USAGE_ROLLUP_LAG + 1)
+        with mock.patch("shortlinks.rollups.timezone.now", return_value=later):
+            self.assertEqual(roll_up_usage(), 2)
+        self.assertEqual(DailyUsage.objects.get(link_id=1).hit_count, 3)
+
+    def test_show_usage_uses_rollups(self):
+        self.add_usage(1, "10.0.0.1")
+        roll_up_usage(lag=0)
+        self.client.force_login(User.objects.get(pk=2))
+        response = self.client.get("/show_usage/1")
+        self.assertEqual(len(response.context["daily_usage"]), 1)
+        self.assertIsNone(response.context["usage_stats"])
+        response = self.client.get("/show_usage/1?raw=1")
+        self.assertEqual(len(response.context["usage_stats"]), 1)
+
+
+class PaginationTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def test_pages_cover_all_links_in_order(self):
+        # Links 2 and 3 share a create_date, so id breaks the tie.
+        page = paginate_keyset(get_links(), "create_date", None, 2)
+        self.assertEqual([link.id for link in page.items], [3, 2])
+        page = paginate_keyset(get_links(), "create_date", page.next_cursor, 2)
+        self.assertEqual([link.id for link in page.items], [1])
+        self.assertIsNone(page.next_cursor)
+
+    def test_invalid_cursor_gives_first_page(self):
+        page = paginate_keyset(get_links(), "create_date", "not-a-cursor", 10)
+        self.assertEqual(len(page.items), 3)
+
+    def test_page_size_is_limited(self):
+        self.client.force_login(User.objects.get(pk=2))
+        with self.settings(MAX_PAGE_SIZE=1):
+            response = self.client.get("/all_links/?page_size=500")
+        self.assertEqual(len(response.context["links"]), 1)
+        self.assertIsNotNone(response.context["next_cursor"])
+
+
+class LogTailTest(TestCase):
+    def setUp(self):
+        self.log_file = tempfile.NamedTemporaryFile(mode="w", suffix=".log")
+        for i in range(1000):
+            level = "ERROR" if i % 100 == 0 else "INFO"
+            self.log_file.write(f"{level} 2024-01-01 00:00:00,000 app views line {i}\n")
+        self.log_file.write("Traceback (most recent call last):\n")
+        self.log_file.flush()
+
+    def tearDown(self):
+        self.log_file.close()
+
+    def test_tail_returns_last_lines(self):
+        lines = tail_log(self.log_file.name, 3)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].endswith("line 998\n"))
+        self.assertTrue(lines[2].startswith("Traceback"))
+
+    def test_reverse_lines_spans_blocks(self):
+        # Small blocks, so lines span block boundaries.
+        lines = list(reverse_lines(self.log_file.name, block_size=7))
+        self.assertEqual(len(lines), 1001)
+        self.assertTrue(lines[-1].endswith("line 0\n"))
+
+    def test_tail_filters_by_level(self):
+        lines = tail_log(self.log_file.name, 2, level="WARNING")
+        self.assertEqual(lines[0], "ERROR 2024-01-01 00:00:00,000 app views line 800\n")
+        self.assertTrue(lines[1].endswith("line 900\n"))
+
+    def test_read_since_returns_only_new_lines(self):
+        _, offset = read_log_since(self.log_file.name, 0)
+        self.log_file.write("INFO 2024-01-01 00:00:01,000 app views new line\n")
+        self.log_file.write("partial")
+        self.log_file.flush()
+        lines, new_offset = read_log_since(self.log_file.name, offset)
+        self.assertEqual(lines, ["INFO 2024-01-01 00:00:01,000 app views new line\n"])
+        self.assertEqual(new_offset, offset + len(lines[0]))
+
+    def test_read_since_splits_long_lines(self):
+        offset = os.path.getsize(self.log_file.name)
+        self.log_file.write("INFO " + "x" * 95 + "\n")
+        self.log_file.flush()
+        lines, offset = read_log_since(self.log_file.name, offset, max_bytes=60)
+        self.assertEqual(lines, ["INFO " + "x" * 55 + "\n"])
+        lines, offset = read_log_since(self.log_file.name, offset, max_bytes=60)
+        self.assertEqual(lines, ["x" * 40 + "\n"])
+        self.assertEqual(offset, os.path.getsize(self.log_file.name))
+
+
+class LogHandlerTest(TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.log_dir.name, "test.log")
+
+    def tearDown(self):
+        self.log_dir.cleanup()
+
+    def log(self, handler, count, name="app"):
+        for i in range(count):
+            handler.handle(
+                logging.makeLogRecord(
+                    {"name": name, "levelname": "INFO", "msg": f"{name} line {i}"}
+                )
+            )
+
+    def read_all_lines(self):
+        lines = []
+        for segment in get_log_segments(self.path):
+            opener = gzip.open if segment.endswith(".gz") else open
+            with opener(segment, "rt") as f:
+                lines.extend(f)
+        with open(self.path) as f:
+            lines.extend(f)
+        return lines
+
+    def test_rotates_and_compresses_segments(self):
+        handler = SharedRotatingFileHandler(self.path, max_bytes=500, backup_count=3)
+        self.log(handler, 200)
+        handler.close()
+        segments = get_log_segments(self.path)
+        self.assertEqual(len(segments), 3)
+        self.assertTrue(all(segment.endswith(".gz") for segment in segments))
+        self.assertLess(os.path.getsize(self.path), 600)
+        self.assertTrue(self.read_all_lines()[-1].endswith("line 199\n"))
+
+    def test_processes_share_file_without_losing_records(self):
+        pids = []
+        for name in ("one", "two"):
+            pid = os.fork()
+            if pid == 0:
+                handler = SharedRotatingFileHandler(self.path, max_bytes=2000)
+                self.log(handler, 500, name)
+                os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        lines = self.read_all_lines()
+        self.assertEqual(len(lines), 1000)
+        for name in ("one", "two"):
+            self.assertEqual(
+                sorted(line for line in lines if line.startswith(name)),
+                sorted(f"{name} line {i}\n" for i in range(500)),
+            )
+
+    def test_queued_handler_writes_in_background(self):
+        handler = QueuedFileHandler(filename=self.path)
+        handler.setFormatter(JsonFormatter())
+        self.log(handler, 10)
+        handler.flush()
+        with open(self.path) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 10)
+        self.assertEqual(entries[9]["message"], "app line 9")
+        self.assertEqual(entries[9]["level"], "INFO")
+        # Logging again restarts the writer thread.
+        self.log(handler, 1)
+        handler.close()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 11)
+
+    def test_queued_handler_counts_dropped_records(self):
+        handler = QueuedFileHandler(queue_size=5, filename=self.path)
+        # Block the writer thread, so the queue fills.
+        with handler.file_handler.lock:
+            self.log(handler, 20)
+            self.assertGreater(handler.dropped, 0)
+        handler.flush()
+        self.log(handler, 1)
+        handler.close()
+        lines = self.read_all_lines()
+        # The warning follows the first record queued after the drops.
+        self.assertEqual(lines[-2], "app line 0\n")
+        # 15 dropped, or 14 if the writer thread took a record before blocking.
+        self.assertRegex(lines[-1], r"^Dropped 1[45] log records")
+
+    def test_tail_continues_into_segments(self):
+        handler = SharedRotatingFileHandler(self.path, max_bytes=500)
+        handler.setFormatter(
+            logging.Formatter(
+                "%(levelname)s %(asctime)s %(name)s %(module)s %(message)s"
+            )
+        )
+        self.log(handler, 200)
+        handler.close()
+        lines = tail_log(self.path, 150)
+        self.assertEqual(len(lines), 150)
+        self.assertTrue(lines[0].endswith("app line 50\n"))
+        self.assertTrue(lines[-1].endswith("app line 199\n"))
+
+    def test_tail_filters_json_entries(self):
+        handler = SharedRotatingFileHandler(self.path)
+        handler.setFormatter(JsonFormatter())
+        self.log(handler, 3, "app.views")
+        handler.handle(
+            logging.makeLogRecord(
+                {"name": "django", "levelname": "ERROR", "levelno": logging.ERROR}
+            )
+        )
+        handler.close()
+        self.assertEqual(len(tail_log(self.path, 10, module="app")), 3)
+        errors = tail_log(self.path, 10, level="WARNING")
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(json.loads(errors[0])["logger"], "django")
+
+
+class LinkImportExportTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def test_valid_rows_are_created_and_others_rejected(self):
+        data = io.StringIO(
+            "short_path,target_url\n"
+            "new1,https://example.com/1\n"
+            "/new1/,https://example.com/dup\n"
+            "/lib,https://example.com/exists\n"
+            "new2,not a url\n"
+            "new3,https://example.com/3\n"
+        )
+        user = User.objects.get(pk=2)
+        # Chunk of 2 rows, so the in-input duplicate spans chunks.
+        result = import_links(read_rows(data, "csv"), user, chunk_size=2)
+        self.assertEqual(result.created, 2)
+        self.assertEqual([r.line_number for r in result.rejected], [3, 4, 5])
+        self.assertTrue(Link.objects.filter(short_path="/new3").exists())
+
+    def test_dry_run_creates_nothing(self):
+        data = io.StringIO(
+            '{"short_path": "new", "target_url": "https://example.com/"}\n'
+        )
+        user = User.objects.get(pk=2)
+        result = import_links(read_rows(data, "jsonl"), user, dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertFalse(Link.objects.filter(short_path="/new").exists())
+
+    def test_export_can_be_imported(self):
+        out = io.StringIO()
+        call_command("export_links", format="jsonl", stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1]["short_path"], "/lib")
+        self.assertEqual(rows[1]["created_by"], "user1")
+
+
+class ApiTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        self.token = create_api_token(User.objects.get(pk=2), "test")
+
+    def post(self, path, data, token=None):
+        return self.client.post(
+            path,
+            data,
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {token or self.token}"},
+        )
+
+    def test_token_required(self):
+        response = self.client.post(
+            "/api/links/resolve", {"short_paths": ["/lib"]}, "application/json"
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.headers["WWW-Authenticate"], "Bearer")
+        response = self.post("/api/links/resolve", {"short_paths": ["/lib"]}, "bad")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get("/api/links/resolve").status_code, 405)
+        self.assertIsNone(ApiToken.objects.get().last_used)
+        self.post("/api/links/resolve", {"short_paths": ["/lib"]})
+        self.assertIsNotNone(ApiToken.objects.get().last_used)
+
+    def test_resolve_in_order_with_one_query(self):
+        Link.objects.create(
+            short_path="/guides/*",
+            target_url="https://example.com/guides",
+            created_by_id=2,
+        )
+        short_paths = ["lib", "/missing", "/use", "/guides/a"] + [
+            f"/missing{i}" for i in range(50)
+        ]
+        prefix_links.get()
+        # Token lookup, last_used update, and links.
+        with self.assertNumQueries(3):
+            response = self.post("/api/links/resolve", {"short_paths": short_paths})
+        results = response.json()["results"]
+        self.assertEqual(len(results), len(short_paths))
+        self.assertEqual(results[0]["short_path"], "/lib")
+        self.assertEqual(results[0]["id"], 2)
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2]["id"], 1)
+        self.assertEqual(results[3]["target_url"], "https://example.com/guides/a")
+
+    def test_resolve_rejects_empty_short_paths(self):
+        response = self.post("/api/links/resolve", {"short_paths": ["/lib", "/", ""]})
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual([error["index"] for error in errors], [1, 2])
+
+    def test_add_links(self):
+        links = [
+            {"short_path": f"/api{i}", "target_url": f"https://example.com/{i}"}
+            for i in range(20)
+        ]
+        response = self.post("/api/links", {"links": links, "validate_only": True})
+        self.assertEqual(response.json(), {"valid": 20})
+        self.assertFalse(Link.objects.filter(short_path="/api0").exists())
+        response = self.post("/api/links", {"links": links})
+        created = response.json()["created"]
+        self.assertEqual(
+            [link["short_path"] for link in created][:2], ["/api0", "/api1"]
+        )
+        self.assertEqual(Link.objects.filter(short_path__startswith="/api").count(), 20)
+
+    def test_add_links_rejects_empty_short_paths(self):
+        links = [{"short_path": "/", "target_url": "https://example.com"}]
+        response = self.post("/api/links", {"links": links})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Link.objects.filter(short_path="").exists())
+
+    def test_add_links_is_all_or_nothing(self):
+        links = [
+            {"short_path": "/new1", "target_url": "https://example.com/1"},
+            {"short_path": "/lib", "target_url": "https://example.com/taken"},
+            "not a link",
+            {"short_path": "/new1", "target_url": "https://example.com/dup"},
+        ]
+        response = self.post("/api/links", {"links": links})
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual([error["index"] for error in errors], [1, 2, 3])
+        self.assertFalse(Link.objects.filter(short_path="/new1").exists())
+
+    def test_link_usage(self):
+        today = timezone.localdate()
+        DailyUsage.objects.create(link_id=1, day=today, hit_count=5)
+        DailyUsage.objects.create(link_id=1, day=today - timedelta(days=3), hit_count=2)
+        response = self.post(
+            "/api/usage",
+            {"link_ids": [1, 2, 999], "start": str(today - timedelta(days=1))},
+        )
+        usage = response.json()["usage"]
+        self.assertEqual(usage["1"]["hits"], 5)
+        self.assertEqual(usage["1"]["first_day"], str(today))
+        self.assertEqual(usage["2"]["hits"], 0)
+        self.assertIsNone(usage["999"])
+        response = self.post("/api/usage", {"link_ids": [1], "end": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        for link_id in [True, 0, 10**30]:
+            response = self.post("/api/usage", {"link_ids": [link_id]})
+            self.assertEqual(response.status_code, 400, link_id)
+
+    @override_settings(API_MAX_BATCH_SIZE=2)
+    def test_batch_size_limit(self):
+        response = self.post("/api/usage", {"link_ids": [1, 2, 3]})
+        self.assertEqual(response.status_code, 413)
+
+
+class UsageExportTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        now = timezone.now()
+        create_usage_stats(
+            [
+                {
+                    "link_id": link_id,
+                    "client_ip": "10.0.0.1",
+                    "query_string": "",
+                    "referrer": "",
+                    "user_agent": "test",
+                    "usage_date": now - timedelta(days=days_ago),
+                }
+                for link_id, days_ago in [(1, 0), (1, 3), (2, 0)]
+            ]
+        )
+        self.client.force_login(User.objects.get(pk=2))
+
+    def test_view_streams_one_links_usage(self):
+        today = timezone.localdate().isoformat()
+        response = self.client.get(f"/export_usage/1?start={today}")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ",".join(USAGE_EXPORT_FIELDS))
+        self.assertEqual(len(lines), 2)
+
+    def test_view_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get("/export_usage/?format=xml").status_code, 400)
+        self.assertEqual(self.client.get("/export_usage/?end=May").status_code, 400)
+        self.assertEqual(self.client.get("/export_usage/99").status_code, 404)
+
+    def test_command_exports_all_usage(self):
+        out = io.StringIO()
+        call_command("export_usage", format="jsonl", stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row["link_id"] for row in rows], [1, 1, 2])
+        self.assertEqual(rows[0]["user_agent"], "test")
+        self.assertEqual(rows[0]["referrer"], "")
+
+    async def test_async_stream(self):
+        rows = aiterate(get_usage_export_rows(link_id=1).iterator(chunk_size=1), 1)
+        lines = [line async for line in astream_rows(rows, USAGE_EXPORT_FIELDS, "csv")]
+        self.assertEqual(len(lines), 3)
+
+
+class RetentionTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        now = timezone.now()
+        self.cutoff = now - timedelta(days=30)
+        for days_ago in [400, 100, 1]:
+            UsageStat.objects.create(
+                link_id=1,
+                client_ip="10.0.0.1",
+                usage_date=now - timedelta(days=days_ago),
+            )
+        roll_up_usage(lag=0)
+
+    def test_old_stats_are_archived_and_deleted(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            # Chunk size of 1, so each old row is its own chunk.
+            self.assertEqual(purge_usage_stats(self.cutoff, archive_dir, 1), 2)
+            archived = []
+            for name in sorted(os.listdir(archive_dir)):
+                with gzip.open(os.path.join(archive_dir, name), "rt") as f:
+                    archived.extend(json.loads(line) for line in f)
+        self.assertEqual(len(archived), 2)
+        self.assertEqual(UsageStat.objects.count(), 1)
+        # Daily totals are kept.
+        self.assertEqual(DailyUsage.objects.count(), 3)
+
+    def test_stats_not_rolled_up_are_kept(self):
+        UsageStat.objects.create(
+            link_id=1, client_ip="10.0.0.1", usage_date=self.cutoff - timedelta(days=1)
+        )
+        self.assertEqual(purge_usage_stats(self.cutoff, None), 2)
+        self.assertEqual(UsageStat.objects.count(), 2)
+
+
+class LinkDeletionTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        self.user = User.objects.get(pk=2)
+        now = timezone.now()
+        UsageStat.objects.bulk_create(
+            UsageStat(link_id=2, client_ip="10.0.0.1", usage_date=now - timedelta(i))
+            for i in range(25)
+        )
+        UsageStat.objects.create(link_id=1, client_ip="10.0.0.1")
+        roll_up_usage(lag=0)
+
+    def test_delete_stops_redirects_and_frees_short_path(self):
+        self.client.force_login(self.user)
+        response = self.client.get("/delete_link/2", headers={"Referer": "/my_links/"})
+        self.assertRedirects(response, "/my_links/", fetch_redirect_response=False)
+        self.assertEqual(self.client.get("/lib").status_code, 404)
+        self.assertFalse(Link.objects.filter(short_path="/lib").exists())
+        response = self.client.get("/check_short_path/", {"short_path": "lib"})
+        self.assertFalse(response.json()["taken"])
+        # Usage data is left for the background job.
+        self.assertTrue(Link.all_objects.filter(pk=2).exists())
+        self.assertEqual(UsageStat.objects.filter(link_id=2).count(), 25)
+        response = self.client.get("/link_deletions/")
+        self.assertContains(response, "/lib")
+        self.assertContains(response, "Waiting")
+
+    def test_purge_removes_stats_in_batches_then_link(self):
+        deletion = tombstone_link(Link.objects.get(pk=2), self.user)
+        with mock.patch("shortlinks.link_deletion.time.sleep") as sleep:
+            self.assertEqual(purge_deleted_links(10, 0.5, 0), (1, 0))
+        # Paused after each full batch.
+        self.assertEqual(sleep.call_count, 2)
+        deletion.refresh_from_db()
+        self.assertEqual((deletion.stats_total, deletion.stats_deleted), (25, 25))
+        self.assertIsNotNone(deletion.finished)
+        self.assertIsNone(deletion.link)
+        self.assertFalse(Link.all_objects.filter(pk=2).exists())
+        self.assertFalse(DailyUsage.objects.filter(link_id=2).exists())
+        self.assertEqual(UsageStat.objects.count(), 1)
+
+    def test_link_is_kept_until_grace_period_passes(self):
+        deletion = tombstone_link(Link.objects.get(pk=2), self.user)
+        self.assertEqual(purge_deleted_links(100, 0, 60), (0, 1))
+        self.assertFalse(UsageStat.objects.filter(link_id=2).exists())
+        self.assertTrue(Link.all_objects.filter(pk=2).exists())
+        deletion.refresh_from_db()
+        self.assertIsNone(deletion.claimed_until)
+        self.assertEqual(deletion.percent_done, 99)
+
+    def test_purge_defaults_to_current_settings(self):
+        tombstone_link(Link.objects.get(pk=2), self.user)
+        with override_settings(LINK_DELETION_BATCH_PAUSE=0, LINK_DELETION_GRACE=60):
+            self.assertEqual(purge_deleted_links(), (0, 1))
+        with override_settings(LINK_DELETION_BATCH_PAUSE=0, LINK_DELETION_GRACE=0):
+            self.assertEqual(purge_deleted_links(), (1, 0))
+
+    def test_claimed_deletion_is_skipped(self):
+        deletion = tombstone_link(Link.objects.get(pk=2), self.user)
+        LinkDeletion.objects.filter(pk=deletion.pk).update(
+            claimed_until=timezone.now() + timedelta(minutes=1)
+        )
+        self.assertEqual(purge_deleted_links(100, 0, 0), (0, 0))
+        self.assertEqual(UsageStat.objects.filter(link_id=2).count(), 25)
+
+
+class BenchmarkTest(TestCase):
+    def test_seed_data_and_scenarios(self):
+        short_paths = seed_data(link_count=20, stat_count=100)
+        self.assertEqual(Link.objects.count(), 20)
+        self.assertEqual(UsageStat.objects.count(), 100)
+        scenarios = get_scenarios(short_paths, request_count=5)
+        self.assertEqual(len(scenarios["hot_link"]), 5)
+        self.assertTrue(all("?" in path for path in scenarios["query_string"]))
+        for path in scenarios["cold_link"]:
+            self.assertEqual(
+                resolve_short_path(path).link_id, Link.objects.get(short_path=path).id
+            )
+
+    @override_settings(USAGE_STATS_BUFFERED=False)
+    def test_cold_scenario_skips_snapshot(self):
+        short_paths = seed_data(link_count=20, stat_count=0)[:5]
+        application = WSGIHandler()
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            manager = SnapshotManager(os.path.join(snapshot_dir, "links.snapshot"), 60)
+            manager.start()
+            manager.refresh()
+            with (
+                mock.patch("shortlinks.benchmark.snapshot_manager", manager),
+                mock.patch("shortlinks.views_utils.snapshot_manager", manager),
+                mock.patch.object(manager, "_start_thread"),
+            ):
+                # As Django's test client does: keep the test transaction's connection open.
+                request_started.disconnect(close_old_connections)
+                request_finished.disconnect(close_old_connections)
+                try:
+                    hot = run_scenario(application, short_paths)
+                    cold = run_scenario(application, short_paths, cold=True)
+                finally:
+                    request_started.connect(close_old_connections)
+                    request_finished.connect(close_old_connections)
+            self.assertTrue(manager.started)
+        self.assertEqual(hot["status_counts"], cold["status_counts"])
+        # Usage is recorded either way; only cold requests look links up.
+        self.assertGreater(cold["queries_per_request"], hot["queries_per_request"])
+
+    def test_benchmark_prefix_matcher(self):
+        results = benchmark_prefix_matcher([10, 30], lookup_count=50)
+        self.assertEqual(results["prefix_matcher_30"]["patterns"], 30)
+        self.assertEqual(results["exact_match_query"]["found"], 50)
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+@override_settings(USAGE_STATS_BUFFERED=False)
+class QueryPlanTest(TestCase):
+    """Checks that the main queries use their indexes, and that pages take a
+    fixed number of queries and little time, on a generated dataset.
+    """
+
+    # Seconds any page may take here; far above normal, so only a query
+    # scanning or loading much of the data should exceed it.
+    TIME_BUDGET = 0.5
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset(link_count=2000, stat_count=20000, user_count=5, days=60)
+        roll_up_usage(lag=0)
+        # A typical user, with a small share of the links.
+        owners = Link.objects.values("created_by").annotate(links=Count("id"))
+        cls.user = User.objects.get(pk=owners.order_by("links")[0]["created_by"])
+        cls.link = Link.objects.get(short_path="/ds5")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_plan(self, queryset: QuerySet) -> str:
+        if connection.vendor != "postgresql":
+            return queryset.explain()
+        # Tables are small here, so PostgreSQL may prefer scanning or sorting
+        # them; disallowing that shows whether an index could be used.
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute("SET enable_sort = off")
+        try:
+            return queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+                cursor.execute("RESET enable_sort")
+
+    def assertUsesIndex(
+        self,
+        queryset: QuerySet,
+        fields: list[str] | None = None,
+        bounded_column: str | None = None,
+    ):
+        """Assert that queryset neither scans nor sorts its model's table, and
+        uses the model's index on fields, if given, searching a range of it
+        bounded by bounded_column, if given (rather than reading the index from
+        the start and filtering).
+        """
+        plan = self.get_plan(queryset)
+        table = queryset.model._meta.db_table
+        self.assertNotRegex(
+            plan, rf"Seq Scan on {table}\b|SCAN {table}\b(?! USING)|TEMP B-TREE|Sort"
+        )
+        if fields:
+            index = next(i for i in queryset.model._meta.indexes if i.fields == fields)
+            self.assertIn(index.name, plan)
+        if bounded_column:
+            # SQLite: "SEARCH t USING INDEX i (c<?)";
+            # PostgreSQL: "Index Cond: (c <= ...)".
+            column = bounded_column
+            self.assertRegex(
+                plan, rf"SEARCH {table} .*\b{column}<|Index Cond: .*\b{column} <"
+            )
+
+    def assertPageWithinBudget(self, path: str, query_count: int):
+        start = time.perf_counter()
+        with self.assertNumQueries(query_count):
+            response = self.client.get(path)
+        self.assertLess(time.perf_counter() - start, self.TIME_BUDGET)
+        self.assertIn(response.status_code, [200, 302])
+        return response
+
+    def test_dataset(self):
+        self.assertEqual(Link.objects.count(), 2000)
+        self.assertEqual(UsageStat.objects.count(), 20000)
+        # Popularity is skewed: the busiest tenth of links get most uses.
+        busiest = (
+            UsageStat.objects.values("link_id")
+            .annotate(uses=Count("id"))
+            .order_by("-uses")[:200]
+        )
+        self.assertGreater(sum(row["uses"] for row in busiest), 10000)
+        with self.assertRaises(CommandError):
+            call_command("generate_dataset", links=10, stats=10, stdout=io.StringIO())
+
+    def test_redirect_lookup(self):
+        self.assertUsesIndex(
+            Link.objects.filter(short_path="/ds5").values_list(*RESOLVED_LINK_FIELDS),
+            ["short_path"],
+        )
+        self.assertUsesIndex(ApiToken.objects.filter(token_hash="0" * 64))
+
+    def test_link_lists(self):
+        self.assertUsesIndex(get_links()[:50], ["create_date", "id"])
+        self.assertUsesIndex(
+            get_links(owner=self.user)[:50], ["created_by", "create_date", "id"]
+        )
+        # Later pages, as display_links() gets them.
+        for links, fields in [
+            (get_links(), ["create_date", "id"]),
+            (get_links(owner=self.user), ["created_by", "create_date", "id"]),
+        ]:
+            cursor = paginate_keyset(links, "create_date", None, 50).next_cursor
+            self.assertUsesIndex(
+                seek_keyset(links, "create_date", cursor)[:51], fields, "create_date"
+            )
+
+    def test_usage(self):
+        self.assertUsesIndex(DailyUsage.objects.filter(link=self.link).order_by("-day"))
+        # Later pages of the busiest link's raw usage, as show_usage gets them.
+        busiest = UsageStat.objects.values("link_id").annotate(uses=Count("id"))
+        stats = UsageStat.objects.filter(
+            link_id=busiest.order_by("-uses")[0]["link_id"]
+        )
+        cursor = paginate_keyset(stats, "usage_date", None, 50).next_cursor
+        self.assertUsesIndex(
+            seek_keyset(stats, "usage_date", cursor)[:51],
+            ["link", "usage_date", "id"],
+            "usage_date",
+        )
+        self.assertUsesIndex(
+            UsageStat.objects.filter(
+                usage_date__lt=timezone.now() - timedelta(days=30)
+            ).order_by("usage_date")[:100],
+            ["usage_date"],
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "Trigram indexes need PostgreSQL")
+    def test_search(self):
+        plan = self.get_plan(filter_links(Link.objects.all(), "ds5 dataset0"))
+        self.assertNotIn("Seq Scan on shortlinks_link", plan)
+        self.assertIn("shortlinks_link_short_path_trgm", plan)
+        self.assertIn("shortlinks_link_target_url_trgm", plan)
+
+    def test_page_budgets(self):
+        response = self.assertPageWithinBudget("/all_links/", 3)
+        cursor = response.context["next_cursor"]
+        self.assertPageWithinBudget(f"/all_links/?cursor={cursor}", 3)
+        self.assertPageWithinBudget("/my_links/", 3)
+        self.assertPageWithinBudget(f"/show_usage/{self.link.id}", 6)
+        self.assertPageWithinBudget(f"/show_usage/{self.link.id}?raw=1", 7)
+        # Uncached: the link lookup, and recording its use.
+        link_cache.clear()
+        self.assertPageWithinBudget("/ds5", 2)
+
+
+class MetricsTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def test_metrics_are_added_up_across_processes(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            other_process = Metrics(metrics_dir, dump_interval=0)
+            other_process.inc("redirects_total", {"outcome": "found"}, 2)
+            other_process.observe("http_request_duration_seconds", 0.003, {"view": "x"})
+            other_process.dump()
+            this_process = Metrics(metrics_dir, dump_interval=0)
+            this_process.inc("redirects_total", {"outcome": "found"})
+            this_process.observe("http_request_duration_seconds", 20, {"view": "x"})
+            text = this_process.collect()
+        self.assertIn('linkshortener_redirects_total{outcome="found"} 3', text)
+        self.assertIn(
+            'linkshortener_http_request_duration_seconds_bucket{view="x",le="0.005"} 1',
+            text,
+        )
+        self.assertIn(
+            'linkshortener_http_request_duration_seconds_bucket{view="x",le="+Inf"} 2',
+            text,
+        )
+
+    def test_exited_processes_keep_counts_but_not_gauges(self):
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with open(os.path.join(metrics_dir, f"{exited.pid}-1.json"), "w") as f:
+                json.dump(
+                    {
+                        "counters": [
+                            ["redirects_total", {"outcome": "found"}, 2],
+                            ["usage_stats_queued", {}, 7],
+                        ],
+                        "histograms": [],
+                    },
+                    f,
+                )
+            this_process = Metrics(metrics_dir, dump_interval=0)
+            text = this_process.collect()
+            self.assertIn('linkshortener_redirects_total{outcome="found"} 2', text)
+            self.assertNotIn("linkshortener_usage_stats_queued 7", text)
+            this_process.remove_process(exited.pid)
+            self.assertEqual(os.listdir(metrics_dir), [EXITED_FILE_NAME])
+            self.assertIn(
+                'linkshortener_redirects_total{outcome="found"} 2',
+                this_process.collect(),
+            )
+
+    def test_metrics_endpoint_is_limited_to_allowed_networks(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        response = self.client.get("/metrics", REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_ALLOWED_NETWORKS=["203.0.113.0/24"]):
+            response = self.client.get("/metrics", REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_endpoint_is_not_a_redirect(self):
+        self.client.get("/missing")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'linkshortener_http_requests_total{status="404",view="redirect_link"}',
+            response.content.decode(),
+        )
+
+
+@override_settings(USAGE_STATS_BUFFERED=False)
+class FastRedirectTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        # As Django's test client does: keep the test transaction's connection open.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.django_application = mock.Mock(return_value=[b"django"])
+        self.application = FastRedirectApplication(self.django_application)
+
+    def tearDown(self):
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+    def get(self, path: str) -> tuple[str, dict, bytes]:
+        start_response = mock.Mock()
+        body = b"".join(self.application(get_wsgi_environ(path), start_response))
+        if not start_response.called:
+            return "django", {}, body
+        status, headers = start_response.call_args.args
+        return status, dict(headers), body
+
+    def test_redirect_is_served_without_django(self):
+        status, headers, _ = self.get("/public?campaign=linklister&tracking=evil")
+        link = Link.objects.get(pk=3)
+        self.assertEqual(status, "302 Found")
+        self.assertEqual(headers["Location"], link.target_url)
+        self.assertEqual(headers["Referer"], get_short_link(link.short_path))
+        self.assertEqual(headers["Referrer-Policy"], "same-origin")
+        self.assertEqual(UsageStat.objects.get().link, link)
+        self.django_application.assert_not_called()
+
+    def test_unknown_path_is_not_found(self):
+        status, _, body = self.get("/wp-login.php")
+        self.assertEqual(status, "404 Not Found")
+        self.assertIn(b"Not Found", body)
+
+    def test_errors_before_usage_is_captured_go_to_django(self):
+        with mock.patch(
+            "shortlinks.fast_redirect.lookup_in_memory", side_effect=RuntimeError
+        ):
+            self.assertEqual(self.get("/lib")[0], "django")
+        self.assertFalse(UsageStat.objects.exists())
+
+    def test_errors_after_usage_is_captured_are_raised(self):
+        with mock.patch.object(
+            self.application, "get_response", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.get("/lib")
+        self.django_application.assert_not_called()
+        self.assertEqual(UsageStat.objects.count(), 1)
+
+    def test_reserved_paths_go_to_django(self):
+        for path in ["/", "/admin/login/", "/static/css/style.css", "/metrics"]:
+            self.assertEqual(self.get(path)[0], "django")
+
+    def test_all_app_pages_are_reserved(self):
+        # Every URL pattern other than redirect_link must be reserved,
+        # or the fast path would treat it as a short link.
+        def first_segments(patterns, prefix=""):
+            for pattern in patterns:
+                route = prefix + str(pattern.pattern)
+                if isinstance(pattern, URLResolver):
+                    yield from first_segments(pattern.url_patterns, route)
+                elif (
+                    isinstance(pattern, URLPattern) and pattern.name != "redirect_link"
+                ):
+                    yield route.split("/")[0].split("<")[0]
+
+        for segment in first_segments(get_resolver().url_patterns):
+            if segment:
+                self.assertTrue(self.application.is_reserved(f"/{segment}"), segment)
+
+
+@override_settings(USAGE_STATS_BUFFERED=False)
+class AsyncRedirectTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    async def test_async_redirect_view(self):
+        link_cache.clear()
+        request = AsyncRequestFactory().get("/lib", headers={"Referer": "x"})
+        response = await aredirect_link(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "https://www.library.ucla.edu/")
+        self.assertEqual(response.headers["Referer"], get_short_link("/lib"))
+        stat = await UsageStat.objects.select_related("link", "referrer_ref").alast()
+        self.assertEqual(stat.link.short_path, "/lib")
+        self.assertEqual(stat.referrer, "x")
+
+    async def test_async_redirect_view_not_found(self):
+        with self.assertRaises(Http404):
+            await aredirect_link(AsyncRequestFactory().get("/missing"))
+
+    @override_settings(USAGE_STATS_BUFFERED=True)
+    async def test_cached_link_is_served_on_event_loop(self):
+        django_application = mock.AsyncMock()
+        application = AsyncFastRedirectApplication(django_application)
+        link_cache.set("/lib", ResolvedLink("https://www.library.ucla.edu/", 2))
+        with mock.patch.object(usage_writer, "submit") as submit:
+            self.assertEqual(await asgi_get(application, "/lib"), 302)
+        self.assertEqual(submit.call_args.args[0]["link_id"], 2)
+        await application(get_asgi_scope("/admin/"), mock.AsyncMock(), mock.AsyncMock())
+        django_application.assert_awaited_once()
+
+
+@override_settings(USAGE_STATS_BUFFERED=False)
+class RedirectPolicyTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        link_cache.clear()
+        miss_cache.clear()
+        self.link = Link.objects.create(
+            short_path="/stable",
+            target_url="https://example.com/stable",
+            redirect_type=308,
+            cache_max_age=3600,
+            created_by_id=2,
+        )
+
+    def test_redirect_view_uses_policy(self):
+        response = self.client.get("/stable")
+        self.assertEqual(response.status_code, 308)
+        self.assertEqual(response.headers["Cache-Control"], "public, max-age=3600")
+        response = self.client.get("/lib")
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn("Cache-Control", response.headers)
+
+    def test_fast_redirect_uses_policy(self):
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            application = FastRedirectApplication(mock.Mock())
+            start_response = mock.Mock()
+            application(get_wsgi_environ("/stable"), start_response)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        status, headers = start_response.call_args.args
+        self.assertEqual(status, "308 Permanent Redirect")
+        self.assertIn(("Cache-Control", "public, max-age=3600"), headers)
+
+    def test_policy_needs_no_extra_queries(self):
+        with self.assertNumQueries(1):
+            resolved = resolve_short_path("/stable")
+        self.assertEqual(resolved.redirect_type, 308)
+        self.assertEqual(resolved.cache_max_age, 3600)
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            path = os.path.join(snapshot_dir, "links.snapshot")
+            build_snapshot(path, 1)
+            snapshot = LinkSnapshot(path)
+            self.assertEqual(snapshot.lookup("/stable"), resolved)
+            self.assertIsNone(snapshot.lookup("/lib").cache_max_age)
+
+    def test_snapshot_fits_any_cache_max_age(self):
+        # As if saved before cache_max_age was bounded; SQLite integers can
+        # exceed the 32 bits in a snapshot entry.
+        too_long = 2**40 if connection.vendor == "sqlite" else 2**31 - 1
+        Link.objects.filter(pk=self.link.pk).update(cache_max_age=too_long)
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            path = os.path.join(snapshot_dir, "links.snapshot")
+            build_snapshot(path, 1)
+            resolved = LinkSnapshot(path).lookup("/stable")
+        self.assertEqual(resolved.cache_max_age, Link.MAX_CACHE_MAX_AGE)
+
+    def test_cache_control(self):
+        resolved = ResolvedLink("https://example.com/", 1)
+        self.assertIsNone(get_cache_control(resolved))
+        self.assertEqual(
+            get_cache_control(resolved._replace(cache_max_age=0)), "no-store"
+        )
+
+    def test_import_validates_policy(self):
+        data = io.StringIO(
+            "short_path,target_url,redirect_type,cache_max_age\n"
+            "a,https://example.com/a,301,60\n"
+            "b,https://example.com/b,303,\n"
+            "c,https://example.com/c,,-1\n"
+            "d,https://example.com/d,,1000000000000\n"
+        )
+        result = import_links(read_rows(data, "csv"), User.objects.get(pk=2))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([r.line_number for r in result.rejected], [3, 4, 5])
+        link = Link.objects.get(short_path="/a")
+        self.assertEqual((link.redirect_type, link.cache_max_age), (301, 60))
+        data = io.StringIO(
+            '{"short_path": "e", "target_url": "https://example.com/e", '
+            '"usage_sample_rate": 10000000}\n'
+        )
+        result = import_links(read_rows(data, "jsonl"), User.objects.get(pk=2))
+        self.assertEqual(
+            result.rejected[0].reason, "Invalid usage sample rate: 10000000"
+        )
+
+
+class StartupTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        link_cache.clear()
+        miss_cache.clear()
+        prefix_links.clear()
+
+    def test_warm_up_loads_most_used_links(self):
+        DailyUsage.objects.create(link_id=2, day=timezone.localdate(), hit_count=5)
+        warm_up()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_short_path("/lib").link_id, 2)
+
+    def test_warm_up_builds_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            manager = SnapshotManager(os.path.join(snapshot_dir, "links.snapshot"), 60)
+            manager.start()
+            with (
+                mock.patch("shortlinks.startup.snapshot_manager", manager),
+                mock.patch("shortlinks.views_utils.snapshot_manager", manager),
+                mock.patch.object(manager, "_start_thread"),
+            ):
+                warm_up()
+                with self.assertNumQueries(0):
+                    self.assertEqual(resolve_short_path("/use").link_id, 1)
+
+    def test_phases_are_logged(self):
+        timer = StartupTimer()
+        with (
+            mock.patch("shortlinks.startup.startup_timer", timer),
+            # Closing connections would end the test transaction.
+            mock.patch("shortlinks.startup.connections"),
+            self.assertLogs("shortlinks.startup", "INFO") as logs,
+        ):
+            prepare_application(time.monotonic())
+            timer.record_first_redirect(0.002)
+            timer.record_first_redirect(0.001)
+        self.assertEqual(list(timer.phases), ["imports", "migrations_check", "warm_up"])
+        self.assertIn("Started in", logs.output[-2])
+        self.assertIn("First redirect", logs.output[-1])
+        self.assertEqual(timer.first_redirect, 0.002)
+
+
+class LinkSearchTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        link_search.clear()
+        self.client.force_login(User.objects.get(pk=2))
+        for short_path, target_url in [
+            ("/guides/*", "https://guides.library.ucla.edu/"),
+            ("/guide", "https://example.com/guide"),
+        ]:
+            Link.objects.create(
+                short_path=short_path, target_url=target_url, created_by_id=2
+            )
+
+    def search(self, query: str) -> list[str]:
+        # The in-memory index, which search_links() uses without PostgreSQL.
+        return [
+            link["short_path"] for link in link_search.get_index().search(query, 10)
+        ]
+
+    def test_index_matches_word_prefixes(self):
+        self.assertEqual(self.search("gui"), ["/guide", "/guides/*"])
+        self.assertEqual(self.search("/guide"), ["/guide", "/guides/*"])
+        self.assertEqual(self.search("guides ucla"), ["/guides/*"])
+        self.assertEqual(self.search("guides.library"), ["/guides/*"])
+        self.assertEqual(self.search("nomatch"), [])
+        with self.assertNumQueries(0):
+            self.search("example")
+
+    def test_index_is_rebuilt_after_changes(self):
+        self.search("new")
+        Link.objects.create(
+            short_path="/newlink", target_url="https://example.com/", created_by_id=2
+        )
+        self.assertEqual(self.search("new"), ["/newlink"])
+
+    def test_index_is_only_rebuilt_when_links_change(self):
+        self.search("gui")
+        link_search._expires = 0
+        # Unchanged: only LinkVersion is checked.
+        with self.assertNumQueries(1):
+            self.search("gui")
+        # Changed by another process (no signal here).
+        Link.objects.bulk_create(
+            [
+                Link(
+                    short_path="/guided",
+                    target_url="https://example.com/",
+                    created_by_id=2,
+                )
+            ]
+        )
+        bump_link_version()
+        self.assertEqual(self.search("guided"), [])
+        link_search._expires = 0
+        self.assertEqual(self.search("guided"), ["/guided"])
+
+    def test_search_endpoint(self):
+        response = self.client.get("/search_links/", {"q": "/guide"})
+        results = response.json()["results"]
+        self.assertEqual(results[0]["short_path"], "/guide")
+        self.assertEqual(results[0]["short_link"], get_short_link("/guide"))
+        self.assertEqual(self.client.get("/search_links/").json(), {"results": []})
+
+    def test_link_list_is_filtered(self):
+        response = self.client.get("/all_links/", {"q": "example.com/guide"})
+        self.assertEqual(
+            [link.short_path for link in response.context["links"]], ["/guide"]
+        )
+
+    def test_link_list_is_filtered_by_creator(self):
+        # Matching users are found first, so links are not joined to users.
+        self.assertNotIn("auth_user", str(filter_links(Link.objects.all(), "x").query))
+        response = self.client.get("/all_links/", {"q": "USER1 guide"})
+        self.assertEqual(
+            [link.short_path for link in response.context["links"]],
+            ["/guide", "/guides/*"],
+        )
+
+    def test_check_short_path(self):
+        for short_path, taken, error in [
+            ("guide/", True, False),
+            ("/available", False, False),
+            ("/a*", False, True),
+        ]:
+            data = self.client.get(
+                "/check_short_path/", {"short_path": short_path}
+            ).json()
+            self.assertEqual(data["taken"], taken, short_path)
+            self.assertEqual(bool(data["error"]), error, short_path)
+
+
+class LinkSnapshotTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.snapshot_dir.name, "links.snapshot")
+
+    def tearDown(self):
+        self.snapshot_dir.cleanup()
+
+    def test_lookup(self):
+        self.assertEqual(build_snapshot(self.path, 1), 3)
+        snapshot = LinkSnapshot(self.path)
+        link = Link.objects.get(pk=3)
+        self.assertEqual(snapshot.version, 1)
+        self.assertEqual(
+            snapshot.lookup(link.short_path), ResolvedLink(link.target_url, 3)
+        )
+        self.assertIsNone(snapshot.lookup("/public"))
+        self.assertIsNone(snapshot.lookup("/zzz"))
+
+    def test_link_changes_bump_version(self):
+        version = get_link_version()
+        link = Link.objects.create(
+            short_path="/new", target_url="https://example.com", created_by_id=2
+        )
+        link.delete()
+        self.assertEqual(get_link_version(), version + 2)
+
+    def test_manager_rebuilds_when_links_change(self):
+        manager = SnapshotManager(self.path, 60)
+        manager.start()
+        self.assertIsNone(manager.snapshot)
+        manager.refresh()
+        self.assertIsNone(manager.snapshot.lookup("/new"))
+        Link.objects.create(
+            short_path="/new", target_url="https://example.com", created_by_id=2
+        )
+        manager.refresh()
+        self.assertEqual(manager.snapshot.version, get_link_version())
+        self.assertEqual(
+            manager.snapshot.lookup("/new").target_url, "https://example.com"
+        )
+
+    @override_settings(USAGE_STATS_BUFFERED=False)
+    def test_redirect_uses_snapshot(self):
+        manager = SnapshotManager(self.path, 60)
+        manager.start()
+        manager.refresh()
+        link_cache.clear()
+        with (
+            mock.patch("shortlinks.views_utils.snapshot_manager", manager),
+            mock.patch.object(manager, "_start_thread"),
+        ):
+            with self.assertNumQueries(0):
+                resolved = resolve_short_path("/lib")
+                self.assertIsNone(resolve_short_path("/missing"))
+        self.assertEqual(resolved.link_id, 2)
+
+    def test_links_added_before_refresh_are_found(self):
+        manager = SnapshotManager(self.path, 60)
+        manager.start()
+        manager.refresh()
+        with (
+            mock.patch("shortlinks.views_utils.snapshot_manager", manager),
+            mock.patch("shortlinks.signals.snapshot_manager", manager),
+            mock.patch.object(manager, "_start_thread"),
+        ):
+            self.assertIsNone(resolve_short_path("/new"))
+            # Commits at once in tests, so a refresh is requested, but not done.
+            with self.captureOnCommitCallbacks(execute=True):
+                Link.objects.create(
+                    short_path="/new",
+                    target_url="https://example.com",
+                    created_by_id=2,
+                )
+            self.assertFalse(manager.is_current(manager.snapshot))
+            self.assertEqual(
+                resolve_short_path("/new").target_url, "https://example.com"
+            )
+            manager.refresh()
+            self.assertTrue(manager.is_current(manager.snapshot))
+            with self.assertNumQueries(0):
+                self.assertIsNone(resolve_short_path("/missing"))
+
+    def test_stop_ends_the_thread(self):
+        manager = SnapshotManager(self.path, 60)
+        manager.start()
+        with mock.patch.object(manager, "refresh"):
+            manager.get_snapshot()
+            thread = manager._thread
+            manager.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(manager.get_snapshot())
+
+    def test_bloom_filter(self):
+        Link.objects.bulk_create(
+            Link(
+                short_path=f"/bulk{i}",
+                target_url="https://example.com",
+                created_by_id=2,
+            )
+            for i in range(1000)
+        )
+        build_snapshot(self.path, 1)
+        snapshot = LinkSnapshot(self.path)
+        # No false negatives, and few false positives.
+        self.assertTrue(all(snapshot.might_contain(f"/bulk{i}") for i in range(1000)))
+        false_positives = sum(snapshot.might_contain(f"/scan{i}") for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_unknown_paths_are_counted(self):
+        manager = SnapshotManager(self.path, 60)
+        manager.start()
+        manager.refresh()
+        with (
+            mock.patch("shortlinks.views_utils.snapshot_manager", manager),
+            mock.patch.object(manager, "_start_thread"),
+            mock.patch.object(metrics, "inc") as inc,
+        ):
+            resolve_short_path("/.env")
+        inc.assert_called_once_with(
+            "negative_lookups_total", {"source": "bloom_filter"}
+        )
+
+
+@override_settings(USAGE_STATS_BUFFERED=False)
+class PrefixLinkTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    def setUp(self):
+        for short_path, target_url in [
+            ("/guides/*", "https://guides.library.ucla.edu/?source=go"),
+            ("/guides/special/*", "https://example.com/special"),
+            ("/guides/exact", "https://example.com/exact"),
+        ]:
+            Link.objects.create(
+                short_path=short_path, target_url=target_url, created_by_id=2
+            )
+
+    def test_expand_target(self):
+        self.assertEqual(
+            expand_target("https://example.com/a/?x=1", "b/c", "x=2&y=3"),
+            "https://example.com/a/b/c?x=1&y=3",
+        )
+        self.assertEqual(
+            expand_target("https://example.com", "", ""), "https://example.com"
+        )
+
+    def test_longest_prefix_wins(self):
+        matcher = PrefixMatcher(
+            [
+                ("/a/*", ResolvedLink("https://example.com/a", 1)),
+                ("/a/b/*", ResolvedLink("https://example.com/b", 2)),
+            ]
+        )
+        self.assertEqual(matcher.match("/a/b/c")[1], "c")
+        self.assertEqual(matcher.match("/a/b/c")[0].link_id, 2)
+        self.assertEqual(matcher.match("/a/x")[0].link_id, 1)
+        self.assertEqual(matcher.match("/a")[1], "")
+        self.assertIsNone(matcher.match("/b"))
+
+    def test_redirect_forwards_path_and_query(self):
+        response = self.client.get("/guides/databases/jstor?utm_source=email")
+        self.assertRedirects(
+            response,
+            "https://guides.library.ucla.edu/databases/jstor?source=go&utm_source=email",
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(UsageStat.objects.get().link.short_path, "/guides/*")
+
+    def test_exact_match_wins(self):
+        link_cache.clear()
+        miss_cache.clear()
+        self.assertEqual(
+            resolve_short_path("/guides/exact").target_url, "https://example.com/exact"
+        )
+        self.assertEqual(
+            resolve_short_path("/guides/special/x").target_url,
+            "https://example.com/special/x",
+        )
+
+    def test_snapshot_matches_prefixes(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            manager = SnapshotManager(os.path.join(snapshot_dir, "links.snapshot"), 60)
+            manager.start()
+            manager.refresh()
+            with (
+                mock.patch("shortlinks.views_utils.snapshot_manager", manager),
+                mock.patch.object(manager, "_start_thread"),
+            ):
+                with self.assertNumQueries(0):
+                    resolved = resolve_short_path("/guides/a?b=c")
+                self.assertIsNone(resolve_short_path("/guide"))
+        self.assertEqual(
+            resolved.target_url, "https://guides.library.ucla.edu/a?source=go&b=c"
+        )
+
+    def test_unknown_paths_do_not_reload_prefix_links(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            manager = SnapshotManager(os.path.join(snapshot_dir, "links.snapshot"), 60)
+            manager.start()
+            manager.refresh()
+            matcher = prefix_links.for_snapshot(manager.snapshot)
+            self.assertIsNone(load_short_path("/wp-login0.php"))
+            # Only the exact match query; the prefix links are kept.
+            with self.assertNumQueries(1):
+                self.assertIsNone(load_short_path("/wp-login1.php"))
+            self.assertIs(prefix_links.for_snapshot(manager.snapshot), matcher)
+
+    def test_wildcards_are_validated(self):
+        for short_path in ["/a*", "/*", "/a/*/b", "/a/*?x=1"]:
+            form = LinkForm(
+                {"short_path": short_path, "target_url": "https://example.com"}
+            )
+            self.assertFalse(form.is_valid(), short_path)
+        form = LinkForm({"short_path": "/a/*", "target_url": "https://example.com"})
+        self.assertTrue(form.is_valid())
+
+
+class StubTargetHandler(BaseHTTPRequestHandler):
+    """Stub target site: /ok has an ETag, /old is gone, /get-only rejects HEAD."""
+
+    protocol_version = "HTTP/1.1"
+    ETAG = '"v1"'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.server.requests.append((self.command, self.path, self.client_address))
+
+    def do_HEAD(self):
+        if self.path == "/ok":
+            if self.headers.get("If-None-Match") == self.ETAG:
+                self.send_empty(304)
+            else:
+                self.send_empty(200, [("ETag", self.ETAG)])
+        elif self.path == "/get-only":
+            self.send_empty(405)
+        else:
+            self.send_empty(404)
+
+    def do_GET(self):
+        self.send_empty(200 if self.path == "/get-only" else 404)
+
+
+class TargetCheckTest(TestCase):
+    fixtures = ["sample_data.json"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubTargetHandler)
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        Link.objects.all().delete()
+        for short_path, path in [
+            ("/ok", "/ok"),
+            ("/ok2", "/ok"),
+            ("/old", "/old"),
+            ("/get-only", "/get-only"),
+        ]:
+            Link.objects.create(
+                short_path=short_path,
+                target_url=self.base_url + path,
+                created_by_id=2,
+            )
+
+    def check(self, **options):
+        return check_targets(
+            workers=4, timeout=5, host_rate=0, host_connections=1, **options
+        )
+
+    def test_results_are_saved(self):
+        counts = self.check()
+        self.assertEqual(counts, {"urls": 3, "links": 4, "broken": 1})
+        checks = {
+            check.link.short_path: check
+            for check in TargetCheck.objects.select_related("link")
+        }
+        self.assertEqual(checks["/ok"].status_code, 200)
+        self.assertEqual(checks["/ok2"].etag, '"v1"')
+        self.assertTrue(checks["/old"].is_broken)
+        self.assertEqual(checks["/get-only"].status_code, 200)
+        self.assertIsNotNone(checks["/ok"].latency_ms)
+        # Each distinct URL is requested once, all on one connection.
+        methods = [(method, path) for method, path, _ in self.server.requests]
+        self.assertEqual(methods.count(("HEAD", "/ok")), 1)
+        self.assertIn(("GET", "/get-only"), methods)
+        self.assertEqual(len({client for _, _, client in self.server.requests}), 1)
+
+    def test_conditional_request(self):
+        self.check()
+        self.check()
+        check = TargetCheck.objects.get(link__short_path="/ok")
+        self.assertEqual(check.status_code, 304)
+        self.assertEqual(check.etag, '"v1"')
+        self.assertFalse(check.is_broken)
+
+    def test_only_stale_links_are_checked(self):
+        self.check()
+        counts = self.check(checked_before=timezone.now() - timedelta(hours=1))
+        self.assertEqual(counts["urls"], 0)
+
+    def test_connection_error(self):
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+        result = HostChecker(("http", "127.0.0.1", port), 5).check(
+            CheckRequest(f"http://127.0.0.1:{port}/")
+        )
+        self.assertIsNone(result.status_code)
+        self.assertTrue(result.error)
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50)
+
+    def test_link_list_flags_broken_targets(self):
+        self.check()
+        self.client.force_login(User.objects.get(pk=2))
+        response = self.client.get("/all_links/")
+        self.assertContains(response, "Broken: HTTP 404", count=1)
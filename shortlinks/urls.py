@@ -1,17 +1,35 @@
+from django.conf import settings
 from django.urls import path, re_path
-from . import views
+from . import api, views
+
+# Under ASGI, use the async redirect view so lookups don't tie up a thread.
+if settings.SERVER_MODE == "asgi":
+    redirect_view = views.aredirect_link
+else:
+    redirect_view = views.redirect_link
 
 urlpatterns = [
     path("", views.add_link, name="add_link"),
     path("add_link/", views.add_link, name="add_link"),
     path("my_links/", views.my_links, name="my_links"),
     path("all_links/", views.all_links, name="all_links"),
+    path("search_links/", views.search_links_json, name="search_links"),
+    path("check_short_path/", views.check_short_path, name="check_short_path"),
     path("delete_link/<int:link_id>", views.delete_link, name="delete_link"),
+    path("link_deletions/", views.link_deletions, name="link_deletions"),
     path("show_usage/<int:link_id>", views.show_usage, name="show_usage"),
+    path("export_usage/", views.export_usage, name="export_usage"),
+    path("export_usage/<int:link_id>", views.export_usage, name="export_usage"),
     path("logs/", views.show_log, name="show_log"),
     path("logs/<int:line_count>", views.show_log, name="show_log"),
     path("release_notes/", views.release_notes, name="release_notes"),
+    # JSON API for integrations; see shortlinks/api.py.
+    path("api/links/resolve", api.resolve_links, name="api_resolve_links"),
+    path("api/links", api.add_links, name="api_add_links"),
+    path("api/usage", api.link_usage, name="api_link_usage"),
+    # Prometheus scrapes this path; it must precede the catch-all pattern below.
+    path("metrics", views.show_metrics, name="metrics"),
     # Everything else is treated as a short link for (possible) redirection.
     # Match full path, which must consist of at least one non-whitespace character.
-    re_path(r"^\S+$", views.redirect_link, name="redirect_link"),
+    re_path(r"^\S+$", redirect_view, name="redirect_link"),
 ]
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import DatabaseError
+from shortlinks.models import Link
+
+logger = logging.getLogger(__name__)
+
+
+class SampleRates:
+    """Usage sample rate of each link with one above 1, loaded from the
+    database.  Changes made in this process clear it immediately, others
+    are picked up when it expires after ttl seconds.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rates: dict[int, int] = {}
+        self.clear()
+
+    def clear(self) -> None:
+        self._expires = 0.0
+
+    def get(self) -> dict[int, int]:
+        with self._lock:
+            if self._expires <= time.monotonic():
+                try:
+                    self._rates = dict(
+                        Link.objects.filter(usage_sample_rate__gt=1).values_list(
+                            "id", "usage_sample_rate"
+                        )
+                    )
+                except DatabaseError:
+                    # Keep the rates last loaded; retry after ttl.
+                    logger.exception("Failed to load usage sample rates")
+                self._expires = time.monotonic() + self.ttl
+            return self._rates
+
+
+sample_rates = SampleRates(settings.LINK_CACHE_TTL)
+
+
+class UsageDeduplicator:
+    """Collapses bursts of uses into one usage record, counting them all in
+    its hit_count, so fewer rows are written while totals stay exact:
+
+    - Uses of a link by the same client (IP address and user agent) within
+      window seconds of its first use are added to the first use's record.
+    - For a link with a sample rate of N, uses by anyone within window seconds
+      are added to the first use's record, up to N uses per record.
+
+    Records are held until their window ends (or they reach N uses); add() and
+    pop_expired() return records ready to write.  If more than max_pending are
+    held, the oldest are released early.  window <= 0 disables collapsing.
+    Not thread-safe.
+    """
+
+    def __init__(self, window: float, max_pending: int) -> None:
+        self.window = window
+        self.max_pending = max_pending
+        # Held records by key, with the monotonic time each window ends,
+        # oldest first.
+        self._pending: OrderedDict[tuple, tuple[dict, float]] = OrderedDict()
+        # Uses added to an earlier record rather than written as their own.
+        self.collapsed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, records: list[dict], sample_rates: dict[int, int]) -> list[dict]:
+        """Add usage records (see shortlinks.views_utils.get_usage_record()),
+        returning any now ready to write.
+        """
+        if self.window <= 0:
+            return records
+        ready = []
+        now = time.monotonic()
+        for record in records:
+            link_id = record["link_id"]
+            sample_rate = sample_rates.get(link_id, 1)
+            if sample_rate > 1:
+                key = (link_id,)
+            else:
+                key = (link_id, record["client_ip"], record["user_agent"])
+            pending = self._pending.get(key)
+            if pending is None:
+                record["hit_count"] = 1
+                pending = self._pending[key] = (record, now + self.window)
+            else:
+                pending[0]["hit_count"] += 1
+                self.collapsed += 1
+            if sample_rate > 1 and pending[0]["hit_count"] >= sample_rate:
+                ready.append(self._pending.pop(key)[0])
+        while len(self._pending) > self.max_pending:
+            ready.append(self._pending.popitem(last=False)[1][0])
+        ready.extend(self.pop_expired(now))
+        return ready
+
+    def pop_expired(self, now: float | None = None) -> list[dict]:
+        """Return the records whose window has ended."""
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        while self._pending:
+            record, expires = next(iter(self._pending.values()))
+            if expires > now:
+                break
+            self._pending.popitem(last=False)
+            expired.append(record)
+        return expired
+
+    def pop_all(self) -> list[dict]:
+        """Return all held records, e.g. before the process exits."""
+        records = [record for record, _ in self._pending.values()]
+        self._pending.clear()
+        return records
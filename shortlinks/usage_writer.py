@@ -0,0 +1,212 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from shortlinks.dimensions import create_usage_stats
+from shortlinks.models import Link
+from shortlinks.usage_dedup import UsageDeduplicator, sample_rates
+
+logger = logging.getLogger(__name__)
+
+
+class UsageStatWriter:
+    """Queue usage records in memory and write them to the database in batches.
+
+    Records are written with bulk_create by a background thread (referrer and
+    user agent strings resolved to dimension ids for the whole batch), when either
+    batch_size records are waiting or flush_interval seconds have passed since
+    the oldest waiting record was queued.  The queue is bounded: when it is full,
+    new records are dropped and counted rather than slowing down redirects.
+    Before writing, repeated and sampled uses are collapsed into one record per
+    dedup_window seconds (see shortlinks.usage_dedup.UsageDeduplicator).
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        queue_size: int,
+        background: bool = True,
+        dedup_window: float = 0,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.background = background
+        self.dedup_window = dedup_window
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """Set up per-process state.  Called again in a forked child process,
+        which inherits the parent's queue but not its writer thread.
+        """
+        self._pid = os.getpid()
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=self.queue_size)
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._dedup = UsageDeduplicator(self.dedup_window, self.queue_size)
+        self._dedup_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        if self.background and self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="usage-stat-writer", daemon=True
+                    )
+                    self._thread.start()
+
+    def submit(self, record: dict) -> bool:
+        """Queue one record (UsageStat field values) for writing.
+        Returns False if the queue was full and the record was dropped.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def flush(self) -> None:
+        """Write everything currently queued or held for collapsing, in the
+        calling thread.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write_ready(batch)
+                batch = []
+        self._write_ready(batch)
+        with self._dedup_lock:
+            held = self._dedup.pop_all()
+        if held:
+            self._write(held)
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """Stop the writer thread, writing any queued records first."""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        """Return queue depth and outcome counters."""
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "collapsed": self._dedup.collapsed,
+            "held": len(self._dedup),
+        }
+
+    def _run(self) -> None:
+        batch: list[dict] = []
+        deadline = 0.0
+        while True:
+            stopping = self._stopping.is_set()
+            if stopping:
+                timeout = 0
+            elif batch:
+                timeout = max(0, deadline - time.monotonic())
+            else:
+                timeout = self.flush_interval
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if len(batch) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                if stopping:
+                    break
+            if batch and (
+                len(batch) >= self.batch_size
+                or time.monotonic() >= deadline
+                or stopping
+            ):
+                self._write_ready(batch)
+                batch = []
+            elif not batch and len(self._dedup):
+                # Write held records whose window has ended.
+                self._write_ready([])
+        if batch:
+            self._write_ready(batch)
+
+    def _write_ready(self, batch: list[dict]) -> None:
+        """Add batch to the records held for collapsing, and write those ready."""
+        try:
+            with self._dedup_lock:
+                if batch and self._dedup.window > 0:
+                    ready = self._dedup.add(batch, sample_rates.get())
+                else:
+                    ready = batch + self._dedup.pop_expired()
+        except Exception:
+            self.failed += len(batch)
+            logger.exception(f"Failed to collapse {len(batch)} usage stats")
+            return
+        if ready:
+            self._write(ready)
+
+    def _write(self, batch: list[dict]) -> None:
+        try:
+            try:
+                create_usage_stats(batch)
+            except IntegrityError:
+                # A link was removed (see shortlinks.link_deletion) after its
+                # use was queued: write the others' uses, not lose the batch.
+                batch = self._without_removed_links(batch)
+                create_usage_stats(batch)
+            self.written += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception(f"Failed to write {len(batch)} usage stats")
+        finally:
+            # Background thread has its own connection, which Django's
+            # request signals never close.
+            if threading.current_thread() is self._thread:
+                close_old_connections()
+
+    def _without_removed_links(self, batch: list[dict]) -> list[dict]:
+        link_ids = {record["link_id"] for record in batch}
+        existing = set(
+            Link.all_objects.filter(id__in=link_ids).values_list("id", flat=True)
+        )
+        kept = [record for record in batch if record["link_id"] in existing]
+        if len(kept) < len(batch):
+            self.failed += len(batch) - len(kept)
+            logger.warning(
+                f"Discarded {len(batch) - len(kept)} usage stats of removed links"
+            )
+        return kept
+
+
+usage_writer = UsageStatWriter(
+    batch_size=settings.USAGE_STATS_BATCH_SIZE,
+    flush_interval=settings.USAGE_STATS_FLUSH_INTERVAL,
+    queue_size=settings.USAGE_STATS_QUEUE_SIZE,
+    dedup_window=settings.USAGE_DEDUP_WINDOW,
+)
+# Covers runserver and management commands; gunicorn workers also
+# call shutdown() from the worker_exit hook in gunicorn.conf.py.
+atexit.register(usage_writer.shutdown)
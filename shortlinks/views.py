@@ -1,20 +1,60 @@
 import logging
+import os
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import QuerySet  # for type hints
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.db import transaction
+from django.db.models import Max, Min, QuerySet, Sum
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, render
+from django.utils.dateparse import parse_date
+from shortlinks.exports import (
+    EXPORT_CONTENT_TYPES,
+    EXPORT_FORMATS,
+    USAGE_EXPORT_FIELDS,
+    aiterate,
+    astream_rows,
+    get_usage_export_rows,
+    stream_rows,
+)
 from shortlinks.forms import LinkForm
-from shortlinks.models import Link, UsageStat
+from shortlinks.link_deletion import link_deleter, tombstone_link
+from shortlinks.log_utils import LEVEL_NAMES, read_log_since, tail_log
+from shortlinks.metrics import is_allowed_client, metrics
+from shortlinks.models import DailyUsage, Link, LinkDeletion, RollupState, UsageStat
+from shortlinks.pagination import get_page_size, paginate_keyset
+from shortlinks.prefix_matcher import get_wildcard_error
+from shortlinks.search import (
+    MAX_SEARCH_RESULTS,
+    SEARCH_RESULTS,
+    filter_links,
+    search_links,
+)
 from shortlinks.views_utils import (
+    acapture_usage,
+    aresolve_short_path,
     capture_usage_stats,
     format_short_path,
     get_links,
+    get_redirect_response,
     get_short_link,
+    resolve_short_path,
 )
 
 logger = logging.getLogger(__name__)
 
+# Link deletions shown on the link_deletions page.
+LINK_DELETIONS_SHOWN = 100
+
 
 @login_required
 def add_link(request: HttpRequest) -> HttpResponse:
@@ -35,6 +75,9 @@ def add_link(request: HttpRequest) -> HttpResponse:
                 new_link = Link(
                     short_path=short_path,
                     target_url=target_url,
+                    redirect_type=form.cleaned_data["redirect_type"],
+                    cache_max_age=form.cleaned_data["cache_max_age"],
+                    usage_sample_rate=form.cleaned_data["usage_sample_rate"] or 1,
                     created_by=user,
                 )
                 new_link.save()
@@ -46,8 +89,20 @@ def add_link(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def display_links(request: HttpRequest, links: QuerySet) -> HttpResponse:
-    """Display a list of links, provided by calling view."""
-    return render(request, "shortlinks/show_links.html", {"links": links})
+    """Display one page of a list of links, provided by calling view,
+    optionally filtered by ?q= (see shortlinks.search.filter_links()).
+    """
+    query = request.GET.get("q", "").strip()
+    if query:
+        links = filter_links(links, query)
+    page = paginate_keyset(
+        links, "create_date", request.GET.get("cursor"), get_page_size(request)
+    )
+    return render(
+        request,
+        "shortlinks/show_links.html",
+        {"links": page.items, "next_cursor": page.next_cursor, "query": query},
+    )
 
 
 @login_required
@@ -66,42 +121,200 @@ def my_links(request: HttpRequest) -> HttpResponse:
     return display_links(request, links)
 
 
+@login_required
+def search_links_json(request: HttpRequest) -> JsonResponse:
+    """Return links matching ?q= as JSON, for autocomplete: at most ?limit=
+    (default SEARCH_RESULTS, up to MAX_SEARCH_RESULTS).
+    """
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = int(request.GET.get("limit", SEARCH_RESULTS))
+    except ValueError:
+        limit = SEARCH_RESULTS
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    results = search_links(query, limit) if query else []
+    return JsonResponse(
+        {
+            "results": [
+                {
+                    "id": result["id"],
+                    "short_path": result["short_path"],
+                    "short_link": get_short_link(result["short_path"]),
+                    "target_url": result["target_url"],
+                    "created_by": result["created_by__username"],
+                }
+                for result in results
+            ]
+        }
+    )
+
+
+@login_required
+def check_short_path(request: HttpRequest) -> JsonResponse:
+    """Return whether ?short_path= is already taken (after formatting, as
+    add_link does), or why it is invalid, as JSON.
+    """
+    short_path = request.GET.get("short_path", "").strip()
+    if not short_path:
+        return JsonResponse({"short_path": "", "taken": False, "error": None})
+    error = get_wildcard_error(short_path)
+    short_path = format_short_path(short_path)
+    taken = error is None and Link.objects.filter(short_path=short_path).exists()
+    return JsonResponse({"short_path": short_path, "taken": taken, "error": error})
+
+
 @login_required
 def delete_link(request: HttpRequest, link_id: int) -> HttpResponse:
-    """Delete the link with the given link_id."""
+    """Delete the link with the given link_id: it stops redirecting at once,
+    and its usage data is removed in the background (see link_deletions).
+    """
     link = get_object_or_404(Link, pk=link_id)
-    link.delete()
+    tombstone_link(link, request.user)
+    transaction.on_commit(link_deleter.wake)
+    messages.success(
+        request,
+        f"Link {link.short_path} was deleted; its usage data is being removed.",
+    )
     # Go back to the calling page
     return HttpResponseRedirect(request.headers.get("referer"))
 
 
+@login_required
+def link_deletions(request: HttpRequest) -> HttpResponse:
+    """Show the progress of removing deleted links' usage data, most recent first."""
+    deletions = LinkDeletion.objects.select_related("requested_by").order_by(
+        "-requested"
+    )[:LINK_DELETIONS_SHOWN]
+    return render(
+        request,
+        "shortlinks/link_deletions.html",
+        {
+            "deletions": deletions,
+            "in_progress": any(deletion.finished is None for deletion in deletions),
+        },
+    )
+
+
 @login_required
 def show_usage(request: HttpRequest, link_id: int) -> HttpResponse:
-    """Show usage info for the given link_id."""
-    usage_stats = UsageStat.objects.filter(link_id=link_id).order_by("-usage_date")
+    """Show usage info for the given link_id.
+    Totals and daily counts come from DailyUsage rollups; raw UsageStat rows
+    are shown, a page at a time, only if requested via ?raw=1.
+    """
     link = get_object_or_404(Link, pk=link_id)
     short_link = get_short_link(link.short_path)
+    daily_usage = DailyUsage.objects.filter(link=link).order_by("-day")
+    summary = daily_usage.aggregate(
+        total_hits=Sum("hit_count"), first_day=Min("day"), last_day=Max("day")
+    )
+    page = None
+    if request.GET.get("raw"):
+        page = paginate_keyset(
+            UsageStat.objects.filter(link=link).select_related(
+                "referrer_ref", "user_agent_ref"
+            ),
+            "usage_date",
+            request.GET.get("cursor"),
+            get_page_size(request),
+        )
     return render(
         request,
         "shortlinks/show_usage.html",
-        {"usage_stats": usage_stats, "short_link": short_link},
+        {
+            "link": link,
+            "short_link": short_link,
+            "summary": summary,
+            "daily_usage": daily_usage,
+            "usage_stats": page.items if page else None,
+            "next_cursor": page.next_cursor if page else None,
+            "rollup_state": RollupState.objects.first(),
+        },
     )
 
 
+@login_required
+def export_usage(request: HttpRequest, link_id: int | None = None) -> HttpResponse:
+    """Stream raw usage info, for the given link_id or all links, as CSV or
+    JSON Lines (?format=csv or jsonl), optionally limited to local days from
+    ?start= to ?end= (YYYY-MM-DD, inclusive).
+    Rows are read in chunks and sent as they are read, so memory use
+    does not grow with the size of the export.
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unsupported format: {export_format}")
+    dates = {}
+    for name in ["start", "end"]:
+        value = request.GET.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return HttpResponseBadRequest(f"Invalid {name} date: {value}")
+    if link_id is not None:
+        get_object_or_404(Link, pk=link_id)
+
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    rows = get_usage_export_rows(link_id, dates["start"], dates["end"]).iterator(
+        chunk_size=chunk_size
+    )
+    if settings.SERVER_MODE == "asgi":
+        # Django's ASGI handler would read a synchronous iterator to the end
+        # before sending anything.
+        lines = astream_rows(
+            aiterate(rows, chunk_size), USAGE_EXPORT_FIELDS, export_format
+        )
+    else:
+        lines = stream_rows(rows, USAGE_EXPORT_FIELDS, export_format)
+    response = StreamingHttpResponse(
+        lines, content_type=EXPORT_CONTENT_TYPES[export_format]
+    )
+    file_name = f"usage-{link_id or 'all'}.{export_format}"
+    response.headers["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return response
+
+
 @login_required
 def show_log(request, line_count: int = 200) -> HttpResponse:
-    """Display log."""
-    log_file = "logs/application.log"
+    """Display the end of the log, continuing into rotated segments if needed,
+    optionally filtered by ?level= (minimum level) and ?module= (logger name
+    prefix or module name).
+    With ?since=<byte offset>, return just the lines added after that offset,
+    and the new offset, as JSON, so the page can poll for new lines.
+    """
+    log_file = settings.LOG_FILE
+    level = request.GET.get("level")
+    if level not in LEVEL_NAMES:
+        level = None
+    module = request.GET.get("module") or None
+    since = request.GET.get("since")
     try:
-        with open(log_file, "r") as f:
-            # Get just the last line_count lines in the log.
-            lines = f.readlines()[-line_count:]
-            # Template prints these as a single block, so join lines into one chunk.
-            log_data = "".join(lines)
+        if since is not None:
+            lines, offset = read_log_since(log_file, int(since), level, module)
+            return JsonResponse({"lines": "".join(lines), "offset": offset})
+        # Get the current end first, so polling picks up anything written
+        # while reading.
+        offset = os.path.getsize(log_file)
+        # Template prints these as a single block, so join lines into one chunk.
+        log_data = "".join(tail_log(log_file, line_count, level, module))
     except FileNotFoundError:
         log_data = f"Log file {log_file} not found"
+        offset = 0
+    except ValueError:
+        return HttpResponseBadRequest(f"Invalid offset: {since}")
 
-    return render(request, "shortlinks/log.html", {"log_data": log_data})
+    return render(
+        request,
+        "shortlinks/log.html",
+        {
+            "log_data": log_data,
+            "offset": offset,
+            "level": level,
+            "module": module,
+            "levels": LEVEL_NAMES,
+        },
+    )
 
 
 @login_required
@@ -110,6 +323,17 @@ def release_notes(request: HttpRequest) -> HttpResponse:
     return render(request, "shortlinks/release_notes.html")
 
 
+# This view does not require login, as it is read by Prometheus; it is limited
+# to METRICS_ALLOWED_NETWORKS instead.
+def show_metrics(request: HttpRequest) -> HttpResponse:
+    """Return metrics for all worker processes, in Prometheus text format."""
+    if not is_allowed_client(request.META.get("REMOTE_ADDR", "")):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.collect(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # This view does not require login, as it handles anonymous redirects.
 def redirect_link(request: HttpRequest) -> HttpResponse:
     """Get target URL matching short link (if any).
@@ -122,15 +346,43 @@ def redirect_link(request: HttpRequest) -> HttpResponse:
     short_path = format_short_path(requested_path)
 
     # Let target site handle 404s, since web editors manage these links.
-    link = get_object_or_404(Link, short_path=short_path)
+    resolved = resolve_short_path(short_path)
+    if resolved is None:
+        metrics.inc("redirects_total", {"outcome": "not_found"})
+        raise Http404(f"No link matches {short_path}")
+    metrics.inc("redirects_total", {"outcome": "found"})
 
     # If we get here, the link was found.
-    response = HttpResponseRedirect(link.target_url)
+    response = get_redirect_response(resolved)
 
     # Capture usage statistics
-    capture_usage_stats(link, request)
+    capture_usage_stats(resolved.link_id, request)
 
     # Add a referer (sic) HTTP header with the full URL of the short link.
     requested_short_url = get_short_link(short_path)
     response.headers["Referer"] = requested_short_url
     return response
+
+
+# Async version of redirect_link, used when running under ASGI.
+async def aredirect_link(request: HttpRequest) -> HttpResponse:
+    """Get target URL matching short link (if any), without blocking
+    the event loop while waiting on the database.
+    # Raise HTTP 404 if not found.
+    """
+    requested_path = request.META.get("PATH_INFO", "")
+    query_string = request.META.get("QUERY_STRING", "")
+    if query_string != "":
+        requested_path = f"{requested_path}?{query_string}"
+    short_path = format_short_path(requested_path)
+
+    resolved = await aresolve_short_path(short_path)
+    if resolved is None:
+        metrics.inc("redirects_total", {"outcome": "not_found"})
+        raise Http404(f"No link matches {short_path}")
+    metrics.inc("redirects_total", {"outcome": "found"})
+
+    response = get_redirect_response(resolved)
+    await acapture_usage(resolved.link_id, request.META)
+    response.headers["Referer"] = get_short_link(short_path)
+    return response
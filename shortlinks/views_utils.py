@@ -1,10 +1,23 @@
 import logging
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser  # for type hints
 from django.db.models import CharField, QuerySet, Value
 from django.db.models.functions import Concat
-from django.http import HttpRequest
-from shortlinks.models import Link, UsageStat
+from django.http import HttpRequest, HttpResponseRedirect
+from django.utils import timezone
+from shortlinks.dimensions import create_usage_stats
+from shortlinks.link_cache import (
+    RESOLVED_LINK_FIELDS,
+    ResolvedLink,
+    link_cache,
+    miss_cache,
+)
+from shortlinks.metrics import metrics
+from shortlinks.models import Link
+from shortlinks.prefix_matcher import prefix_links
+from shortlinks.snapshot import snapshot_manager
+from shortlinks.usage_writer import usage_writer
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +46,10 @@ def get_links(owner: AbstractBaseUser = None) -> QuerySet:
     # so the template doesn't have to assemble this.
     links = links.annotate(
         short_link=Concat(Value(link_prefix), "short_path", output_field=CharField())
-    ).order_by("-create_date")
+    ).order_by("-create_date", "-id")
+    # Include each creator, shown in the list, and the latest target URL
+    # check, if any, to flag broken targets, rather than a query per link.
+    links = links.select_related("created_by", "target_check")
     return links
 
 
@@ -45,12 +61,159 @@ def get_short_link(short_path: str) -> str:
     return settings.LINK_PREFIX + short_path
 
 
-def capture_usage_stats(link: Link, request: HttpRequest) -> None:
-    """Capture selected request info for a link."""
-    UsageStat.objects.create(
-        link=link,
-        client_ip=request.META.get("REMOTE_ADDR", ""),
-        query_string=request.META.get("QUERY_STRING", ""),
-        referrer=request.headers.get("referer", ""),
-        user_agent=request.headers.get("user-agent", ""),
+def lookup_in_memory(short_path: str) -> tuple[bool, ResolvedLink | None]:
+    """Look up short_path without querying the database.
+    Returns (known, resolved): known is False if the database must be checked;
+    otherwise resolved is the matching link, or None if there is none.
+
+    The link snapshot, if available and current (see SnapshotManager), knows
+    every link; its Bloom filter turns most unknown paths away without
+    searching it.  Otherwise, or while this process waits for a new snapshot
+    after changing a link, the link cache and the cache of recent misses are
+    used.  Exact matches take precedence over prefix links.
+    Lookups turned away without the database are counted in metrics.
+    """
+    snapshot = snapshot_manager.get_snapshot()
+    if snapshot is not None:
+        if snapshot.might_contain(short_path):
+            source = "snapshot"
+            resolved = snapshot.lookup(short_path)
+        else:
+            source = "bloom_filter"
+            resolved = None
+        if resolved is None:
+            resolved = prefix_links.for_snapshot(snapshot).resolve(short_path)
+        if resolved is not None:
+            return True, resolved
+        if snapshot_manager.is_current(snapshot):
+            metrics.inc("negative_lookups_total", {"source": source})
+            return True, None
+    resolved = link_cache.get(short_path)
+    if resolved is not None:
+        return True, resolved
+    if miss_cache.get(short_path):
+        metrics.inc("negative_lookups_total", {"source": "miss_cache"})
+        return True, None
+    return False, None
+
+
+def resolve_short_path(short_path: str) -> ResolvedLink | None:
+    """Return the target URL and id of the link matching short_path,
+    or None if there is no such link.
+    Uses the link snapshot or caches, so most lookups need no database query.
+    """
+    known, resolved = lookup_in_memory(short_path)
+    if known:
+        return resolved
+    return load_short_path(short_path)
+
+
+def load_short_path(short_path: str) -> ResolvedLink | None:
+    """Look up short_path in the database (not the cache), then in prefix links,
+    caching the result.
+    """
+    row = (
+        Link.objects.filter(short_path=short_path)
+        .values_list(*RESOLVED_LINK_FIELDS)
+        .first()
     )
+    if row is not None:
+        return cache_lookup(short_path, ResolvedLink(*row))
+    return cache_lookup(short_path, prefix_links.get().resolve(short_path))
+
+
+async def aresolve_short_path(short_path: str) -> ResolvedLink | None:
+    """Async version of resolve_short_path()."""
+    known, resolved = lookup_in_memory(short_path)
+    if known:
+        return resolved
+    return await aload_short_path(short_path)
+
+
+async def aload_short_path(short_path: str) -> ResolvedLink | None:
+    """Async version of load_short_path()."""
+    row = (
+        await Link.objects.filter(short_path=short_path)
+        .values_list(*RESOLVED_LINK_FIELDS)
+        .afirst()
+    )
+    if row is not None:
+        return cache_lookup(short_path, ResolvedLink(*row))
+    matcher = await prefix_links.aget()
+    return cache_lookup(short_path, matcher.resolve(short_path))
+
+
+def cache_lookup(short_path: str, resolved: ResolvedLink | None) -> ResolvedLink | None:
+    """Cache and return the result of looking up short_path:
+    None if there was no match.
+    """
+    if resolved is None:
+        miss_cache.set(short_path, True)
+    else:
+        link_cache.set(short_path, resolved)
+    return resolved
+
+
+def get_cache_control(resolved: ResolvedLink) -> str | None:
+    """Return the Cache-Control header for a redirect to resolved,
+    or None to send none.
+    """
+    if resolved.cache_max_age is None:
+        return None
+    if resolved.cache_max_age == 0:
+        return "no-store"
+    # public, so shared caches (e.g., the ingress) may cache it too.
+    return f"public, max-age={resolved.cache_max_age}"
+
+
+def get_redirect_response(resolved: ResolvedLink) -> HttpResponseRedirect:
+    """Return a redirect to resolved, with its link's status and caching policy."""
+    response = HttpResponseRedirect(resolved.target_url)
+    response.status_code = resolved.redirect_type
+    cache_control = get_cache_control(resolved)
+    if cache_control:
+        response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def capture_usage_stats(link_id: int, request: HttpRequest) -> None:
+    """Capture selected request info for a link."""
+    capture_usage(link_id, request.META)
+
+
+def get_usage_record(link_id: int, meta: dict) -> dict:
+    """Return UsageStat field values for a use of a link, from a WSGI environ
+    or request.META, with referrer and user agent as strings
+    (see shortlinks.dimensions.build_usage_stats()).
+    """
+    return {
+        "link_id": link_id,
+        "client_ip": meta.get("REMOTE_ADDR", ""),
+        "query_string": meta.get("QUERY_STRING", ""),
+        "referrer": meta.get("HTTP_REFERER", ""),
+        "user_agent": meta.get("HTTP_USER_AGENT", ""),
+        "usage_date": timezone.now(),
+    }
+
+
+def capture_usage(link_id: int, meta: dict) -> None:
+    """Capture selected request info for a link, from a WSGI environ
+    or request.META.
+    If USAGE_STATS_BUFFERED, the info is queued and written later in a batch,
+    so the redirect does not wait on the database.
+    """
+    record = get_usage_record(link_id, meta)
+    if settings.USAGE_STATS_BUFFERED:
+        usage_writer.submit(record)
+    else:
+        create_usage_stats([record])
+
+
+async def acapture_usage(link_id: int, meta: dict) -> None:
+    """Async version of capture_usage()."""
+    record = get_usage_record(link_id, meta)
+    if settings.USAGE_STATS_BUFFERED:
+        # Never blocks, so no need to leave the event loop.
+        usage_writer.submit(record)
+    else:
+        await sync_to_async(create_usage_stats)([record])
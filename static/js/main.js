@@ -1,4 +1,103 @@
 // Used in show_links.html to confirm link deletion
 function confirmDelete(event) {
     return confirm('Delete this link?');
-}
\ No newline at end of file
+}
+
+// Used in log.html to append new log lines while "Follow" is checked.
+function pollLog() {
+    const logData = document.getElementById('log-data');
+    const follow = document.getElementById('follow-log');
+    if (!logData || !follow) {
+        return;
+    }
+    setInterval(async () => {
+        if (!follow.checked) {
+            return;
+        }
+        const params = new URLSearchParams(window.location.search);
+        params.set('since', logData.dataset.offset);
+        const response = await fetch(`${window.location.pathname}?${params}`);
+        if (response.ok) {
+            const data = await response.json();
+            logData.append(data.lines);
+            logData.dataset.offset = data.offset;
+        }
+    }, 5000);
+}
+document.addEventListener('DOMContentLoaded', pollLog);
+
+// Call fn with the latest arguments once calls have stopped for wait ms.
+function debounce(fn, wait) {
+    let timer;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), wait);
+    };
+}
+
+// Used in show_links.html to suggest links while typing a search.
+function setupLinkSearch() {
+    const input = document.getElementById('link-search');
+    const suggestions = document.getElementById('link-search-suggestions');
+    if (!input || !suggestions) {
+        return;
+    }
+    input.addEventListener('input', debounce(async () => {
+        const query = input.value.trim();
+        if (!query) {
+            suggestions.replaceChildren();
+            return;
+        }
+        const response = await fetch(`${input.dataset.url}?${new URLSearchParams({q: query})}`);
+        if (response.ok && input.value.trim() === query) {
+            const data = await response.json();
+            suggestions.replaceChildren(...data.results.map((link) => {
+                const option = document.createElement('option');
+                option.value = link.short_path;
+                option.label = `${link.target_url} (${link.created_by})`;
+                return option;
+            }));
+        }
+    }, 150));
+}
+document.addEventListener('DOMContentLoaded', setupLinkSearch);
+
+// Used in add_link.html to say whether a short path is taken before submitting.
+function setupShortPathCheck() {
+    const form = document.getElementById('add_link');
+    const input = document.getElementById('id_short_path');
+    const status = document.getElementById('short-path-status');
+    if (!form || !input || !status) {
+        return;
+    }
+    input.addEventListener('input', debounce(async () => {
+        const shortPath = input.value.trim();
+        if (!shortPath) {
+            status.textContent = '';
+            return;
+        }
+        const params = new URLSearchParams({short_path: shortPath});
+        const response = await fetch(`${form.dataset.checkUrl}?${params}`);
+        if (response.ok && input.value.trim() === shortPath) {
+            const data = await response.json();
+            if (data.error) {
+                status.textContent = data.error;
+            } else if (data.taken) {
+                status.textContent = `Short path ${data.short_path} is already taken.`;
+            } else {
+                status.textContent = `Short path ${data.short_path} is available.`;
+            }
+            status.classList.toggle('unavailable', Boolean(data.error || data.taken));
+        }
+    }, 200));
+}
+document.addEventListener('DOMContentLoaded', setupShortPathCheck);
+
+// Used in link_deletions.html to refresh progress while deletions are unfinished.
+function refreshLinkDeletions() {
+    const table = document.getElementById('link-deletions');
+    if (table && table.dataset.inProgress === 'true') {
+        setTimeout(() => window.location.reload(), 5000);
+    }
+}
+document.addEventListener('DOMContentLoaded', refreshLinkDeletions);